@@ -0,0 +1,6 @@
+// Unit tests never connect to a database, but config.ts requires these
+process.env.DB_PRIMARY_HOST = process.env.DB_PRIMARY_HOST || 'localhost';
+process.env.DB_NAME = process.env.DB_NAME || 'postgres';
+process.env.DB_USERNAME = process.env.DB_USERNAME || 'postgres';
+process.env.DB_PASSWORD = process.env.DB_PASSWORD || 'password';
+process.env.LOG_LEVEL = process.env.LOG_LEVEL || 'error';
@@ -1,15 +1,23 @@
 import express, { Application, Request, Response, NextFunction } from 'express';
+import { Server } from 'http';
 import cors from 'cors';
 import helmet from 'helmet';
-import compression from 'compression';
 import { config } from './config';
 import { logger } from './logger';
 import { dbManager } from './database';
+import { withDeadline, shedLoad, Deadline } from './deadline';
+import { compress } from './compress';
+import { TransactionConflictError } from './transaction';
+import { ALL_EVENTS, outboxWorker, webhookHandler } from './outbox';
+import { userPurger } from './purger';
 import { UserController } from './user.controller';
+import { createGeneratedRouter } from './generated';
 
 class App {
   private app: Application;
+  private server?: Server;
   private userController: UserController;
+  private shuttingDown = false;
 
   constructor() {
     this.app = express();
@@ -29,9 +37,6 @@ class App {
       credentials: true
     }));
 
-    // Compression middleware
-    this.app.use(compression());
-
     // Body parsing middleware
     this.app.use(express.json({ limit: '10mb' }));
     this.app.use(express.urlencoded({ extended: true, limit: '10mb' }));
@@ -66,18 +71,46 @@ class App {
       }
     });
 
+    // Connection pool sizing and queue depth
+    this.app.get('/health/pools', (req: Request, res: Response) => {
+      res.json({
+        timestamp: new Date().toISOString(),
+        adaptive: config.database.pool.adaptive.enabled,
+        pools: dbManager.getPoolStats()
+      });
+    });
+
     // API routes
     const apiRouter = express.Router();
 
+    // Per-route deadlines bound query time; overload is shed before any work starts
+    const read = [
+      shedLoad(() => dbManager.isOverloaded('replica')),
+      withDeadline(config.app.deadlines.read)
+    ];
+    const write = [
+      shedLoad(() => dbManager.isOverloaded('primary')),
+      withDeadline(config.app.deadlines.write)
+    ];
+
+    // Compression is per route: list pages are large and repeat, so their
+    // compressed bodies are cached by content; single users mostly fall under
+    // the size threshold and go out as is
+    const compressList = compress({ cache: true });
+    const compressItem = compress();
+
     // User routes
-    apiRouter.post('/users', this.userController.createUser);
-    apiRouter.get('/users', this.userController.getUsers);
-    apiRouter.get('/users/:id', this.userController.getUserById);
-    apiRouter.put('/users/:id', this.userController.updateUser);
-    apiRouter.delete('/users/:id', this.userController.deleteUser);
+    apiRouter.post('/users', ...write, compressItem, this.userController.createUser);
+    apiRouter.get('/users', ...read, compressList, this.userController.getUsers);
+    apiRouter.get('/users/:id', ...read, compressItem, this.userController.getUserById);
+    apiRouter.put('/users/:id', ...write, compressItem, this.userController.updateUser);
+    apiRouter.delete('/users/:id', ...write, this.userController.deleteUser);
 
     this.app.use('/api', apiRouter);
 
+    // Generated from codegen/model.json: cursor-paginated v2 resources
+    this.app.use('/api/v2', compressItem, createGeneratedRouter(read, write));
+
     // Root endpoint
     this.app.get('/', (req: Request, res: Response) => {
       res.json({
@@ -100,6 +133,28 @@ class App {
   private initializeErrorHandling(): void {
     // Global error handler
     this.app.use((error: Error, req: Request, res: Response, next: NextFunction) => {
+      const deadline: Deadline | undefined = res.locals.deadline;
+      if (deadline?.expired) {
+        if (deadline.timedOut && !res.headersSent) {
+          logger.warn(`Deadline exceeded for ${req.method} ${req.originalUrl}`);
+          res.status(504).json({
+            success: false,
+            message: 'Request timed out'
+          });
+        }
+        return;
+      }
+
+      if (error instanceof TransactionConflictError) {
+        logger.warn(`Transaction contention on ${req.method} ${req.originalUrl}: ${error.message}`);
+        res.set('Retry-After', '1');
+        res.status(503).json({
+          success: false,
+          message: 'Too much contention, please retry'
+        });
+        return;
+      }
+
       logger.error('Unhandled error:', error);
 
       // Don't leak error details in production
@@ -139,9 +194,23 @@ class App {
   }
 
   private async gracefulShutdown(): Promise<void> {
+    if (this.shuttingDown) {
+      return;
+    }
+    this.shuttingDown = true;
+
     logger.info('Starting graceful shutdown...');
 
+    // Force exit if in-flight requests do not drain in time
+    setTimeout(() => {
+      logger.error('Graceful shutdown timed out, forcing exit');
+      process.exit(1);
+    }, config.app.shutdownTimeout).unref();
+
     try {
+      // Stop accepting new connections and let in-flight requests finish
+      await this.closeServer();
+      await Promise.all([outboxWorker.stop(), userPurger.stop()]);
       await dbManager.gracefulShutdown();
       logger.info('Graceful shutdown completed');
       process.exit(0);
@@ -151,6 +220,18 @@ class App {
     }
   }
 
+  private closeServer(): Promise<void> {
+    return new Promise((resolve, reject) => {
+      if (!this.server) {
+        resolve();
+        return;
+      }
+
+      this.server.close((error) => (error ? reject(error) : resolve()));
+      this.server.closeIdleConnections();
+    });
+  }
+
   public async start(): Promise<void> {
     try {
       // Test database connections before starting server
@@ -160,11 +241,28 @@ class App {
       }
 
       // Start server
-      this.app.listen(config.app.port, () => {
+      this.server = this.app.listen(config.app.port, () => {
         logger.info(`Server started on port ${config.app.port}`);
         logger.info(`Environment: ${config.app.env}`);
         logger.info(`Health check: http://localhost:${config.app.port}/health`);
       });
+
+      // Every process drains the outbox; SKIP LOCKED keeps them off each other's rows
+      if (config.outbox.enabled) {
+        if (config.outbox.webhookUrl) {
+          outboxWorker.on(ALL_EVENTS, webhookHandler(config.outbox.webhookUrl, config.outbox.webhookTimeout));
+        }
+        // With no handler the worker would only delete events; leave them for one
+        if (outboxWorker.hasHandlers) {
+          outboxWorker.start();
+        } else {
+          logger.warn('Outbox enabled but no handler registered (OUTBOX_WEBHOOK_URL); events are kept undelivered');
+        }
+      }
+      // Only one process purges at a time (advisory lock), the rest find it taken
+      if (config.softDelete.purge.enabled) {
+        userPurger.start();
+      }
     } catch (error) {
       logger.error('Failed to start server:', error);
       process.exit(1);
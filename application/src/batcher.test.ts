@@ -0,0 +1,82 @@
+import { MicroBatcher } from './batcher';
+
+describe('MicroBatcher', () => {
+  beforeEach(() => {
+    jest.useFakeTimers();
+  });
+
+  afterEach(() => {
+    jest.useRealTimers();
+  });
+
+  it('flushes as soon as maxSize items are pending', async () => {
+    const flush = jest.fn(async (items: number[]) => items.map((n) => n * 10));
+    const batcher = new MicroBatcher(flush, 3, 1000);
+
+    const results = Promise.all([1, 2, 3].map((n) => batcher.submit(n)));
+
+    expect(flush).toHaveBeenCalledTimes(1);
+    expect(flush).toHaveBeenCalledWith([1, 2, 3]);
+    await expect(results).resolves.toEqual([10, 20, 30]);
+  });
+
+  it('flushes a partial batch once maxWaitMs passes', async () => {
+    const flush = jest.fn(async (items: number[]) => items.map((n) => n * 10));
+    const batcher = new MicroBatcher(flush, 10, 5);
+
+    const results = Promise.all([batcher.submit(1), batcher.submit(2)]);
+    jest.advanceTimersByTime(4);
+    expect(flush).not.toHaveBeenCalled();
+
+    jest.advanceTimersByTime(1);
+    expect(flush).toHaveBeenCalledWith([1, 2]);
+    await expect(results).resolves.toEqual([10, 20]);
+  });
+
+  it('starts a new batch after a size flush', async () => {
+    const flush = jest.fn(async (items: number[]) => items);
+    const batcher = new MicroBatcher(flush, 2, 5);
+
+    const first = Promise.all([batcher.submit(1), batcher.submit(2)]);
+    const second = batcher.submit(3);
+    jest.advanceTimersByTime(5);
+
+    expect(flush.mock.calls).toEqual([[[1, 2]], [[3]]]);
+    await expect(first).resolves.toEqual([1, 2]);
+    await expect(second).resolves.toBe(3);
+  });
+
+  it('rejects only the items flush returned an Error for', async () => {
+    const error = new Error('duplicate email');
+    const batcher = new MicroBatcher(async (items: number[]) => items.map((n) => (n === 2 ? error : n)), 3, 5);
+
+    const settled = Promise.allSettled([1, 2, 3].map((n) => batcher.submit(n)));
+
+    await expect(settled).resolves.toEqual([
+      { status: 'fulfilled', value: 1 },
+      { status: 'rejected', reason: error },
+      { status: 'fulfilled', value: 3 }
+    ]);
+  });
+
+  it('rejects items flush returned no result for', async () => {
+    const batcher = new MicroBatcher(async (items: number[]) => items.slice(0, 1), 2, 5);
+
+    const [first, second] = await Promise.allSettled([batcher.submit(1), batcher.submit(2)]);
+
+    expect(first).toEqual({ status: 'fulfilled', value: 1 });
+    expect(second).toEqual({ status: 'rejected', reason: new Error('Batch returned no result for item') });
+  });
+
+  it('rejects every item when flush throws', async () => {
+    const error = new Error('connection terminated');
+    const batcher = new MicroBatcher(async (): Promise<number[]> => { throw error; }, 2, 5);
+
+    const settled = await Promise.allSettled([batcher.submit(1), batcher.submit(2)]);
+
+    expect(settled).toEqual([
+      { status: 'rejected', reason: error },
+      { status: 'rejected', reason: error }
+    ]);
+  });
+});
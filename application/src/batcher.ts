@@ -0,0 +1,67 @@
+import { withoutDeadline } from './deadline';
+
+interface PendingItem<TIn, TOut> {
+  item: TIn;
+  resolve: (value: TOut) => void;
+  reject: (error: Error) => void;
+}
+
+/**
+ * Gathers items submitted within maxWaitMs (or until maxSize arrive) and hands
+ * them to flush as one batch. flush returns one entry per item, in order: a
+ * result, or an Error for that item alone. If flush itself throws, every item
+ * in the batch fails with that error.
+ */
+export class MicroBatcher<TIn, TOut> {
+  private pending: PendingItem<TIn, TOut>[] = [];
+  private timer?: NodeJS.Timeout;
+
+  constructor(
+    private flush: (items: TIn[]) => Promise<Array<TOut | Error>>,
+    private maxSize: number,
+    private maxWaitMs: number
+  ) {}
+
+  public submit(item: TIn): Promise<TOut> {
+    return new Promise<TOut>((resolve, reject) => {
+      this.pending.push({ item, resolve, reject });
+
+      if (this.pending.length >= this.maxSize) {
+        this.drain();
+      } else if (!this.timer) {
+        // The batch is shared, so it must not run under one request's deadline
+        this.timer = withoutDeadline(() => setTimeout(() => this.drain(), this.maxWaitMs));
+      }
+    });
+  }
+
+  private drain(): void {
+    if (this.timer) {
+      clearTimeout(this.timer);
+      this.timer = undefined;
+    }
+
+    const batch = this.pending;
+    this.pending = [];
+    if (batch.length === 0) {
+      return;
+    }
+
+    withoutDeadline(() => this.flush(batch.map((entry) => entry.item)))
+      .then((results) => {
+        batch.forEach((entry, i) => {
+          const result = results[i];
+          if (result instanceof Error) {
+            entry.reject(result);
+          } else if (result === undefined) {
+            entry.reject(new Error('Batch returned no result for item'));
+          } else {
+            entry.resolve(result);
+          }
+        });
+      })
+      .catch((error: Error) => {
+        batch.forEach((entry) => entry.reject(error));
+      });
+  }
+}
@@ -0,0 +1,185 @@
+import cluster, { Worker } from 'cluster';
+import { clusterPoolShares, config } from './config';
+import { logger } from './logger';
+
+class ClusterManager {
+  private workerCount: number;
+  private shuttingDown = false;
+  private restarting = false;
+  private retiring = new Set<number>();
+  private crashes: number[] = [];
+
+  constructor(workerCount: number) {
+    this.workerCount = Math.max(1, workerCount);
+  }
+
+  public start(): void {
+    logger.info(`Primary ${process.pid} starting ${this.workerCount} workers`);
+
+    // Workers, plus the one a rolling restart adds, must fit the pool budget
+    // with at least one connection each; otherwise the cluster would open more
+    // connections than the budget allows
+    const { pool } = config.database;
+    const shares = clusterPoolShares(this.workerCount);
+    const budget = Math.min(pool.max, pool.primary.max, pool.replica.max);
+    if (budget < shares) {
+      logger.error(`Pool budget ${budget} cannot cover ${this.workerCount} workers and a restart ` +
+        `replacement; lower CLUSTER_WORKERS to at most ${budget - 1} or raise the pool max`);
+      process.exit(1);
+    }
+    logger.info(`Database pool max ${pool.max} split to ${Math.floor(pool.max / shares)} per worker ` +
+      `(${shares} shares, one reserved for rolling restarts)`);
+
+    for (let i = 0; i < this.workerCount; i++) {
+      this.fork();
+    }
+
+    cluster.on('exit', (worker, code, signal) => {
+      if (this.retiring.delete(worker.id) || this.shuttingDown) {
+        return;
+      }
+
+      this.respawn(worker, signal || code);
+    });
+
+    process.on('SIGHUP', () => {
+      logger.info('SIGHUP received, starting rolling restart');
+      this.rollingRestart().catch((error) => {
+        logger.error('Rolling restart failed:', error);
+      });
+    });
+
+    process.on('SIGTERM', () => this.shutdown('SIGTERM'));
+    process.on('SIGINT', () => this.shutdown('SIGINT'));
+  }
+
+  /**
+   * Replace a crashed worker after a delay that doubles with each crash in
+   * the restart window, so a worker failing at boot does not fork in a
+   * tight loop; too many crashes in the window stop the cluster instead
+   */
+  private respawn(worker: Worker, reason: string | number): void {
+    const { restartDelay, restartMaxDelay, maxRestarts, restartWindow } = config.cluster;
+    const now = Date.now();
+    this.crashes = [...this.crashes.filter((at) => now - at < restartWindow), now];
+
+    if (this.crashes.length > maxRestarts) {
+      logger.error(`Worker ${worker.process.pid} died (${reason}); ${this.crashes.length} crashes ` +
+        `within ${restartWindow}ms, giving up`);
+      this.shutdown('crash loop', 1);
+      return;
+    }
+
+    const delay = Math.min(restartMaxDelay, restartDelay * 2 ** (this.crashes.length - 1));
+    logger.error(`Worker ${worker.process.pid} died (${reason}), restarting in ${delay}ms`);
+    setTimeout(() => {
+      if (!this.shuttingDown) {
+        this.fork();
+      }
+    }, delay);
+  }
+
+  private fork(): Worker {
+    // Workers split the pool budget into clusterPoolShares(count) (see config.ts)
+    return cluster.fork({ CLUSTER_WORKER_COUNT: String(this.workerCount) });
+  }
+
+  /**
+   * Replace workers one at a time. Each replacement must be listening before
+   * the worker it replaces is asked to drain, so capacity never drops below
+   * workerCount and at most one extra pool share is open at any moment.
+   */
+  private async rollingRestart(): Promise<void> {
+    if (this.restarting) {
+      logger.warn('Rolling restart already in progress');
+      return;
+    }
+    this.restarting = true;
+
+    try {
+      const current = Object.values(cluster.workers || {}).filter((w): w is Worker => !!w);
+
+      for (const oldWorker of current) {
+        if (this.shuttingDown) {
+          break;
+        }
+
+        const replacement = this.fork();
+        await this.waitFor(replacement, 'listening');
+
+        logger.info(`Worker ${replacement.process.pid} listening, retiring ${oldWorker.process.pid}`);
+        await this.retire(oldWorker);
+      }
+
+      logger.info('Rolling restart completed');
+    } finally {
+      this.restarting = false;
+    }
+  }
+
+  private async retire(worker: Worker): Promise<void> {
+    // An exited worker emits no further 'exit' to wait for
+    if (worker.isDead()) {
+      return;
+    }
+
+    this.retiring.add(worker.id);
+    const exited = this.waitFor(worker, 'exit');
+    // SIGTERM runs the worker's own graceful shutdown (drain HTTP, close pools);
+    // one stuck past killTimeout is killed outright
+    worker.process.kill('SIGTERM');
+    const kill = setTimeout(() => {
+      logger.warn(`Worker ${worker.process.pid} still running after ${config.cluster.killTimeout}ms, sending SIGKILL`);
+      worker.process.kill('SIGKILL');
+    }, config.cluster.killTimeout);
+
+    try {
+      await exited;
+    } finally {
+      clearTimeout(kill);
+    }
+  }
+
+  private waitFor(worker: Worker, event: 'listening' | 'exit'): Promise<void> {
+    return new Promise((resolve, reject) => {
+      const onExit = () => {
+        if (event === 'exit') {
+          resolve();
+        } else {
+          reject(new Error(`Worker ${worker.process.pid} exited before listening`));
+        }
+      };
+
+      worker.once('exit', onExit);
+      if (event === 'listening') {
+        worker.once('listening', () => {
+          worker.removeListener('exit', onExit);
+          resolve();
+        });
+      }
+    });
+  }
+
+  private async shutdown(signal: string, exitCode = 0): Promise<void> {
+    if (this.shuttingDown) {
+      return;
+    }
+    this.shuttingDown = true;
+
+    logger.info(`Stopping workers (${signal})`);
+    const workers = Object.values(cluster.workers || {}).filter((w): w is Worker => !!w);
+    await Promise.all(workers.map((worker) => this.retire(worker)));
+
+    logger.info('All workers stopped');
+    process.exit(exitCode);
+  }
+}
+
+if (cluster.isPrimary) {
+  new ClusterManager(config.cluster.workers).start();
+} else {
+  import('./app').catch((error) => {
+    logger.error('Worker startup failed:', error);
+    process.exit(1);
+  });
+}
@@ -0,0 +1,179 @@
+import express, { RequestHandler } from 'express';
+import http from 'http';
+import { AddressInfo } from 'net';
+import zlib from 'zlib';
+import { compress } from './compress';
+
+interface Reply {
+  headers: http.IncomingHttpHeaders;
+  body: Buffer;
+}
+
+const serve = async (middleware: RequestHandler, handler: RequestHandler) => {
+  const app = express();
+  app.get('/', middleware, handler);
+  const server = app.listen(0);
+  await new Promise((resolve) => server.once('listening', resolve));
+  const { port } = server.address() as AddressInfo;
+
+  const get = (acceptEncoding?: string): Promise<Reply> => new Promise((resolve, reject) => {
+    const headers = acceptEncoding === undefined ? {} : { 'Accept-Encoding': acceptEncoding };
+    http.get({ port, path: '/', headers }, (res) => {
+      const chunks: Buffer[] = [];
+      res.on('data', (chunk: Buffer) => chunks.push(chunk));
+      res.on('end', () => resolve({ headers: res.headers, body: Buffer.concat(chunks) }));
+    }).on('error', reject);
+  });
+
+  return { get, close: () => new Promise((resolve) => server.close(resolve)) };
+};
+
+const decode = ({ headers, body }: Reply): string => {
+  switch (headers['content-encoding']) {
+    case 'br': return zlib.brotliDecompressSync(body).toString();
+    case 'gzip': return zlib.gunzipSync(body).toString();
+    default: return body.toString();
+  }
+};
+
+const payload = (tag: string) => ({ tag, items: Array.from({ length: 200 }, (_, i) => ({ id: i, name: `item ${i}` })) });
+
+describe('compress', () => {
+  const servers: Array<{ close: () => Promise<unknown> }> = [];
+  const start = async (middleware: RequestHandler, handler: RequestHandler) => {
+    const server = await serve(middleware, handler);
+    servers.push(server);
+    return server;
+  };
+
+  afterEach(async () => {
+    jest.restoreAllMocks();
+    await Promise.all(servers.splice(0).map((server) => server.close()));
+  });
+
+  describe('Accept-Encoding negotiation', () => {
+    const body = payload('negotiation');
+    let get: (acceptEncoding?: string) => Promise<Reply>;
+
+    beforeEach(async () => {
+      ({ get } = await start(compress({ threshold: 100 }), (req, res) => { res.json(body); }));
+    });
+
+    it.each([
+      ['br, gzip', 'br'],
+      ['gzip, br', 'br'],
+      ['gzip', 'gzip'],
+      ['br;q=0.5, gzip;q=1', 'gzip'],
+      ['br;q=0, gzip', 'gzip'],
+      ['gzip;q=0.1, br;q=0.9', 'br'],
+      ['deflate, gzip;q=0.2', 'gzip']
+    ])('picks the preferred encoding for %s', async (acceptEncoding, expected) => {
+      const reply = await get(acceptEncoding);
+
+      expect(reply.headers['content-encoding']).toBe(expected);
+      expect(reply.headers.vary).toMatch(/Accept-Encoding/);
+      expect(JSON.parse(decode(reply))).toEqual(body);
+    });
+
+    it.each([
+      'identity',
+      'deflate',
+      'gzip;q=0, br;q=0',
+      'identity, gzip;q=0, br;q=0'
+    ])('sends the body uncompressed for %s', async (acceptEncoding) => {
+      const reply = await get(acceptEncoding);
+
+      expect(reply.headers['content-encoding']).toBeUndefined();
+      expect(reply.headers.vary).toMatch(/Accept-Encoding/);
+      expect(JSON.parse(reply.body.toString())).toEqual(body);
+    });
+  });
+
+  it('sends bodies under the threshold as is', async () => {
+    const { get } = await start(compress({ threshold: 1024 }), (req, res) => { res.json({ ok: true }); });
+
+    const reply = await get('br, gzip');
+
+    expect(reply.headers['content-encoding']).toBeUndefined();
+    expect(JSON.parse(reply.body.toString())).toEqual({ ok: true });
+  });
+
+  it('leaves types that are not compressible alone', async () => {
+    const image = Buffer.alloc(4096, 1);
+    const { get } = await start(compress({ threshold: 100 }), (req, res) => {
+      res.type('image/png').send(image);
+    });
+
+    const reply = await get('br, gzip');
+
+    expect(reply.headers['content-encoding']).toBeUndefined();
+    expect(reply.body.equals(image)).toBe(true);
+  });
+
+  it('compresses streamed bodies', async () => {
+    const { get } = await start(compress({ threshold: 100 }), (req, res) => {
+      res.type('application/json');
+      res.write('[');
+      for (let i = 0; i < 100; i++) {
+        res.write(`${i ? ',' : ''}{"id":${i}}`);
+      }
+      res.end(']');
+    });
+
+    const reply = await get('gzip');
+
+    expect(reply.headers['content-encoding']).toBe('gzip');
+    expect(JSON.parse(decode(reply))).toHaveLength(100);
+  });
+
+  it('runs the res.end callback once a compressed body is sent', async () => {
+    const finished = jest.fn();
+    const { get } = await start(compress({ threshold: 100 }), (req, res) => {
+      res.type('application/json').end(JSON.stringify(payload('callback')), finished);
+    });
+
+    const reply = await get('br');
+
+    expect(reply.headers['content-encoding']).toBe('br');
+    expect(finished).toHaveBeenCalledTimes(1);
+  });
+
+  describe('with cache on', () => {
+    it('compresses an identical body once', async () => {
+      const spy = jest.spyOn(zlib, 'brotliCompress');
+      const body = payload('cached');
+      const { get } = await start(compress({ threshold: 100, cache: true }), (req, res) => { res.json(body); });
+
+      const first = await get('br');
+      const second = await get('br');
+
+      expect(spy).toHaveBeenCalledTimes(1);
+      expect(second.body.equals(first.body)).toBe(true);
+      expect(JSON.parse(decode(second))).toEqual(body);
+    });
+
+    it('never serves a cached body for different content', async () => {
+      let n = 0;
+      const { get } = await start(compress({ threshold: 100, cache: true }), (req, res) => {
+        res.json(payload(`changing ${n++}`));
+      });
+
+      const first = await get('gzip');
+      const second = await get('gzip');
+
+      expect(JSON.parse(decode(first)).tag).toBe('changing 0');
+      expect(JSON.parse(decode(second)).tag).toBe('changing 1');
+    });
+
+    it('keys cached bodies by encoding', async () => {
+      const body = payload('per encoding');
+      const { get } = await start(compress({ threshold: 100, cache: true }), (req, res) => { res.json(body); });
+
+      await get('br');
+      const reply = await get('gzip');
+
+      expect(reply.headers['content-encoding']).toBe('gzip');
+      expect(JSON.parse(decode(reply))).toEqual(body);
+    });
+  });
+});
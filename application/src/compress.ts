@@ -0,0 +1,244 @@
+import { createHash } from 'crypto';
+import { NextFunction, Request, RequestHandler, Response } from 'express';
+import zlib from 'zlib';
+import { config } from './config';
+
+type Encoding = 'br' | 'gzip';
+
+export interface CompressionOptions {
+  // Bodies smaller than this many bytes are sent as is
+  threshold?: number;
+  gzipLevel?: number;
+  brotliQuality?: number;
+  // Keep compressed bodies keyed by a hash of the uncompressed body, to reuse
+  // for identical responses; bodies are then collected rather than streamed
+  cache?: boolean;
+}
+
+const COMPRESSIBLE = /^(?:text\/|application\/(?:json|javascript|xml))/i;
+
+/**
+ * Compressed bodies by encoding and SHA-256 of the uncompressed body, evicted
+ * least recently used once their total size passes maxBytes. The key is the
+ * content itself rather than the ETag, which need not change with every byte
+ * of the body, so a hit is always the right body.
+ */
+class CompressedBodies {
+  private entries = new Map<string, Buffer>();
+  private bytes = 0;
+
+  constructor(private maxBytes: number) {}
+
+  get(key: string): Buffer | undefined {
+    const body = this.entries.get(key);
+    if (body) {
+      // Re-insert so the Map's order stays least recently used first
+      this.entries.delete(key);
+      this.entries.set(key, body);
+    }
+    return body;
+  }
+
+  set(key: string, body: Buffer): void {
+    if (body.length > this.maxBytes / 8 || this.entries.has(key)) {
+      return;
+    }
+
+    this.entries.set(key, body);
+    this.bytes += body.length;
+    for (const [oldest, evicted] of this.entries) {
+      if (this.bytes <= this.maxBytes) {
+        break;
+      }
+      this.entries.delete(oldest);
+      this.bytes -= evicted.length;
+    }
+  }
+}
+
+const cache = new CompressedBodies(config.app.compression.cacheBytes);
+
+const brotliOptions = (quality: number): zlib.BrotliOptions => ({
+  params: { [zlib.constants.BROTLI_PARAM_QUALITY]: quality }
+});
+
+const toBuffer = (chunk: any, encoding?: BufferEncoding): Buffer =>
+  Buffer.isBuffer(chunk) ? chunk : Buffer.from(chunk, encoding);
+
+const contentKey = (encoding: Encoding, body: Buffer): string =>
+  `${encoding}:${createHash('sha256').update(body).digest('base64url')}`;
+
+/**
+ * Compresses one route's responses: Brotli when the client accepts it,
+ * otherwise gzip, at the given levels. Bodies sent in one piece (res.json,
+ * res.send) are compressed only past the threshold; streamed bodies, whose
+ * size is unknown up front, always are. With cache on, bodies are collected
+ * whole and hashed, and one identical to an earlier response reuses its
+ * compressed bytes instead of compressing again; hashing costs far less than
+ * compressing.
+ *
+ * Defaults come from config.app.compression; mount it per route so that
+ * small or latency-critical responses skip it.
+ */
+export const compress = (options: CompressionOptions = {}): RequestHandler => {
+  const defaults = config.app.compression;
+  const threshold = options.threshold ?? defaults.threshold;
+  const gzipLevel = options.gzipLevel ?? defaults.gzipLevel;
+  const brotliQuality = options.brotliQuality ?? defaults.brotliQuality;
+
+  return (req: Request, res: Response, next: NextFunction): void => {
+    const write = res.write.bind(res) as (...args: any[]) => boolean;
+    const end = res.end.bind(res) as (...args: any[]) => Response;
+    let decided = false;
+    let encoding: Encoding | null = null;
+    let stream: zlib.Gzip | zlib.BrotliCompress | null = null;
+    // With cache on, the uncompressed body as written so far
+    let collected: Buffer[] | null = null;
+    // The callback passed to res.end, for the real end once the body is ready
+    let onFinish: (() => void) | undefined;
+
+    // Called on the first write or end, once headers are final
+    const negotiate = (): void => {
+      decided = true;
+      const type = String(res.getHeader('Content-Type') ?? '');
+      if (!COMPRESSIBLE.test(type) || res.getHeader('Content-Encoding')) {
+        return;
+      }
+
+      res.vary('Accept-Encoding');
+      if (req.method === 'HEAD' || res.statusCode === 204 || res.statusCode === 304) {
+        return;
+      }
+
+      const accepted = req.acceptsEncodings('br', 'gzip');
+      encoding = accepted === 'br' || accepted === 'gzip' ? accepted : null;
+      if (encoding && options.cache) {
+        collected = [];
+      }
+    };
+
+    const sendCompressed = (body: Buffer): void => {
+      res.setHeader('Content-Encoding', encoding as Encoding);
+      res.setHeader('Content-Length', body.length);
+      end(body, onFinish);
+    };
+
+    /**
+     * Compress a whole body, or reuse the cached compression of the same
+     * bytes when cache is on
+     */
+    const compressWhole = (body: Buffer): void => {
+      const key = collected ? contentKey(encoding as Encoding, body) : null;
+      const cached = key ? cache.get(key) : undefined;
+      if (cached) {
+        sendCompressed(cached);
+        return;
+      }
+
+      const done = (error: Error | null, compressed: Buffer): void => {
+        if (error) {
+          // Compression failed; the uncompressed body is still correct
+          end(body, onFinish);
+          return;
+        }
+        if (key) {
+          cache.set(key, compressed);
+        }
+        sendCompressed(compressed);
+      };
+
+      if (encoding === 'br') {
+        zlib.brotliCompress(body, brotliOptions(brotliQuality), done);
+      } else {
+        zlib.gzip(body, { level: gzipLevel }, done);
+      }
+    };
+
+    const startStream = (): void => {
+      res.setHeader('Content-Encoding', encoding as Encoding);
+      res.removeHeader('Content-Length');
+
+      stream = encoding === 'br'
+        ? zlib.createBrotliCompress(brotliOptions(brotliQuality))
+        : zlib.createGzip({ level: gzipLevel });
+
+      stream.on('data', (chunk: Buffer) => {
+        if (!write(chunk)) {
+          stream?.pause();
+        }
+      });
+      stream.on('error', (error) => res.destroy(error));
+      stream.on('end', () => end(onFinish));
+      // Backpressure: the socket drains the compressor, which drains the caller
+      res.on('drain', () => stream?.resume());
+      stream.on('drain', () => res.emit('drain'));
+    };
+
+    res.write = function (chunk: any, enc?: any, cb?: any): boolean {
+      if (typeof enc === 'function') {
+        cb = enc;
+        enc = undefined;
+      }
+      if (!decided) {
+        negotiate();
+        if (encoding && !collected) {
+          startStream();
+        }
+      }
+
+      const chunkEncoding = typeof enc === 'string' ? (enc as BufferEncoding) : undefined;
+      if (collected) {
+        collected.push(toBuffer(chunk, chunkEncoding));
+        if (cb) {
+          process.nextTick(cb);
+        }
+        return true;
+      }
+      if (stream) {
+        return stream.write(toBuffer(chunk, chunkEncoding), cb);
+      }
+      return write(chunk, enc, cb);
+    } as Response['write'];
+
+    res.end = function (chunk?: any, enc?: any, cb?: any): Response {
+      if (typeof chunk === 'function') {
+        cb = chunk;
+        chunk = undefined;
+      } else if (typeof enc === 'function') {
+        cb = enc;
+        enc = undefined;
+      }
+      onFinish = cb;
+      const bodyEncoding = typeof enc === 'string' ? (enc as BufferEncoding) : undefined;
+
+      if (!decided) {
+        negotiate();
+        const body = chunk === undefined ? Buffer.alloc(0) : toBuffer(chunk, bodyEncoding);
+        if (!encoding || body.length < threshold) {
+          return end(chunk, enc, cb);
+        }
+
+        compressWhole(body);
+        return res;
+      }
+
+      if (collected) {
+        if (chunk !== undefined) {
+          collected.push(toBuffer(chunk, bodyEncoding));
+        }
+        compressWhole(Buffer.concat(collected));
+        return res;
+      }
+      if (stream) {
+        if (chunk !== undefined) {
+          stream.write(toBuffer(chunk, bodyEncoding));
+        }
+        stream.end();
+        return res;
+      }
+      return end(chunk, enc, cb);
+    } as Response['end'];
+
+    next();
+  };
+};
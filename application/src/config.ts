@@ -1,12 +1,134 @@
 import dotenv from 'dotenv';
+import os from 'os';
+import { join } from 'path';
+import { TypeParserMode } from './type-parsers';
+import { PoolerMode } from './pool';
 
 dotenv.config();
 
+/**
+ * Pool shares a cluster of this many workers splits the budget into: one per
+ * worker plus one for the replacement a rolling restart forks before it
+ * retires the worker it replaces
+ */
+export const clusterPoolShares = (workers: number): number => workers + 1;
+
+// In cluster mode each worker gets an equal share of the configured pool size,
+// so DB_POOL_MAX is the per-instance budget rather than a per-process one.
+const clusterWorkerCount = parseInt(process.env.CLUSTER_WORKER_COUNT || '1', 10);
+const poolShares = process.env.CLUSTER_WORKER_COUNT ? clusterPoolShares(clusterWorkerCount) : 1;
+
+// A share of zero connections cannot be rounded up without exceeding the budget
+const perWorker = (total: number, name: string): number => {
+  if (total < poolShares) {
+    throw new Error(`${name}=${total} is below the ${poolShares} pool shares of ${clusterWorkerCount} cluster workers`);
+  }
+  return Math.floor(total / poolShares);
+};
+
+const poolMax = perWorker(parseInt(process.env.DB_POOL_MAX || '20', 10), 'DB_POOL_MAX');
+const poolMin = Math.min(parseInt(process.env.DB_POOL_MIN || '2', 10), poolMax);
+
+// Per-role bounds fall back to the shared DB_POOL_MIN/DB_POOL_MAX settings
+const rolePoolLimits = (role: 'PRIMARY' | 'REPLICA') => {
+  const max = process.env[`DB_${role}_POOL_MAX`]
+    ? perWorker(parseInt(process.env[`DB_${role}_POOL_MAX`] as string, 10), `DB_${role}_POOL_MAX`)
+    : poolMax;
+  const min = process.env[`DB_${role}_POOL_MIN`]
+    ? parseInt(process.env[`DB_${role}_POOL_MIN`] as string, 10)
+    : poolMin;
+
+  return { min: Math.min(min, max), max };
+};
+
 export const config = {
   app: {
     port: parseInt(process.env.PORT || '3000', 10),
     env: process.env.NODE_ENV || 'development',
-    logLevel: process.env.LOG_LEVEL || 'info'
+    logLevel: process.env.LOG_LEVEL || 'info',
+    shutdownTimeout: parseInt(process.env.SHUTDOWN_TIMEOUT || '10000', 10),
+    deadlines: {
+      read: parseInt(process.env.DEADLINE_READ_MS || '5000', 10),
+      write: parseInt(process.env.DEADLINE_WRITE_MS || '10000', 10)
+    },
+    loadShedding: {
+      enabled: process.env.LOAD_SHEDDING !== 'false',
+      maxQueueWait: parseInt(process.env.SHED_QUEUE_WAIT_MS || '200', 10),
+      maxWaiting: parseInt(process.env.SHED_MAX_WAITING || '100', 10)
+    },
+    compression: {
+      threshold: parseInt(process.env.COMPRESSION_THRESHOLD || '1024', 10),
+      gzipLevel: parseInt(process.env.COMPRESSION_GZIP_LEVEL || '6', 10),
+      // Quality 11 is for static assets; 4 is about gzip's CPU cost with smaller output
+      brotliQuality: parseInt(process.env.COMPRESSION_BROTLI_QUALITY || '4', 10),
+      cacheBytes: parseInt(process.env.COMPRESSION_CACHE_BYTES || String(16 * 1024 * 1024), 10)
+    }
+  },
+  cluster: {
+    workers: parseInt(process.env.CLUSTER_WORKERS || String(os.cpus().length), 10),
+    workerCount: clusterWorkerCount,
+    // Crashed workers are respawned after restartDelay, doubling per recent
+    // crash up to restartMaxDelay; more than maxRestarts crashes within
+    // restartWindow stops the cluster
+    restartDelay: parseInt(process.env.CLUSTER_RESTART_DELAY || '1000', 10),
+    restartMaxDelay: parseInt(process.env.CLUSTER_RESTART_MAX_DELAY || '30000', 10),
+    maxRestarts: parseInt(process.env.CLUSTER_MAX_RESTARTS || '5', 10),
+    restartWindow: parseInt(process.env.CLUSTER_RESTART_WINDOW_MS || '60000', 10),
+    // A retiring worker still running after this long is sent SIGKILL
+    killTimeout: parseInt(process.env.CLUSTER_KILL_TIMEOUT ||
+      String(parseInt(process.env.SHUTDOWN_TIMEOUT || '10000', 10) + 5000), 10)
+  },
+  outbox: {
+    // User writes record change events; app processes deliver them to handlers
+    enabled: process.env.OUTBOX_ENABLED === 'true',
+    batchSize: parseInt(process.env.OUTBOX_BATCH_SIZE || '100', 10),
+    pollInterval: parseInt(process.env.OUTBOX_POLL_INTERVAL_MS || '1000', 10),
+    maxAttempts: parseInt(process.env.OUTBOX_MAX_ATTEMPTS || '10', 10),
+    retryBaseDelay: parseInt(process.env.OUTBOX_RETRY_BASE_DELAY_MS || '1000', 10),
+    // A claimed batch is redelivered if not acknowledged within this long
+    lease: parseInt(process.env.OUTBOX_LEASE_MS || '60000', 10),
+    // Every event is POSTed here when set
+    webhookUrl: process.env.OUTBOX_WEBHOOK_URL || '',
+    webhookTimeout: parseInt(process.env.OUTBOX_WEBHOOK_TIMEOUT_MS || '5000', 10)
+  },
+  softDelete: {
+    // DELETE /api/users marks the row; reads skip marked rows either way
+    enabled: process.env.SOFT_DELETE === 'true',
+    purge: {
+      enabled: (process.env.PURGE_ENABLED || process.env.SOFT_DELETE) === 'true',
+      // Soft-deleted rows are kept this long before being removed
+      retention: parseInt(process.env.PURGE_RETENTION_HOURS || '24', 10) * 3600 * 1000,
+      batchSize: parseInt(process.env.PURGE_BATCH_SIZE || '500', 10),
+      pause: parseInt(process.env.PURGE_PAUSE_MS || '1000', 10),
+      interval: parseInt(process.env.PURGE_INTERVAL_MS || '60000', 10),
+      // UTC hours [start, end) to purge in, e.g. '1-5'; empty for any time
+      window: process.env.PURGE_WINDOW || '',
+      maxQueueWait: parseInt(process.env.PURGE_MAX_QUEUE_WAIT_MS || '5', 10),
+      maxReplicaLag: parseInt(process.env.PURGE_MAX_REPLICA_LAG_MS || '1000', 10)
+    }
+  },
+  migrations: {
+    dir: process.env.MIGRATIONS_DIR || join(__dirname, '../../infrastructure/migrations'),
+    lockTimeout: process.env.MIGRATION_LOCK_TIMEOUT || '5s',
+    lockRetries: parseInt(process.env.MIGRATION_LOCK_RETRIES || '5', 10),
+    backfill: {
+      batchSize: parseInt(process.env.BACKFILL_BATCH_SIZE || '1000', 10),
+      targetBatchMs: parseInt(process.env.BACKFILL_TARGET_BATCH_MS || '200', 10),
+      pauseMs: parseInt(process.env.BACKFILL_PAUSE_MS || '100', 10),
+      maxReplicaLagMs: parseInt(process.env.BACKFILL_MAX_REPLICA_LAG_MS || '5000', 10),
+      maxWalBytesPerSec: parseInt(process.env.BACKFILL_MAX_WAL_BYTES_PER_SEC || String(32 * 1024 * 1024), 10)
+    },
+    partitions: {
+      premakeMonths: parseInt(process.env.PARTITION_PREMAKE_MONTHS || '3', 10),
+      // 0 keeps every partition attached
+      retentionMonths: parseInt(process.env.PARTITION_RETENTION_MONTHS || '0', 10)
+    }
+  },
+  planCheck: {
+    baselineFile: process.env.PLAN_BASELINE_FILE || join(__dirname, '../plan-baseline.json'),
+    rows: parseInt(process.env.PLAN_CHECK_ROWS || '100000', 10),
+    // A shape fails when its cost or buffer count exceeds baseline * tolerance
+    tolerance: parseFloat(process.env.PLAN_CHECK_TOLERANCE || '1.5')
   },
   database: {
     primary: {
@@ -23,16 +145,57 @@ export const config = {
       user: process.env.DB_USERNAME || 'postgres',
       password: process.env.DB_PASSWORD || 'password'
     },
+    // 'transaction': app pools connect through PgBouncer or RDS Proxy in
+    // transaction pooling mode; migrations and tools keep the direct hosts
+    pooler: {
+      mode: (process.env.DB_POOLER_MODE || 'none') as PoolerMode,
+      primaryHost: process.env.DB_POOLER_PRIMARY_HOST || process.env.DB_PRIMARY_HOST || 'localhost',
+      replicaHost: process.env.DB_POOLER_REPLICA_HOST || process.env.DB_POOLER_PRIMARY_HOST ||
+        process.env.DB_REPLICA_HOST || process.env.DB_PRIMARY_HOST || 'localhost',
+      port: parseInt(process.env.DB_POOLER_PORT || '6432', 10),
+      // Only when the pooler tracks named statements across server
+      // connections (PgBouncer 1.21+ with max_prepared_statements set)
+      preparedStatements: process.env.DB_POOLER_PREPARED_STATEMENTS === 'true'
+    },
     ssl: process.env.DB_SSL === 'true' ? {
       rejectUnauthorized: process.env.DB_SSL_REJECT_UNAUTHORIZED !== 'false'
     } : false,
     pool: {
-      min: parseInt(process.env.DB_POOL_MIN || '2', 10),
-      max: parseInt(process.env.DB_POOL_MAX || '20', 10),
+      min: poolMin,
+      max: poolMax,
+      primary: rolePoolLimits('PRIMARY'),
+      replica: rolePoolLimits('REPLICA'),
       idleTimeout: parseInt(process.env.DB_POOL_IDLE_TIMEOUT || '10000', 10),
-      connectionTimeout: parseInt(process.env.DB_POOL_CONNECTION_TIMEOUT || '5000', 10)
+      connectionTimeout: parseInt(process.env.DB_POOL_CONNECTION_TIMEOUT || '5000', 10),
+      statsInterval: parseInt(process.env.DB_POOL_STATS_INTERVAL || '5000', 10),
+      adaptive: {
+        enabled: process.env.DB_POOL_ADAPTIVE === 'true',
+        targetQueueWait: parseInt(process.env.DB_POOL_TARGET_QUEUE_WAIT_MS || '10', 10),
+        latencyCeiling: parseInt(process.env.DB_POOL_LATENCY_CEILING_MS || '250', 10)
+      }
+    },
+    // 'fast' returns timestamptz as ISO strings instead of Dates; opt in,
+    // since code reading rows directly may expect a Date
+    typeParsers: {
+      primary: (process.env.DB_PRIMARY_TYPE_PARSERS || process.env.DB_TYPE_PARSERS || 'pg') as TypeParserMode,
+      replica: (process.env.DB_REPLICA_TYPE_PARSERS || process.env.DB_TYPE_PARSERS || 'pg') as TypeParserMode
+    },
+    enableQueryLogging: process.env.ENABLE_QUERY_LOGGING === 'true',
+    coalesceReads: process.env.COALESCE_READS !== 'false',
+    // Have Postgres build GET /api/users pages as JSON text
+    listJsonProjection: process.env.LIST_JSON_PROJECTION === 'true',
+    // Retries of transactions failing with a serialization failure or deadlock
+    transactions: {
+      maxRetries: parseInt(process.env.TX_MAX_RETRIES || '3', 10),
+      baseDelayMs: parseInt(process.env.TX_RETRY_BASE_DELAY_MS || '10', 10),
+      maxDelayMs: parseInt(process.env.TX_RETRY_MAX_DELAY_MS || '200', 10)
     },
-    enableQueryLogging: process.env.ENABLE_QUERY_LOGGING === 'true'
+    writeBatch: {
+      enabled: process.env.WRITE_BATCH === 'true',
+      // 4 bind parameters per row; Postgres allows at most 65535 per statement
+      maxSize: Math.min(parseInt(process.env.WRITE_BATCH_MAX_SIZE || '50', 10), 16000),
+      maxWaitMs: parseInt(process.env.WRITE_BATCH_MAX_WAIT_MS || '5', 10)
+    }
   }
 };
 
@@ -0,0 +1,20 @@
+/**
+ * Opaque pagination cursors: the keyset values of the last row on a page,
+ * as base64url-encoded JSON
+ */
+export const encodeCursor = (values: string[]): string =>
+  Buffer.from(JSON.stringify(values)).toString('base64url');
+
+/**
+ * The keyset values in a cursor, or null if it was not made by encodeCursor
+ */
+export const decodeCursor = (cursor: string): string[] | null => {
+  try {
+    const values = JSON.parse(Buffer.from(cursor, 'base64url').toString('utf8'));
+    return Array.isArray(values) && values.length === 2 && values.every((v) => typeof v === 'string')
+      ? values
+      : null;
+  } catch {
+    return null;
+  }
+};
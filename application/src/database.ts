@@ -1,6 +1,9 @@
-import { Pool, PoolConfig } from 'pg';
+import { Pool, PoolConfig, QueryConfig, QueryResult } from 'pg';
 import { config } from './config';
 import { logger } from './logger';
+import { MeteredPool, PoolLimits, PoolMonitor, PoolRole, PoolStats } from './pool';
+import { typeParsers } from './type-parsers';
+import { Transaction, TransactionOptions, runTransaction } from './transaction';
 
 export interface DatabaseConnection {
   primary: Pool;
@@ -9,13 +12,17 @@ export interface DatabaseConnection {
 
 class DatabaseManager {
   private static instance: DatabaseManager;
-  private primaryPool: Pool;
-  private replicaPool: Pool;
+  private primaryPool: MeteredPool;
+  private replicaPool: MeteredPool;
+  private poolMonitor: PoolMonitor;
 
   private constructor() {
-    this.primaryPool = this.createPool(config.database.primary);
-    this.replicaPool = this.createPool(config.database.replica);
+    this.primaryPool = this.createPool('primary', config.database.primary, config.database.pool.primary);
+    this.replicaPool = this.createPool('replica', config.database.replica, config.database.pool.replica);
     this.setupErrorHandlers();
+
+    this.poolMonitor = new PoolMonitor([this.primaryPool, this.replicaPool]);
+    this.poolMonitor.start();
   }
 
   public static getInstance(): DatabaseManager {
@@ -25,22 +32,37 @@ class DatabaseManager {
     return DatabaseManager.instance;
   }
 
-  private createPool(dbConfig: PoolConfig): Pool {
-    const pool = new Pool({
-      host: dbConfig.host,
-      port: dbConfig.port,
+  private createPool(role: PoolRole, dbConfig: PoolConfig, limits: PoolLimits): MeteredPool {
+    // Adaptive pools start halfway up their range and move from there
+    const initialMax = config.database.pool.adaptive.enabled
+      ? Math.max(limits.min, Math.ceil(limits.max / 2))
+      : limits.max;
+    const parsers = config.database.typeParsers[role];
+    const { pooler } = config.database;
+    const pooled = pooler.mode === 'transaction';
+
+    const pool = new MeteredPool(role, limits, {
+      host: pooled ? (role === 'primary' ? pooler.primaryHost : pooler.replicaHost) : dbConfig.host,
+      port: pooled ? pooler.port : dbConfig.port,
       database: dbConfig.database,
       user: dbConfig.user,
       password: dbConfig.password,
       ssl: config.database.ssl,
-      min: config.database.pool.min,
-      max: config.database.pool.max,
+      min: limits.min,
+      max: initialMax,
       idleTimeoutMillis: config.database.pool.idleTimeout,
       connectionTimeoutMillis: config.database.pool.connectionTimeout,
-      statement_timeout: 30000,
+      // Startup parameters set session state, which a transaction pooler
+      // rejects or cannot carry between server connections; behind one,
+      // statement_timeout and TimeZone come from the role or database
+      // settings instead (RDS defaults TimeZone to UTC)
+      statement_timeout: pooled ? undefined : 30000,
       query_timeout: 30000,
-      application_name: 'rds-crud-app'
-    });
+      application_name: 'rds-crud-app',
+      types: typeParsers(parsers),
+      // Timestamps then arrive as '...+00', which the fast parser turns into ISO text directly
+      options: parsers === 'fast' && !pooled ? '-c TimeZone=UTC' : undefined
+    }, pooler);
 
     return pool;
   }
@@ -71,6 +93,48 @@ class DatabaseManager {
     return this.replicaPool;
   }
 
+  /**
+   * Sends several statements on one connection of the role's pool without
+   * waiting for each reply: one checkout and one round trip of latency.
+   * They run as one implicit transaction; the first failure rejects.
+   */
+  public pipeline(role: PoolRole, queries: QueryConfig[]): Promise<QueryResult[]> {
+    return (role === 'primary' ? this.primaryPool : this.replicaPool).pipeline(queries);
+  }
+
+  /**
+   * Runs fn in a transaction on the role's pool (primary unless reading).
+   * Serialization failures and deadlocks are retried with jittered backoff;
+   * tx.savepoint() nests. See runTransaction.
+   */
+  public withTransaction<T>(
+    role: PoolRole,
+    fn: (tx: Transaction) => Promise<T>,
+    options: TransactionOptions = {}
+  ): Promise<T> {
+    const pool = role === 'primary' ? this.primaryPool : this.replicaPool;
+    return runTransaction(pool, fn, options, config.database.transactions);
+  }
+
+  public getPoolStats(): PoolStats[] {
+    return [this.primaryPool.getStats(), this.replicaPool.getStats()];
+  }
+
+  public isOverloaded(role: PoolRole): boolean {
+    const { enabled, maxQueueWait, maxWaiting } = config.app.loadShedding;
+    const pool = role === 'primary' ? this.primaryPool : this.replicaPool;
+    return enabled && pool.isSaturated(maxQueueWait, maxWaiting);
+  }
+
+  /**
+   * Nobody waiting on the role's pool and recent queue wait within bound:
+   * a time for background work to take connections
+   */
+  public isQuiet(role: PoolRole, maxQueueWaitMs: number): boolean {
+    const pool = role === 'primary' ? this.primaryPool : this.replicaPool;
+    return !pool.isSaturated(maxQueueWaitMs, 1);
+  }
+
   public async testConnections(): Promise<boolean> {
     try {
       const primaryTest = await this.primaryPool.query('SELECT NOW() as primary_time');
@@ -89,6 +153,7 @@ class DatabaseManager {
 
   public async gracefulShutdown(): Promise<void> {
     logger.info('Closing database connections...');
+    this.poolMonitor.stop();
     await Promise.all([
       this.primaryPool.end(),
       this.replicaPool.end()
@@ -0,0 +1,110 @@
+import { AsyncLocalStorage } from 'async_hooks';
+import { Request, Response, NextFunction } from 'express';
+import { logger } from './logger';
+
+export class DeadlineExceededError extends Error {
+  constructor(reason: string) {
+    super(`Deadline exceeded: ${reason}`);
+    this.name = 'DeadlineExceededError';
+  }
+}
+
+/**
+ * Time budget for a single request. Aborts when the budget runs out or the
+ * client goes away, so queries running on its behalf can be cancelled.
+ */
+export class Deadline {
+  public readonly expiresAt: number;
+  private controller = new AbortController();
+  private reason?: string;
+
+  constructor(timeoutMs: number) {
+    this.expiresAt = Date.now() + timeoutMs;
+  }
+
+  public get signal(): AbortSignal {
+    return this.controller.signal;
+  }
+
+  public get expired(): boolean {
+    return this.controller.signal.aborted || Date.now() >= this.expiresAt;
+  }
+
+  public get timedOut(): boolean {
+    return this.reason === 'timeout' || Date.now() >= this.expiresAt;
+  }
+
+  public remaining(): number {
+    return Math.max(0, this.expiresAt - Date.now());
+  }
+
+  public cancel(reason: string): void {
+    if (!this.controller.signal.aborted) {
+      this.reason = reason;
+      this.controller.abort();
+    }
+  }
+
+  public throwIfExpired(): void {
+    if (this.expired) {
+      throw new DeadlineExceededError(this.reason || 'timeout');
+    }
+  }
+}
+
+const storage = new AsyncLocalStorage<Deadline>();
+
+export const currentDeadline = (): Deadline | undefined => storage.getStore();
+
+/**
+ * Run work under a deadline outside of a request, e.g. from a tool
+ */
+export const runWithDeadline = <T>(deadline: Deadline, fn: () => T): T => storage.run(deadline, fn);
+
+/**
+ * Run work detached from the current request deadline, e.g. work shared by
+ * several requests that must not be cancelled when one of them goes away
+ */
+export const withoutDeadline = <T>(fn: () => T): T => storage.exit(fn);
+
+/**
+ * Per-route deadline middleware. Everything the route awaits runs inside the
+ * deadline's async context, which is how the database layer finds it.
+ */
+export const withDeadline = (timeoutMs: number) =>
+  (req: Request, res: Response, next: NextFunction): void => {
+    const deadline = new Deadline(timeoutMs);
+    res.locals.deadline = deadline;
+
+    const timer = setTimeout(() => deadline.cancel('timeout'), timeoutMs);
+    timer.unref();
+
+    res.on('close', () => {
+      clearTimeout(timer);
+      if (!res.writableFinished) {
+        logger.debug(`Client disconnected from ${req.method} ${req.originalUrl}`);
+        deadline.cancel('client disconnected');
+      }
+    });
+
+    runWithDeadline(deadline, next);
+  };
+
+/**
+ * Reject new work with 503 while the given check reports overload, so queued
+ * requests do not pile up behind an exhausted pool
+ */
+export const shedLoad = (isOverloaded: () => boolean) =>
+  (req: Request, res: Response, next: NextFunction): void => {
+    if (!isOverloaded()) {
+      next();
+      return;
+    }
+
+    logger.warn(`Shedding ${req.method} ${req.originalUrl}: database pool saturated`);
+    res.set('Retry-After', '1');
+    res.status(503).json({
+      success: false,
+      message: 'Service temporarily overloaded, please retry'
+    });
+  };
@@ -0,0 +1,26 @@
+import { createHash } from 'crypto';
+import { Request, Response } from 'express';
+
+/**
+ * Weak ETag built from what identifies a representation, e.g. a row id and
+ * its updated_at, so it can be computed without serializing the body
+ */
+export const weakEtag = (...parts: Array<string | number>): string =>
+  `W/"${createHash('sha1').update(parts.join(':')).digest('base64url')}"`;
+
+/**
+ * Sets the ETag and answers 304 with no body when the request's
+ * If-None-Match already matches it. Returns true if the response was sent.
+ */
+export const sendNotModified = (req: Request, res: Response, etag: string): boolean => {
+  res.setHeader('ETag', etag);
+  // Clients may keep the body but must revalidate before reusing it
+  res.setHeader('Cache-Control', 'private, no-cache');
+
+  if (!req.fresh) {
+    return false;
+  }
+
+  res.status(304).end();
+  return true;
+};
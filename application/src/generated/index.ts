@@ -0,0 +1,28 @@
+// Generated by codegen/generate.py from codegen/model.json. Do not edit.
+import { Router, RequestHandler } from 'express';
+import { UserController } from './user.controller';
+import { OrderController } from './order.controller';
+
+/**
+ * Routes for every entity in the model; read and write are the app's
+ * load-shedding and deadline middleware for each kind of route
+ */
+export const createGeneratedRouter = (read: RequestHandler[], write: RequestHandler[]): Router => {
+  const router = Router();
+
+  const users = new UserController();
+  router.post('/users', ...write, users.create);
+  router.get('/users', ...read, users.list);
+  router.get('/users/:id', ...read, users.getById);
+  router.patch('/users/:id', ...write, users.update);
+  router.delete('/users/:id', ...write, users.remove);
+
+  const orders = new OrderController();
+  router.post('/orders', ...write, orders.create);
+  router.get('/orders', ...read, orders.list);
+  router.get('/orders/:id', ...read, orders.getById);
+  router.patch('/orders/:id', ...write, orders.update);
+  router.delete('/orders/:id', ...write, orders.remove);
+
+  return router;
+};
@@ -0,0 +1,119 @@
+// Generated by codegen/generate.py from codegen/model.json. Do not edit.
+import { QueryConfig } from 'pg';
+import { escapeLike } from '../sql';
+import { CreateOrderRequest, UpdateOrderRequest, OrderFilters } from './order.types';
+
+// Every statement has a fixed text per shape and a name derived from it, so
+// node-postgres prepares it once per connection and reuses the plan
+export const ORDER_COLUMNS = 'id, user_id AS "userId", status, total_amount AS "totalAmount", created_at AS "createdAt", updated_at AS "updatedAt"';
+
+export const insertOrder = (data: CreateOrderRequest): QueryConfig => ({
+  name: 'orders_insert',
+  text: `INSERT INTO orders (user_id, status, total_amount) VALUES ($1, COALESCE($2, 'pending'), $3) RETURNING ${ORDER_COLUMNS}`,
+  values: [data.userId, data.status ?? null, data.totalAmount]
+});
+
+export const getOrderById = (id: string): QueryConfig => ({
+  name: 'orders_by_id',
+  text: `SELECT ${ORDER_COLUMNS} FROM orders WHERE id = $1`,
+  values: [id]
+});
+
+/**
+ * One page in (created_at, id) descending order, starting after
+ * the given cursor position. Keyset pagination costs the same on every page,
+ * where OFFSET reads and discards all earlier rows.
+ */
+export const listOrders = (
+  filters: OrderFilters,
+  limit: number,
+  after: string[] | null
+): QueryConfig => {
+  const conditions: string[] = [];
+  const values: any[] = [];
+  const shape: string[] = [];
+
+  if (filters.userId !== undefined) {
+    values.push(filters.userId);
+    conditions.push(`user_id = $${values.length}`);
+    shape.push('user_id');
+  }
+
+  if (filters.status !== undefined) {
+    values.push(filters.status);
+    conditions.push(`status = $${values.length}`);
+    shape.push('status');
+  }
+
+  if (after) {
+    values.push(after[0], after[1]);
+    conditions.push(`(created_at, id) < ($${values.length - 1}, $${values.length})`);
+    shape.push('after');
+  }
+
+  values.push(limit);
+  const where = conditions.length ? ` WHERE ${conditions.join(' AND ')}` : '';
+
+  return {
+    name: `orders_list_${shape.join('_') || 'all'}`,
+    // The cursor column is also returned as text, since Date loses precision
+    text: `SELECT ${ORDER_COLUMNS}, created_at::text AS "_cursor" FROM orders${where} ` +
+      `ORDER BY created_at DESC, id DESC LIMIT $${values.length}`,
+    values
+  };
+};
+
+export const updateOrder = (id: string, data: UpdateOrderRequest): QueryConfig | null => {
+  const sets: string[] = [];
+  const values: any[] = [];
+  const shape: string[] = [];
+
+  if (data.userId !== undefined) {
+    values.push(data.userId);
+    sets.push(`user_id = $${values.length}`);
+    shape.push('user_id');
+  }
+
+  if (data.status !== undefined) {
+    values.push(data.status);
+    sets.push(`status = $${values.length}`);
+    shape.push('status');
+  }
+
+  if (data.totalAmount !== undefined) {
+    values.push(data.totalAmount);
+    sets.push(`total_amount = $${values.length}`);
+    shape.push('total_amount');
+  }
+
+  if (sets.length === 0) {
+    return null;
+  }
+  sets.push('updated_at = NOW()');
+
+  values.push(id);
+  return {
+    name: `orders_update_${shape.join('_')}`,
+    text: `UPDATE orders SET ${sets.join(', ')} WHERE id = $${values.length} RETURNING ${ORDER_COLUMNS}`,
+    values
+  };
+};
+
+export const deleteOrder = (id: string): QueryConfig => ({
+  name: 'orders_delete',
+  text: 'DELETE FROM orders WHERE id = $1',
+  values: [id]
+});
+
+/**
+ * Up to perParent orders for each user_id in one statement, newest
+ * first; the lateral subquery walks the keyset index once per parent.
+ * _cursor is the list cursor position, as in listOrders.
+ */
+export const ordersByUserIds = (parentIds: string[], perParent: number): QueryConfig => ({
+  name: 'orders_by_user_ids',
+  text: `SELECT children.* FROM unnest($1::uuid[]) AS parent(id) ` +
+    `CROSS JOIN LATERAL (SELECT ${ORDER_COLUMNS}, created_at::text AS "_cursor" FROM orders WHERE user_id = parent.id ` +
+    `ORDER BY created_at DESC, id DESC LIMIT $2) AS children`,
+  values: [parentIds, perParent]
+});
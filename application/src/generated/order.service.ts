@@ -0,0 +1,84 @@
+// Generated by codegen/generate.py from codegen/model.json. Do not edit.
+import { QueryResult } from 'pg';
+import { db } from '../database';
+import { decodeCursor, encodeCursor } from '../cursor';
+import { Order, CreateOrderRequest, UpdateOrderRequest, OrderFilters, OrderPage } from './order.types';
+import { deleteOrder, getOrderById, insertOrder, listOrders, updateOrder } from './order.queries';
+import { indexBy } from '../relations';
+import { User } from './user.types';
+import { usersByIds } from './user.queries';
+
+export const DEFAULT_PAGE_SIZE = 50;
+
+/**
+ * Writes go to the primary, reads to the replica. Database errors are
+ * passed through unchanged so callers can map SQLSTATE codes.
+ */
+export class OrderService {
+  // One statement per relation for a whole page of rows, never one per row
+  private loaders: Record<string, (items: Order[]) => Promise<void>> = {
+    user: async (items) => {
+      const ids = [...new Set(items.map((item) => item.userId))];
+      const result: QueryResult<User> = await db.replica.query(usersByIds(ids));
+      const byId = indexBy(result.rows, (row) => row.id);
+      for (const item of items) {
+        item.user = byId.get(item.userId) ?? null;
+      }
+    }
+  };
+
+  async create(data: CreateOrderRequest): Promise<Order> {
+    const result: QueryResult<Order> = await db.primary.query(insertOrder(data));
+    return result.rows[0];
+  }
+
+  async getById(id: string, include: string[] = []): Promise<Order | null> {
+    const result: QueryResult<Order> = await db.replica.query(getOrderById(id));
+    const item = result.rows[0] ?? null;
+    if (item) {
+      await this.include([item], include);
+    }
+    return item;
+  }
+
+  /**
+   * Fetches one row past the page to know whether another page follows
+   */
+  async list(filters: OrderFilters, include: string[] = []): Promise<OrderPage> {
+    const limit = filters.limit || DEFAULT_PAGE_SIZE;
+    const after = filters.cursor ? decodeCursor(filters.cursor) : null;
+
+    const result = await db.replica.query(listOrders(filters, limit + 1, after));
+    const rows = result.rows.slice(0, limit);
+    const last = rows[rows.length - 1];
+    const items = rows.map(({ _cursor, ...item }) => item as Order);
+
+    await this.include(items, include);
+    return {
+      items,
+      nextCursor: result.rows.length > limit ? encodeCursor([last._cursor, last.id]) : null
+    };
+  }
+
+  async update(id: string, data: UpdateOrderRequest): Promise<Order | null> {
+    const query = updateOrder(id, data);
+    if (!query) {
+      throw new Error('No fields to update');
+    }
+
+    const result: QueryResult<Order> = await db.primary.query(query);
+    return result.rows[0] ?? null;
+  }
+
+  async remove(id: string): Promise<boolean> {
+    const result = await db.primary.query(deleteOrder(id));
+    return result.rowCount > 0;
+  }
+
+  private async include(items: Order[], include: string[]): Promise<void> {
+    if (items.length === 0) {
+      return;
+    }
+    await Promise.all(include.map((relation) => this.loaders[relation](items)));
+  }
+}
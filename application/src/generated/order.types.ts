@@ -0,0 +1,36 @@
+// Generated by codegen/generate.py from codegen/model.json. Do not edit.
+import { User } from './user.types';
+
+export interface Order {
+  id: string;
+  userId: string;
+  status: string;
+  totalAmount: string;
+  createdAt: Date | string;
+  updatedAt: Date | string;
+  user?: User | null;
+}
+
+export interface CreateOrderRequest {
+  userId: string;
+  status?: string;
+  totalAmount: string;
+}
+
+export interface UpdateOrderRequest {
+  userId?: string;
+  status?: string;
+  totalAmount?: string;
+}
+
+export interface OrderFilters {
+  userId?: string;
+  status?: string;
+  limit?: number;
+  cursor?: string;
+}
+
+export interface OrderPage {
+  items: Order[];
+  nextCursor: string | null;
+}
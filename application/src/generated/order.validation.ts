@@ -0,0 +1,27 @@
+// Generated by codegen/generate.py from codegen/model.json. Do not edit.
+import Joi from 'joi';
+
+export const orderIdSchema = Joi.string().uuid().required();
+
+// Comma-separated relations to load alongside each row
+export const orderIncludeSchema = Joi.string().pattern(/^(?:user)(?:,(?:user))*$/);
+
+export const createOrderSchema = Joi.object({
+  userId: Joi.string().uuid().required(),
+  status: Joi.string().min(1).max(32).optional(),
+  totalAmount: Joi.number().precision(2).cast('string').required()
+});
+
+export const updateOrderSchema = Joi.object({
+  userId: Joi.string().uuid().optional(),
+  status: Joi.string().min(1).max(32).optional(),
+  totalAmount: Joi.number().precision(2).cast('string').optional()
+}).min(1);
+
+export const listOrdersSchema = Joi.object({
+  userId: Joi.string().uuid().optional(),
+  status: Joi.string().min(1).max(32).optional(),
+  limit: Joi.number().integer().min(1).max(100).optional(),
+  cursor: Joi.string().optional(),
+  include: orderIncludeSchema
+});
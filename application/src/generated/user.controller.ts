@@ -0,0 +1,167 @@
+// Generated by codegen/generate.py from codegen/model.json. Do not edit.
+import { Request, Response, NextFunction } from 'express';
+import { logger } from '../logger';
+import { decodeCursor } from '../cursor';
+import { UserService } from './user.service';
+import {
+  userIdSchema,
+  userIncludeSchema,
+  createUserSchema,
+  updateUserSchema,
+  listUsersSchema
+} from './user.validation';
+
+const UNIQUE_VIOLATION = '23505';
+const FOREIGN_KEY_VIOLATION = '23503';
+
+export class UserController {
+  private service = new UserService();
+
+  /**
+   * POST /api/v2/users
+   */
+  create = async (req: Request, res: Response, next: NextFunction): Promise<void> => {
+    try {
+      const { error, value } = createUserSchema.validate(req.body);
+      if (error) {
+        this.validationError(res, error.details);
+        return;
+      }
+
+      const item = await this.service.create(value);
+      res.status(201).json({ success: true, data: item });
+    } catch (error) {
+      this.handleError(res, next, 'create', error);
+    }
+  };
+
+  /**
+   * GET /api/v2/users/:id?include=
+   */
+  getById = async (req: Request, res: Response, next: NextFunction): Promise<void> => {
+    try {
+      const id = userIdSchema.validate(req.params.id);
+      const include = userIncludeSchema.validate(req.query.include);
+      if (id.error || include.error) {
+        this.validationError(res, [...(id.error?.details || []), ...(include.error?.details || [])]);
+        return;
+      }
+
+      const item = await this.service.getById(id.value, this.relations(include.value));
+      if (!item) {
+        this.notFound(res);
+        return;
+      }
+
+      res.json({ success: true, data: item });
+    } catch (error) {
+      this.handleError(res, next, 'getById', error);
+    }
+  };
+
+  /**
+   * GET /api/v2/users?limit=&cursor=&include=
+   */
+  list = async (req: Request, res: Response, next: NextFunction): Promise<void> => {
+    try {
+      const { error, value } = listUsersSchema.validate(req.query);
+      if (error) {
+        this.validationError(res, error.details);
+        return;
+      }
+
+      if (value.cursor && !decodeCursor(value.cursor)) {
+        res.status(400).json({ success: false, message: 'Invalid cursor' });
+        return;
+      }
+
+      const { include, ...filters } = value;
+      const page = await this.service.list(filters, this.relations(include));
+      res.json({
+        success: true,
+        data: page.items,
+        pagination: { nextCursor: page.nextCursor }
+      });
+    } catch (error) {
+      this.handleError(res, next, 'list', error);
+    }
+  };
+
+  /**
+   * PATCH /api/v2/users/:id
+   */
+  update = async (req: Request, res: Response, next: NextFunction): Promise<void> => {
+    try {
+      const id = userIdSchema.validate(req.params.id);
+      const body = updateUserSchema.validate(req.body);
+      if (id.error || body.error) {
+        this.validationError(res, [...(id.error?.details || []), ...(body.error?.details || [])]);
+        return;
+      }
+
+      const item = await this.service.update(id.value, body.value);
+      if (!item) {
+        this.notFound(res);
+        return;
+      }
+
+      res.json({ success: true, data: item });
+    } catch (error) {
+      this.handleError(res, next, 'update', error);
+    }
+  };
+
+  /**
+   * DELETE /api/v2/users/:id
+   */
+  remove = async (req: Request, res: Response, next: NextFunction): Promise<void> => {
+    try {
+      const { error, value: id } = userIdSchema.validate(req.params.id);
+      if (error) {
+        this.validationError(res, error.details);
+        return;
+      }
+
+      if (!(await this.service.remove(id))) {
+        this.notFound(res);
+        return;
+      }
+
+      res.json({ success: true });
+    } catch (error) {
+      this.handleError(res, next, 'remove', error);
+    }
+  };
+
+  private relations(include?: string): string[] {
+    return include ? [...new Set(include.split(','))] : [];
+  }
+
+  private validationError(res: Response, details: Array<{ message: string }>): void {
+    res.status(400).json({
+      success: false,
+      message: 'Validation error',
+      details: details.map(d => d.message)
+    });
+  }
+
+  private notFound(res: Response): void {
+    res.status(404).json({ success: false, message: 'User not found' });
+  }
+
+  // Constraint violations are client errors; anything else goes to the app's error handler
+  private handleError(res: Response, next: NextFunction, action: string, error: unknown): void {
+    const code = (error as { code?: string }).code;
+    if (code === UNIQUE_VIOLATION) {
+      res.status(409).json({ success: false, message: 'Conflicts with an existing user' });
+      return;
+    }
+    if (code === FOREIGN_KEY_VIOLATION) {
+      res.status(409).json({ success: false, message: 'Referenced record does not exist or is still referenced' });
+      return;
+    }
+
+    logger.error(`Error in UserController.${action}:`, error);
+    next(error);
+  }
+}
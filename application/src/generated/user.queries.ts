@@ -0,0 +1,121 @@
+// Generated by codegen/generate.py from codegen/model.json. Do not edit.
+import { QueryConfig } from 'pg';
+import { escapeLike } from '../sql';
+import { CreateUserRequest, UpdateUserRequest, UserFilters } from './user.types';
+
+// Every statement has a fixed text per shape and a name derived from it, so
+// node-postgres prepares it once per connection and reuses the plan
+export const USER_COLUMNS = 'id, email, first_name AS "firstName", last_name AS "lastName", is_active AS "isActive", created_at AS "createdAt", updated_at AS "updatedAt"';
+
+export const insertUser = (data: CreateUserRequest): QueryConfig => ({
+  name: 'users_insert',
+  text: `INSERT INTO users (email, first_name, last_name, is_active) VALUES ($1, $2, $3, COALESCE($4, true)) RETURNING ${USER_COLUMNS}`,
+  values: [data.email, data.firstName, data.lastName, data.isActive ?? null]
+});
+
+export const getUserById = (id: string): QueryConfig => ({
+  name: 'users_by_id',
+  text: `SELECT ${USER_COLUMNS} FROM users WHERE id = $1 AND deleted_at IS NULL`,
+  values: [id]
+});
+
+/**
+ * One page in (created_at, id) descending order, starting after
+ * the given cursor position. Keyset pagination costs the same on every page,
+ * where OFFSET reads and discards all earlier rows.
+ */
+export const listUsers = (
+  filters: UserFilters,
+  limit: number,
+  after: string[] | null
+): QueryConfig => {
+  const conditions: string[] = ['deleted_at IS NULL'];
+  const values: any[] = [];
+  const shape: string[] = [];
+
+  if (filters.email) {
+    values.push(`%${escapeLike(filters.email)}%`);
+    conditions.push(`email ILIKE $${values.length}`);
+    shape.push('email');
+  }
+
+  if (filters.isActive !== undefined) {
+    values.push(filters.isActive);
+    conditions.push(`is_active = $${values.length}`);
+    shape.push('is_active');
+  }
+
+  if (after) {
+    values.push(after[0], after[1]);
+    conditions.push(`(created_at, id) < ($${values.length - 1}, $${values.length})`);
+    shape.push('after');
+  }
+
+  values.push(limit);
+  const where = conditions.length ? ` WHERE ${conditions.join(' AND ')}` : '';
+
+  return {
+    name: `users_list_${shape.join('_') || 'all'}`,
+    // The cursor column is also returned as text, since Date loses precision
+    text: `SELECT ${USER_COLUMNS}, created_at::text AS "_cursor" FROM users${where} ` +
+      `ORDER BY created_at DESC, id DESC LIMIT $${values.length}`,
+    values
+  };
+};
+
+export const updateUser = (id: string, data: UpdateUserRequest): QueryConfig | null => {
+  const sets: string[] = [];
+  const values: any[] = [];
+  const shape: string[] = [];
+
+  if (data.email !== undefined) {
+    values.push(data.email);
+    sets.push(`email = $${values.length}`);
+    shape.push('email');
+  }
+
+  if (data.firstName !== undefined) {
+    values.push(data.firstName);
+    sets.push(`first_name = $${values.length}`);
+    shape.push('first_name');
+  }
+
+  if (data.lastName !== undefined) {
+    values.push(data.lastName);
+    sets.push(`last_name = $${values.length}`);
+    shape.push('last_name');
+  }
+
+  if (data.isActive !== undefined) {
+    values.push(data.isActive);
+    sets.push(`is_active = $${values.length}`);
+    shape.push('is_active');
+  }
+
+  if (sets.length === 0) {
+    return null;
+  }
+  sets.push('updated_at = NOW()');
+
+  values.push(id);
+  return {
+    name: `users_update_${shape.join('_')}`,
+    text: `UPDATE users SET ${sets.join(', ')} WHERE id = $${values.length} AND deleted_at IS NULL RETURNING ${USER_COLUMNS}`,
+    values
+  };
+};
+
+// Soft deletion only marks the row (SOFT_DELETE); it stays hidden from reads
+export const deleteUser = (id: string, soft: boolean): QueryConfig => ({
+  name: soft ? 'users_soft_delete' : 'users_delete',
+  text: soft
+    ? 'UPDATE users SET deleted_at = NOW() WHERE id = $1 AND deleted_at IS NULL RETURNING id'
+    : 'DELETE FROM users WHERE id = $1 AND deleted_at IS NULL RETURNING id',
+  values: [id]
+});
+
+export const usersByIds = (ids: string[]): QueryConfig => ({
+  name: 'users_by_ids',
+  text: `SELECT ${USER_COLUMNS} FROM users WHERE id = ANY($1::uuid[]) AND deleted_at IS NULL`,
+  values: [ids]
+});
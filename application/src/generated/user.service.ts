@@ -0,0 +1,100 @@
+// Generated by codegen/generate.py from codegen/model.json. Do not edit.
+import { QueryConfig, QueryResult } from 'pg';
+import { db } from '../database';
+import { decodeCursor, encodeCursor } from '../cursor';
+import { User, CreateUserRequest, UpdateUserRequest, UserFilters, UserPage } from './user.types';
+import { deleteUser, getUserById, insertUser, listUsers, updateUser } from './user.queries';
+import { config } from '../config';
+import { withOutboxEvent } from '../outbox';
+import { groupBy } from '../relations';
+import { Order } from './order.types';
+import { ordersByUserIds } from './order.queries';
+
+export const DEFAULT_PAGE_SIZE = 50;
+
+/**
+ * Writes go to the primary, reads to the replica. Database errors are
+ * passed through unchanged so callers can map SQLSTATE codes.
+ */
+export class UserService {
+  // One statement per relation for a whole page of rows, never one per row
+  private loaders: Record<string, (items: User[]) => Promise<void>> = {
+    orders: async (items) => {
+      const result = await db.replica.query(
+        ordersByUserIds(items.map((item) => item.id), 21)
+      );
+      const byParent = groupBy(result.rows, (row) => row.userId);
+      for (const item of items) {
+        const children = byParent.get(item.id) ?? [];
+        const shown = children.slice(0, 20);
+        const last = shown[shown.length - 1];
+        item.orders = shown.map(({ _cursor, ...child }) => child as Order);
+        item.ordersNextCursor = children.length > 20 ? encodeCursor([last._cursor, last.id]) : null;
+      }
+    }
+  };
+
+  async create(data: CreateUserRequest): Promise<User> {
+    const result: QueryResult<User> = await db.primary.query(this.recorded(insertUser(data), 'user.created'));
+    return result.rows[0];
+  }
+
+  async getById(id: string, include: string[] = []): Promise<User | null> {
+    const result: QueryResult<User> = await db.replica.query(getUserById(id));
+    const item = result.rows[0] ?? null;
+    if (item) {
+      await this.include([item], include);
+    }
+    return item;
+  }
+
+  /**
+   * Fetches one row past the page to know whether another page follows
+   */
+  async list(filters: UserFilters, include: string[] = []): Promise<UserPage> {
+    const limit = filters.limit || DEFAULT_PAGE_SIZE;
+    const after = filters.cursor ? decodeCursor(filters.cursor) : null;
+
+    const result = await db.replica.query(listUsers(filters, limit + 1, after));
+    const rows = result.rows.slice(0, limit);
+    const last = rows[rows.length - 1];
+    const items = rows.map(({ _cursor, ...item }) => item as User);
+
+    await this.include(items, include);
+    return {
+      items,
+      nextCursor: result.rows.length > limit ? encodeCursor([last._cursor, last.id]) : null
+    };
+  }
+
+  async update(id: string, data: UpdateUserRequest): Promise<User | null> {
+    const query = updateUser(id, data);
+    if (!query) {
+      throw new Error('No fields to update');
+    }
+
+    const result: QueryResult<User> = await db.primary.query(this.recorded(query, 'user.updated'));
+    return result.rows[0] ?? null;
+  }
+
+  async remove(id: string): Promise<boolean> {
+    const result = await db.primary.query(this.recorded(deleteUser(id, config.softDelete.enabled), 'user.deleted'));
+    return result.rowCount > 0;
+  }
+
+  /**
+   * The write, plus its outbox event in the same statement when the outbox is on
+   */
+  private recorded(query: QueryConfig, eventType: string): QueryConfig {
+    return config.outbox.enabled
+      ? withOutboxEvent({ text: query.text, values: query.values ?? [] }, eventType)
+      : query;
+  }
+
+  private async include(items: User[], include: string[]): Promise<void> {
+    if (items.length === 0) {
+      return;
+    }
+    await Promise.all(include.map((relation) => this.loaders[relation](items)));
+  }
+}
@@ -0,0 +1,41 @@
+// Generated by codegen/generate.py from codegen/model.json. Do not edit.
+import { Order } from './order.types';
+
+export interface User {
+  id: string;
+  email: string;
+  firstName: string;
+  lastName: string;
+  isActive: boolean;
+  createdAt: Date | string;
+  updatedAt: Date | string;
+  orders?: Order[];
+  // Cursor for /orders?userId=...&cursor=... when more than 20 orders exist
+  ordersNextCursor?: string | null;
+}
+
+export interface CreateUserRequest {
+  email: string;
+  firstName: string;
+  lastName: string;
+  isActive?: boolean;
+}
+
+export interface UpdateUserRequest {
+  email?: string;
+  firstName?: string;
+  lastName?: string;
+  isActive?: boolean;
+}
+
+export interface UserFilters {
+  email?: string;
+  isActive?: boolean;
+  limit?: number;
+  cursor?: string;
+}
+
+export interface UserPage {
+  items: User[];
+  nextCursor: string | null;
+}
@@ -0,0 +1,29 @@
+// Generated by codegen/generate.py from codegen/model.json. Do not edit.
+import Joi from 'joi';
+
+export const userIdSchema = Joi.string().uuid().required();
+
+// Comma-separated relations to load alongside each row
+export const userIncludeSchema = Joi.string().pattern(/^(?:orders)(?:,(?:orders))*$/);
+
+export const createUserSchema = Joi.object({
+  email: Joi.string().email().min(1).max(255).required(),
+  firstName: Joi.string().min(1).max(100).required(),
+  lastName: Joi.string().min(1).max(100).required(),
+  isActive: Joi.boolean().optional()
+});
+
+export const updateUserSchema = Joi.object({
+  email: Joi.string().email().min(1).max(255).optional(),
+  firstName: Joi.string().min(1).max(100).optional(),
+  lastName: Joi.string().min(1).max(100).optional(),
+  isActive: Joi.boolean().optional()
+}).min(1);
+
+export const listUsersSchema = Joi.object({
+  email: Joi.string().max(255).optional(),
+  isActive: Joi.boolean().optional(),
+  limit: Joi.number().integer().min(1).max(100).optional(),
+  cursor: Joi.string().optional(),
+  include: userIncludeSchema
+});
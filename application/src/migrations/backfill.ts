@@ -0,0 +1,280 @@
+import { Pool, PoolClient } from 'pg';
+import { config } from '../config';
+import { logger } from '../logger';
+import { MigrationDirectives, setLockTimeout, sleep, withLockRetry } from './online';
+
+export interface BackfillSpec {
+  table: string;
+  // Either update rows in place with `set`, or copy them into `copyTo`
+  set?: string;
+  copyTo?: string;
+  where?: string;
+  key?: string;
+  batchSize?: number;
+  targetBatchMs?: number;
+  pauseMs?: number;
+  maxReplicaLagMs?: number;
+  maxWalBytesPerSec?: number;
+}
+
+interface Checkpoint {
+  lastKey: string | null;
+  rowsUpdated: number;
+  batchSize: number;
+  completed: boolean;
+}
+
+const MIN_BATCH_SIZE = 10;
+const MAX_BATCH_SIZE = 50000;
+
+/**
+ * Applies an UPDATE to a table, or copies it into another table, in
+ * primary-key order with one short transaction per batch, so no statement
+ * holds row locks for long or produces one huge burst of WAL. The batch size
+ * tracks a target per-batch latency, the run pauses while replica lag or WAL
+ * generation is too high, and progress is checkpointed in
+ * backfill_checkpoints in the same transaction as each batch so an
+ * interrupted run resumes where it stopped.
+ */
+export class Backfill {
+  private key: string;
+  private batchSize: number;
+  private targetBatchMs: number;
+  private pauseMs: number;
+  private maxReplicaLagMs: number;
+  private maxWalBytesPerSec: number;
+  private walSample?: { lsn: string; at: number };
+
+  constructor(
+    private client: PoolClient,
+    private replica: Pool | null,
+    private name: string,
+    private spec: BackfillSpec,
+    private directives: MigrationDirectives
+  ) {
+    const defaults = config.migrations.backfill;
+    this.key = spec.key || 'id';
+    this.batchSize = spec.batchSize || defaults.batchSize;
+    this.targetBatchMs = spec.targetBatchMs || defaults.targetBatchMs;
+    this.pauseMs = spec.pauseMs ?? defaults.pauseMs;
+    this.maxReplicaLagMs = spec.maxReplicaLagMs ?? defaults.maxReplicaLagMs;
+    this.maxWalBytesPerSec = spec.maxWalBytesPerSec ?? defaults.maxWalBytesPerSec;
+  }
+
+  async run(): Promise<number> {
+    await this.ensureCheckpointTable();
+    const checkpoint = await this.loadCheckpoint();
+
+    if (checkpoint?.completed) {
+      logger.info(`Backfill ${this.name} already completed (${checkpoint.rowsUpdated} rows)`);
+      return checkpoint.rowsUpdated;
+    }
+
+    let lastKey = checkpoint?.lastKey ?? null;
+    let total = checkpoint?.rowsUpdated ?? 0;
+    if (checkpoint) {
+      this.batchSize = checkpoint.batchSize;
+      logger.info(`Resuming backfill ${this.name} after ${this.key} ${lastKey} (${total} rows done)`);
+    }
+
+    for (;;) {
+      await this.throttle();
+
+      const startedAt = Date.now();
+      const { rows, nextKey } = await this.runBatch(lastKey, total);
+      const elapsed = Date.now() - startedAt;
+
+      if (nextKey === null) {
+        break;
+      }
+
+      total += rows;
+      lastKey = nextKey;
+      logger.info(
+        `Backfill ${this.name}: ${total} rows updated (through ${this.key} ${lastKey}, ` +
+        `batch ${this.batchSize} in ${elapsed}ms)`
+      );
+
+      this.adjustBatchSize(elapsed);
+      await sleep(this.pauseMs);
+    }
+
+    await this.client.query(
+      'UPDATE backfill_checkpoints SET completed_at = NOW(), updated_at = NOW() WHERE name = $1',
+      [this.name]
+    );
+    return total;
+  }
+
+  private async ensureCheckpointTable(): Promise<void> {
+    await this.client.query(`
+      CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+        name VARCHAR(255) PRIMARY KEY,
+        last_key TEXT,
+        rows_updated BIGINT NOT NULL DEFAULT 0,
+        batch_size INTEGER NOT NULL,
+        updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+        completed_at TIMESTAMP WITH TIME ZONE
+      )
+    `);
+  }
+
+  private async loadCheckpoint(): Promise<Checkpoint | null> {
+    const result = await this.client.query(
+      'SELECT last_key, rows_updated, batch_size, completed_at FROM backfill_checkpoints WHERE name = $1',
+      [this.name]
+    );
+
+    if (result.rows.length === 0) {
+      return null;
+    }
+
+    const row = result.rows[0];
+    return {
+      lastKey: row.last_key,
+      rowsUpdated: parseInt(row.rows_updated, 10),
+      batchSize: row.batch_size,
+      completed: row.completed_at !== null
+    };
+  }
+
+  /**
+   * Update one batch and advance the checkpoint in the same transaction
+   */
+  private async runBatch(lastKey: string | null, total: number): Promise<{ rows: number; nextKey: string | null }> {
+    const { table, set, copyTo, where } = this.spec;
+    const key = this.key;
+    const conditions = [
+      ...(lastKey !== null ? [`${key} > $2`] : []),
+      ...(where ? [`(${where})`] : [])
+    ];
+
+    // A copy locks its batch FOR KEY SHARE until the batch commits: a
+    // concurrent DELETE waits rather than being mirrored before the copy lands
+    // (which would resurrect the row), and the locked read returns the latest
+    // committed version of rows updated since the statement began. Updates
+    // that commit later conflict with the copied row, which the mirror
+    // trigger resolves by overwriting it.
+    const query = `
+      WITH batch AS (
+        SELECT ${copyTo ? '*' : key} FROM ${table}
+        ${conditions.length ? `WHERE ${conditions.join(' AND ')}` : ''}
+        ORDER BY ${key}
+        LIMIT $1
+        ${copyTo ? 'FOR KEY SHARE' : ''}
+      ), updated AS (
+        ${copyTo
+          ? `INSERT INTO ${copyTo}
+             SELECT * FROM batch
+             ON CONFLICT DO NOTHING`
+          : `UPDATE ${table} AS target SET ${set}
+             FROM batch
+             WHERE target.${key} = batch.${key}`}
+        RETURNING 1
+      )
+      SELECT (SELECT ${key}::text FROM batch ORDER BY ${key} DESC LIMIT 1) AS next_key,
+             (SELECT COUNT(*) FROM updated) AS updated_rows
+    `;
+
+    const values: any[] = lastKey !== null ? [this.batchSize, lastKey] : [this.batchSize];
+    let result: { rows: number; nextKey: string | null } = { rows: 0, nextKey: null };
+
+    await withLockRetry(this.directives, async () => {
+      await this.client.query('BEGIN');
+      try {
+        await setLockTimeout(this.client, this.directives.lockTimeout, true);
+        const res = await this.client.query(query, values);
+        result = { rows: parseInt(res.rows[0].updated_rows, 10), nextKey: res.rows[0].next_key };
+
+        if (result.nextKey !== null) {
+          await this.client.query(`
+            INSERT INTO backfill_checkpoints (name, last_key, rows_updated, batch_size)
+            VALUES ($1, $2, $3, $4)
+            ON CONFLICT (name) DO UPDATE
+            SET last_key = EXCLUDED.last_key, rows_updated = EXCLUDED.rows_updated,
+                batch_size = EXCLUDED.batch_size, updated_at = NOW()
+          `, [this.name, result.nextKey, total + result.rows, this.batchSize]);
+        }
+
+        await this.client.query('COMMIT');
+      } catch (error) {
+        await this.client.query('ROLLBACK');
+        throw error;
+      }
+    });
+
+    return result;
+  }
+
+  /**
+   * Scale the batch toward the target latency, by at most 2x either way
+   */
+  private adjustBatchSize(elapsedMs: number): void {
+    const ratio = this.targetBatchMs / Math.max(elapsedMs, 1);
+    const scaled = Math.round(this.batchSize * Math.min(2, Math.max(0.5, ratio)));
+    this.batchSize = Math.min(MAX_BATCH_SIZE, Math.max(MIN_BATCH_SIZE, scaled));
+  }
+
+  private async throttle(): Promise<void> {
+    await this.waitForReplica();
+    await this.waitForWalRate();
+  }
+
+  /**
+   * Replay lag on the replica; zero when there is no separate replica
+   */
+  private async replicaLagMs(): Promise<number> {
+    if (!this.replica) {
+      return 0;
+    }
+
+    const result = await this.replica.query(`
+      SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()) * 1000, 0)
+      END AS lag_ms
+    `);
+    return Number(result.rows[0].lag_ms);
+  }
+
+  private async waitForReplica(): Promise<void> {
+    let lag = await this.replicaLagMs();
+    while (lag > this.maxReplicaLagMs) {
+      logger.warn(`Replica lag ${Math.round(lag)}ms above ${this.maxReplicaLagMs}ms, pausing backfill`);
+      await sleep(Math.min(lag, 10000));
+      lag = await this.replicaLagMs();
+    }
+  }
+
+  /**
+   * WAL generated per second on the primary since the previous batch, from
+   * all writers, not just this backfill. Sleeps long enough to bring the
+   * average back under the limit.
+   */
+  private async waitForWalRate(): Promise<void> {
+    if (this.maxWalBytesPerSec <= 0) {
+      return;
+    }
+
+    const result = await this.client.query(
+      'SELECT pg_current_wal_lsn()::text AS lsn, pg_wal_lsn_diff(pg_current_wal_lsn(), $1::pg_lsn) AS bytes',
+      [this.walSample?.lsn ?? '0/0']
+    );
+    const now = Date.now();
+    const previous = this.walSample;
+    this.walSample = { lsn: result.rows[0].lsn, at: now };
+
+    if (!previous) {
+      return;
+    }
+
+    const bytes = Number(result.rows[0].bytes);
+    const rate = bytes / Math.max((now - previous.at) / 1000, 0.001);
+    if (rate > this.maxWalBytesPerSec) {
+      const wait = Math.min(30000, (bytes / this.maxWalBytesPerSec) * 1000 - (now - previous.at));
+      logger.warn(`WAL rate ${Math.round(rate / 1024)}KB/s above limit, pausing backfill ${Math.round(wait)}ms`);
+      await sleep(wait);
+    }
+  }
+}
@@ -1,11 +1,42 @@
-import { Pool } from 'pg';
-import { readFileSync } from 'fs';
-import { join } from 'path';
+import { Pool, PoolClient } from 'pg';
+import { createHash } from 'crypto';
+import { readFileSync, readdirSync } from 'fs';
+import { basename, extname, join } from 'path';
 import { config } from '../config';
 import { logger } from '../logger';
+import { Backfill, BackfillSpec } from './backfill';
+import { PartitionManager } from './partitions';
+import {
+  MigrationDirectives,
+  dropInvalidIndex,
+  parseDirectives,
+  setLockTimeout,
+  splitStatements,
+  withLockRetry
+} from './online';
+
+interface Migration {
+  version: number;
+  name: string;
+  kind: 'sql' | 'backfill';
+  sql: string;
+  checksum: string;
+}
+
+interface AppliedMigration {
+  version: number;
+  name: string;
+  checksum: string;
+}
+
+const MIGRATION_FILE = /^(\d+)_([\w-]+)\.(sql|json)$/;
+
+// Arbitrary key so concurrent deploys apply migrations one at a time
+const MIGRATION_LOCK_KEY = 72633001;
 
 class DatabaseMigrator {
   private pool: Pool;
+  private replicaPool: Pool | null = null;
 
   constructor() {
     this.pool = new Pool({
@@ -18,34 +49,289 @@ class DatabaseMigrator {
     });
   }
 
+  // Only backfills need the replica, to throttle on its replay lag
+  private getReplicaPool(): Pool | null {
+    if (!this.replicaPool && config.database.replica.host !== config.database.primary.host) {
+      this.replicaPool = new Pool({
+        host: config.database.replica.host,
+        port: config.database.replica.port,
+        database: config.database.replica.database,
+        user: config.database.replica.user,
+        password: config.database.replica.password,
+        ssl: config.database.ssl,
+        max: 1
+      });
+    }
+    return this.replicaPool;
+  }
+
+  private async end(): Promise<void> {
+    await Promise.all([this.pool.end(), this.replicaPool?.end()]);
+  }
+
+  /**
+   * Read numbered migration files in version order: NNNN_name.sql for SQL,
+   * NNNN_name.json for a batched backfill ({"backfill": {...}})
+   */
+  private loadMigrations(): Migration[] {
+    const dir = config.migrations.dir;
+    const migrations = readdirSync(dir)
+      .map((file) => ({ file, match: MIGRATION_FILE.exec(file) }))
+      .filter(({ match }) => match !== null)
+      .map(({ file, match }) => {
+        const sql = readFileSync(join(dir, file), 'utf8');
+        return {
+          version: parseInt((match as RegExpExecArray)[1], 10),
+          name: (match as RegExpExecArray)[2],
+          kind: (match as RegExpExecArray)[3] === 'json' ? 'backfill' as const : 'sql' as const,
+          sql,
+          checksum: createHash('sha256').update(sql).digest('hex')
+        };
+      })
+      .sort((a, b) => a.version - b.version);
+
+    for (let i = 1; i < migrations.length; i++) {
+      if (migrations[i].version === migrations[i - 1].version) {
+        throw new Error(`Duplicate migration version ${migrations[i].version}`);
+      }
+    }
+
+    return migrations;
+  }
+
+  private async ensureLedger(client: PoolClient): Promise<void> {
+    await client.query(`
+      CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        checksum CHAR(64) NOT NULL,
+        applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+        execution_ms INTEGER NOT NULL
+      )
+    `);
+  }
+
+  private async appliedMigrations(client: PoolClient): Promise<Map<number, AppliedMigration>> {
+    const result = await client.query<AppliedMigration>(
+      'SELECT version, name, checksum FROM schema_migrations ORDER BY version'
+    );
+    return new Map(result.rows.map((row) => [row.version, row]));
+  }
+
+  /**
+   * Applied migrations must not have been edited after the fact
+   */
+  private verifyChecksums(migrations: Migration[], applied: Map<number, AppliedMigration>): void {
+    for (const migration of migrations) {
+      const ledgerEntry = applied.get(migration.version);
+      if (ledgerEntry && ledgerEntry.checksum !== migration.checksum) {
+        throw new Error(
+          `Checksum mismatch for applied migration ${migration.version}_${migration.name}; ` +
+          'add a new migration instead of editing an applied one'
+        );
+      }
+    }
+  }
+
+  private async applyMigration(client: PoolClient, migration: Migration): Promise<void> {
+    const startedAt = Date.now();
+    logger.info(`Applying migration ${migration.version}_${migration.name}`);
+
+    const directives = parseDirectives(migration.sql);
+
+    if (migration.kind === 'backfill') {
+      await this.applyBackfill(client, migration, directives);
+      await this.recordMigration(client, migration, startedAt);
+    } else if (directives.transaction) {
+      await this.applyInTransaction(client, migration, directives, startedAt);
+    } else {
+      await this.applyStatements(client, migration, directives);
+      await this.recordMigration(client, migration, startedAt);
+    }
+
+    logger.info(`Applied migration ${migration.version}_${migration.name} in ${Date.now() - startedAt}ms`);
+  }
+
+  /**
+   * Default mode: the whole file and its ledger entry commit together. On a
+   * lock timeout the transaction is rolled back and retried as a whole.
+   */
+  private async applyInTransaction(
+    client: PoolClient,
+    migration: Migration,
+    directives: MigrationDirectives,
+    startedAt: number
+  ): Promise<void> {
+    await withLockRetry(directives, async () => {
+      await client.query('BEGIN');
+      try {
+        await setLockTimeout(client, directives.lockTimeout, true);
+        await client.query(migration.sql);
+        await this.recordMigration(client, migration, startedAt);
+        await client.query('COMMIT');
+      } catch (error) {
+        await client.query('ROLLBACK');
+        throw error;
+      }
+    });
+  }
+
+  /**
+   * "-- migrate:no-transaction" mode, required for CREATE INDEX CONCURRENTLY.
+   * Statements run one by one in autocommit, each retried on lock timeout, so
+   * they should be idempotent (IF NOT EXISTS) in case a run stops halfway.
+   */
+  private async applyStatements(
+    client: PoolClient,
+    migration: Migration,
+    directives: MigrationDirectives
+  ): Promise<void> {
+    try {
+      for (const statement of splitStatements(migration.sql)) {
+        await withLockRetry(
+          directives,
+          async () => {
+            await setLockTimeout(client, directives.lockTimeout);
+            await client.query(statement);
+          },
+          () => dropInvalidIndex(client, statement)
+        );
+      }
+    } finally {
+      await client.query('RESET lock_timeout');
+    }
+  }
+
+  private async applyBackfill(
+    client: PoolClient,
+    migration: Migration,
+    directives: MigrationDirectives
+  ): Promise<void> {
+    const spec: BackfillSpec = JSON.parse(migration.sql).backfill;
+    if (!spec || !spec.table || !(spec.set || spec.copyTo)) {
+      throw new Error(`Backfill migration ${migration.version}_${migration.name} needs backfill.table and backfill.set or backfill.copyTo`);
+    }
+
+    try {
+      const name = `${migration.version}_${migration.name}`;
+      const rows = await new Backfill(client, this.getReplicaPool(), name, spec, directives).run();
+      logger.info(`Backfill ${migration.version}_${migration.name} updated ${rows} rows`);
+    } finally {
+      await client.query('RESET lock_timeout');
+    }
+  }
+
+  private async recordMigration(client: PoolClient, migration: Migration, startedAt: number): Promise<void> {
+    await client.query(
+      'INSERT INTO schema_migrations (version, name, checksum, execution_ms) VALUES ($1, $2, $3, $4)',
+      [migration.version, migration.name, migration.checksum, Date.now() - startedAt]
+    );
+  }
+
   async runMigrations(): Promise<void> {
+    const client = await this.pool.connect();
+
     try {
       logger.info('Starting database migrations...');
+      await client.query('SELECT pg_advisory_lock($1)', [MIGRATION_LOCK_KEY]);
 
-      // Read and execute schema.sql
-      const schemaPath = join(__dirname, '../../schema.sql');
-      const schemaSql = readFileSync(schemaPath, 'utf8');
-
-      await this.pool.query(schemaSql);
-      logger.info('Schema migration completed successfully');
+      await this.ensureLedger(client);
+      const migrations = this.loadMigrations();
+      const applied = await this.appliedMigrations(client);
+      this.verifyChecksums(migrations, applied);
 
-      // Verify table creation
-      const tableCheck = await this.pool.query(`
-        SELECT table_name 
-        FROM information_schema.tables 
-        WHERE table_schema = 'public' AND table_name = 'users'
-      `);
+      const pending = migrations.filter((migration) => !applied.has(migration.version));
+      if (pending.length === 0) {
+        logger.info('Database schema is up to date');
+        return;
+      }
 
-      if (tableCheck.rows.length === 0) {
-        throw new Error('Users table was not created');
+      for (const migration of pending) {
+        await this.applyMigration(client, migration);
       }
 
-      logger.info('Database migration verification passed');
+      logger.info(`Applied ${pending.length} migration(s)`);
 
     } catch (error) {
       logger.error('Migration failed:', error);
       throw error;
     } finally {
+      await client.query('SELECT pg_advisory_unlock($1)', [MIGRATION_LOCK_KEY]).catch(() => undefined);
+      client.release();
+      await this.end();
+    }
+  }
+
+  /**
+   * Run a standalone data backfill outside the migration ledger. Progress is
+   * checkpointed under the file name, so re-running resumes an interrupted run.
+   */
+  async backfill(specPath: string): Promise<void> {
+    const client = await this.pool.connect();
+
+    try {
+      const spec: BackfillSpec = JSON.parse(readFileSync(specPath, 'utf8')).backfill;
+      if (!spec || !spec.table || !(spec.set || spec.copyTo)) {
+        throw new Error(`${specPath} needs backfill.table and backfill.set or backfill.copyTo`);
+      }
+
+      const name = basename(specPath, extname(specPath));
+      const rows = await new Backfill(client, this.getReplicaPool(), name, spec, parseDirectives('')).run();
+      logger.info(`Backfill ${name} updated ${rows} rows`);
+    } finally {
+      await client.query('RESET lock_timeout').catch(() => undefined);
+      client.release();
+      await this.end();
+    }
+  }
+
+  /**
+   * Online conversion of users to monthly range partitions on created_at
+   */
+  async convertToPartitioned(): Promise<void> {
+    const client = await this.pool.connect();
+
+    try {
+      await client.query('SELECT pg_advisory_lock($1)', [MIGRATION_LOCK_KEY]);
+      await new PartitionManager(client, this.getReplicaPool()).convert();
+    } finally {
+      await client.query('SELECT pg_advisory_unlock($1)', [MIGRATION_LOCK_KEY]).catch(() => undefined);
+      client.release();
+      await this.end();
+    }
+  }
+
+  /**
+   * Create upcoming partitions and archive expired ones; run from cron
+   */
+  async maintainPartitions(): Promise<void> {
+    const client = await this.pool.connect();
+
+    try {
+      await new PartitionManager(client, null).maintain();
+    } finally {
+      client.release();
+      await this.end();
+    }
+  }
+
+  async status(): Promise<void> {
+    const client = await this.pool.connect();
+
+    try {
+      await this.ensureLedger(client);
+      const migrations = this.loadMigrations();
+      const applied = await this.appliedMigrations(client);
+
+      for (const migration of migrations) {
+        const ledgerEntry = applied.get(migration.version);
+        const state = !ledgerEntry
+          ? 'pending'
+          : ledgerEntry.checksum === migration.checksum ? 'applied' : 'CHANGED';
+        logger.info(`${migration.version}_${migration.name}: ${state}`);
+      }
+    } finally {
+      client.release();
       await this.pool.end();
     }
   }
@@ -55,8 +341,14 @@ class DatabaseMigrator {
       logger.warn('Starting database rollback...');
 
       // Drop tables in reverse order
+      await this.pool.query('DROP TABLE IF EXISTS outbox, backfill_checkpoints;');
+      await this.pool.query('DROP TABLE IF EXISTS orders;');
       await this.pool.query('DROP TABLE IF EXISTS users CASCADE;');
+      await this.pool.query('DROP TABLE IF EXISTS users_unpartitioned, user_emails CASCADE;');
+      await this.pool.query('DROP FUNCTION IF EXISTS users_reference_created_at() CASCADE;');
+      await this.pool.query('DROP FUNCTION IF EXISTS sync_user_emails() CASCADE;');
       await this.pool.query('DROP FUNCTION IF EXISTS update_updated_at_column() CASCADE;');
+      await this.pool.query('DROP TABLE IF EXISTS schema_migrations;');
 
       logger.info('Database rollback completed');
 
@@ -86,6 +378,55 @@ switch (command) {
       });
     break;
 
+  case 'backfill':
+    if (!process.argv[3]) {
+      logger.info('Usage: ts-node src/migrations/migrate.ts backfill <spec.json>');
+      process.exit(1);
+    }
+    migrator.backfill(process.argv[3])
+      .then(() => {
+        logger.info('Backfill completed successfully');
+        process.exit(0);
+      })
+      .catch((error) => {
+        logger.error('Backfill failed:', error);
+        process.exit(1);
+      });
+    break;
+
+  case 'partition-convert':
+    migrator.convertToPartitioned()
+      .then(() => {
+        logger.info('Partition conversion completed successfully');
+        process.exit(0);
+      })
+      .catch((error) => {
+        logger.error('Partition conversion failed:', error);
+        process.exit(1);
+      });
+    break;
+
+  case 'partitions':
+    migrator.maintainPartitions()
+      .then(() => {
+        logger.info('Partition maintenance completed successfully');
+        process.exit(0);
+      })
+      .catch((error) => {
+        logger.error('Partition maintenance failed:', error);
+        process.exit(1);
+      });
+    break;
+
+  case 'status':
+    migrator.status()
+      .then(() => process.exit(0))
+      .catch((error) => {
+        logger.error('Status check failed:', error);
+        process.exit(1);
+      });
+    break;
+
   case 'down':
     migrator.rollback()
       .then(() => {
@@ -99,6 +440,6 @@ switch (command) {
     break;
 
   default:
-    logger.info('Usage: ts-node src/migrations/migrate.ts [up|down]');
+    logger.info('Usage: ts-node src/migrations/migrate.ts [up|status|backfill <spec.json>|partition-convert|partitions|down]');
     process.exit(1);
-}
\ No newline at end of file
+}
@@ -0,0 +1,161 @@
+import { PoolClient } from 'pg';
+import { config } from '../config';
+import { logger } from '../logger';
+
+export interface MigrationDirectives {
+  transaction: boolean;
+  lockTimeout: string;
+  lockRetries: number;
+}
+
+const LOCK_NOT_AVAILABLE = '55P03';
+
+const CONCURRENT_INDEX = /CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?("?[\w.]+"?)/i;
+
+export const sleep = (ms: number): Promise<void> => new Promise((resolve) => setTimeout(resolve, ms));
+
+/**
+ * Set lock_timeout for the session, or for the current transaction only
+ */
+export const setLockTimeout = async (client: PoolClient, timeout: string, local = false): Promise<void> => {
+  await client.query('SELECT set_config($1, $2, $3)', ['lock_timeout', timeout, local]);
+};
+
+/**
+ * Read "-- migrate:<name> [value]" header comments, e.g.
+ *   -- migrate:no-transaction
+ *   -- migrate:lock-timeout 2s
+ *   -- migrate:lock-retries 10
+ */
+export const parseDirectives = (sql: string): MigrationDirectives => {
+  const directives: MigrationDirectives = {
+    transaction: true,
+    lockTimeout: config.migrations.lockTimeout,
+    lockRetries: config.migrations.lockRetries
+  };
+
+  for (const match of sql.matchAll(/^--\s*migrate:([\w-]+)(?:[ \t]+(\S+))?/gm)) {
+    const [, name, value] = match;
+    switch (name) {
+      case 'no-transaction':
+        directives.transaction = false;
+        break;
+      case 'lock-timeout':
+        directives.lockTimeout = value;
+        break;
+      case 'lock-retries':
+        directives.lockRetries = parseInt(value, 10);
+        break;
+      default:
+        throw new Error(`Unknown migration directive: ${name}`);
+    }
+  }
+
+  return directives;
+};
+
+/**
+ * Split a script into statements on top-level semicolons, skipping those in
+ * quotes, dollar-quoted bodies and comments. Needed because a multi-statement
+ * query runs as one implicit transaction, which CONCURRENTLY refuses.
+ */
+export const splitStatements = (sql: string): string[] => {
+  const statements: string[] = [];
+  let current = '';
+  let i = 0;
+
+  // Index just past the closing delimiter, or the end of the script
+  const skipTo = (delimiter: string, from: number): number => {
+    const end = sql.indexOf(delimiter, from);
+    return end === -1 ? sql.length : end + delimiter.length;
+  };
+
+  const flush = () => {
+    if (current.replace(/--.*$/gm, '').trim()) {
+      statements.push(current.trim());
+    }
+    current = '';
+  };
+
+  while (i < sql.length) {
+    const char = sql[i];
+    let next = i + 1;
+
+    if (sql.startsWith('--', i)) {
+      next = skipTo('\n', i);
+    } else if (sql.startsWith('/*', i)) {
+      next = skipTo('*/', i + 2);
+    } else if (char === "'" || char === '"') {
+      next = skipTo(char, i + 1);
+    } else if (char === '$') {
+      const tag = /^\$[A-Za-z_]*\$/.exec(sql.slice(i, i + 64));
+      if (tag) {
+        next = skipTo(tag[0], i + tag[0].length);
+      }
+    } else if (char === ';') {
+      flush();
+      i = next;
+      continue;
+    }
+
+    current += sql.slice(i, next);
+    i = next;
+  }
+
+  flush();
+  return statements;
+};
+
+/**
+ * Run an attempt that sets lock_timeout itself, retrying with jittered
+ * exponential backoff while it cannot get its lock. A short lock_timeout
+ * keeps DDL from queueing behind a long transaction while every later query
+ * on the table queues behind the DDL.
+ */
+export const withLockRetry = async (
+  directives: MigrationDirectives,
+  attempt: () => Promise<void>,
+  beforeRetry?: () => Promise<void>
+): Promise<void> => {
+  for (let n = 1; ; n++) {
+    try {
+      await attempt();
+      return;
+    } catch (error) {
+      const code = (error as { code?: string }).code;
+      if (code !== LOCK_NOT_AVAILABLE || n > directives.lockRetries) {
+        throw error;
+      }
+
+      if (beforeRetry) {
+        await beforeRetry();
+      }
+
+      const delay = Math.min(30000, 500 * 2 ** (n - 1)) * (0.5 + Math.random() / 2);
+      logger.warn(`Lock not available (attempt ${n}/${directives.lockRetries}), retrying in ${Math.round(delay)}ms`);
+      await sleep(delay);
+    }
+  }
+};
+
+/**
+ * A failed CONCURRENTLY build leaves an INVALID index behind, which a retried
+ * CREATE INDEX ... IF NOT EXISTS would then happily skip
+ */
+export const dropInvalidIndex = async (client: PoolClient, statement: string): Promise<void> => {
+  const match = CONCURRENT_INDEX.exec(statement);
+  if (!match) {
+    return;
+  }
+
+  const indexName = match[1];
+  const result = await client.query(
+    'SELECT 1 FROM pg_index WHERE indexrelid = to_regclass($1) AND NOT indisvalid',
+    [indexName]
+  );
+
+  if (result.rows.length > 0) {
+    logger.warn(`Dropping invalid index ${indexName} left by failed build`);
+    await client.query(`DROP INDEX CONCURRENTLY IF EXISTS ${indexName}`);
+  }
+};
@@ -0,0 +1,443 @@
+import { Pool, PoolClient } from 'pg';
+import { config } from '../config';
+import { logger } from '../logger';
+import { Backfill } from './backfill';
+import { MigrationDirectives, parseDirectives, setLockTimeout, withLockRetry } from './online';
+
+const PARTITION_NAME = /^users_p(\d{4})_(\d{2})$/;
+
+// pg_constraint confdeltype / confupdtype
+const FK_ACTIONS: Record<string, string> = {
+  a: 'NO ACTION',
+  r: 'RESTRICT',
+  c: 'CASCADE',
+  n: 'SET NULL',
+  d: 'SET DEFAULT'
+};
+
+/**
+ * A foreign key to users(id). Once users is partitioned it must also cover
+ * created_at, the partition key, which createdAtColumn copies from the user.
+ */
+interface UserReference {
+  name: string;
+  table: string;
+  column: string;
+  createdAtColumn: string;
+  onDelete: string;
+  onUpdate: string;
+}
+
+interface MonthRange {
+  name: string;
+  from: string;
+  to: string;
+}
+
+const monthRange = (year: number, month: number): MonthRange => {
+  const start = new Date(Date.UTC(year, month, 1));
+  const end = new Date(Date.UTC(year, month + 1, 1));
+  const pad = (n: number) => String(n).padStart(2, '0');
+  return {
+    name: `users_p${start.getUTCFullYear()}_${pad(start.getUTCMonth() + 1)}`,
+    from: start.toISOString(),
+    to: end.toISOString()
+  };
+};
+
+/**
+ * Monthly range partitioning of users by created_at.
+ *
+ * A partitioned table's unique indexes must include the partition key, so
+ * email uniqueness moves to the user_emails table, kept in sync by trigger.
+ * Its primary key raises the same unique_violation on duplicate emails.
+ */
+export class PartitionManager {
+  private directives: MigrationDirectives;
+
+  constructor(private client: PoolClient, private replica: Pool | null) {
+    this.directives = parseDirectives('');
+  }
+
+  async isPartitioned(table = 'users'): Promise<boolean> {
+    const result = await this.client.query(
+      "SELECT relkind = 'p' AS partitioned FROM pg_class WHERE oid = to_regclass($1)",
+      [table]
+    );
+    return result.rows[0]?.partitioned === true;
+  }
+
+  /**
+   * Convert the plain users table into a partitioned one without blocking
+   * writes for more than the final rename:
+   *   1. create users_partitioned with monthly partitions covering all rows
+   *   2. mirror every write on users into it by trigger
+   *   3. copy existing rows in throttled, checkpointed batches
+   *   4. give each table referencing users a copy of its user's created_at
+   *   5. swap the table names in one short transaction, re-creating the
+   *      foreign keys NOT VALID against the partitioned table
+   *   6. validate those foreign keys without blocking writes
+   * The old table is kept as users_unpartitioned until dropped by hand.
+   */
+  async convert(): Promise<void> {
+    if (await this.isPartitioned()) {
+      logger.info('users is already partitioned');
+      // A run interrupted after the swap still has foreign keys to validate
+      await this.validateReferences();
+      return;
+    }
+
+    const references = await this.userReferences();
+
+    // There is no default partition: a row whose month has no partition
+    // fails to insert, so rows created while the copy runs (mirrored into
+    // users_partitioned) need next month's partition to exist already
+    if (config.migrations.partitions.premakeMonths < 1) {
+      throw new Error('PARTITION_PREMAKE_MONTHS must be at least 1 to partition users; ' +
+        'writes after the current month would have no partition');
+    }
+
+    await this.createPartitionedTable();
+    await this.createPartitionsFor('users_partitioned');
+    await this.installMirrorTrigger();
+
+    const copied = await new Backfill(this.client, this.replica, 'partition_users', {
+      table: 'users',
+      copyTo: 'users_partitioned'
+    }, this.directives).run();
+    logger.info(`Copied ${copied} rows into users_partitioned`);
+
+    await this.prepareReferences(references);
+    await this.swap(references);
+    await this.validateReferences();
+    logger.info('users is now partitioned by created_at; old table kept as users_unpartitioned');
+  }
+
+  /**
+   * Create partitions ahead of time and detach partitions past retention
+   */
+  async maintain(): Promise<void> {
+    if (!(await this.isPartitioned())) {
+      throw new Error('users is not partitioned; run "migrate partition-convert" first');
+    }
+
+    await this.createPartitionsFor('users');
+
+    if (config.migrations.partitions.retentionMonths > 0) {
+      await this.archiveExpiredPartitions();
+    }
+  }
+
+  private async createPartitionedTable(): Promise<void> {
+    await this.client.query(`
+      CREATE TABLE IF NOT EXISTS users_partitioned (
+        LIKE users INCLUDING DEFAULTS INCLUDING CONSTRAINTS,
+        PRIMARY KEY (id, created_at)
+      ) PARTITION BY RANGE (created_at);
+
+      -- The indexes users has since migration 0006, over live rows only
+      CREATE INDEX IF NOT EXISTS idx_users_p_created_at ON users_partitioned(created_at DESC) WHERE deleted_at IS NULL;
+      CREATE INDEX IF NOT EXISTS idx_users_p_active_created ON users_partitioned(is_active, created_at DESC)
+        WHERE deleted_at IS NULL;
+      CREATE INDEX IF NOT EXISTS idx_users_p_deleted_at ON users_partitioned(deleted_at) WHERE deleted_at IS NOT NULL;
+
+      CREATE TABLE IF NOT EXISTS user_emails (
+        email VARCHAR(255) PRIMARY KEY,
+        user_id UUID NOT NULL
+      );
+
+      CREATE OR REPLACE FUNCTION sync_user_emails()
+      RETURNS TRIGGER AS $$
+      BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+          DELETE FROM user_emails WHERE email = OLD.email AND user_id = OLD.id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+          INSERT INTO user_emails (email, user_id) VALUES (NEW.email, NEW.id);
+        END IF;
+        RETURN NULL;
+      END;
+      $$ language 'plpgsql';
+
+      DROP TRIGGER IF EXISTS sync_users_emails ON users_partitioned;
+      CREATE TRIGGER sync_users_emails
+        AFTER INSERT OR DELETE OR UPDATE OF email ON users_partitioned
+        FOR EACH ROW
+        EXECUTE FUNCTION sync_user_emails();
+    `);
+  }
+
+  /**
+   * Writes to users during the copy are replayed on users_partitioned.
+   * created_at never changes, so (id, created_at) identifies the copy. A
+   * write racing the backfill batch that copies its row can find that row
+   * only once the batch commits, so the replayed row overwrites it rather
+   * than failing the write on the primary key.
+   */
+  private async installMirrorTrigger(): Promise<void> {
+    const columns = await this.client.query(`
+      SELECT attname AS name FROM pg_attribute
+      WHERE attrelid = 'users'::regclass AND attnum > 0 AND NOT attisdropped
+        AND attname NOT IN ('id', 'created_at')
+      ORDER BY attnum
+    `);
+    const assignments = (columns.rows as { name: string }[])
+      .map(({ name }) => `"${name}" = EXCLUDED."${name}"`)
+      .join(', ');
+
+    await this.client.query(`
+      CREATE OR REPLACE FUNCTION mirror_users_to_partitioned()
+      RETURNS TRIGGER AS $$
+      BEGIN
+        IF TG_OP = 'DELETE' THEN
+          DELETE FROM users_partitioned WHERE id = OLD.id AND created_at = OLD.created_at;
+        ELSE
+          INSERT INTO users_partitioned SELECT (NEW).*
+          ON CONFLICT (id, created_at) DO UPDATE SET ${assignments};
+        END IF;
+        RETURN NULL;
+      END;
+      $$ language 'plpgsql';
+    `);
+
+    await withLockRetry(this.directives, async () => {
+      await setLockTimeout(this.client, this.directives.lockTimeout);
+      await this.client.query(`
+        DROP TRIGGER IF EXISTS mirror_users_partitioned ON users;
+        CREATE TRIGGER mirror_users_partitioned
+          AFTER INSERT OR UPDATE OR DELETE ON users
+          FOR EACH ROW
+          EXECUTE FUNCTION mirror_users_to_partitioned();
+      `);
+    });
+  }
+
+  /**
+   * Foreign keys to users(id) would follow the renamed old table, and a
+   * partitioned users has no unique index on id alone for them to reference;
+   * each is re-created on (id, created_at) in swap()
+   */
+  private async userReferences(): Promise<UserReference[]> {
+    const result = await this.client.query(`
+      SELECT c.conname AS name, c.conrelid::regclass::text AS table_name,
+             c.confdeltype AS on_delete, c.confupdtype AS on_update,
+             ARRAY(SELECT a.attname FROM unnest(c.conkey) AS k
+                   JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = k)::text[] AS columns,
+             ARRAY(SELECT a.attname FROM unnest(c.confkey) AS k
+                   JOIN pg_attribute a ON a.attrelid = c.confrelid AND a.attnum = k)::text[] AS referenced
+      FROM pg_constraint c
+      WHERE c.contype = 'f' AND c.confrelid = 'users'::regclass
+    `);
+
+    return result.rows.map((row) => {
+      if (row.columns.length !== 1 || row.referenced.join() !== 'id') {
+        throw new Error(`Cannot partition users: ${row.table_name}.${row.name} does not reference users(id) alone`);
+      }
+      const column: string = row.columns[0];
+      return {
+        name: row.name,
+        table: row.table_name,
+        column,
+        createdAtColumn: `${column.replace(/_id$/, '')}_created_at`,
+        onDelete: FK_ACTIONS[row.on_delete],
+        onUpdate: FK_ACTIONS[row.on_update]
+      };
+    });
+  }
+
+  /**
+   * Add each referencing table's created_at copy, filled by trigger on every
+   * write from here on and backfilled for existing rows. created_at never
+   * changes, so a filled copy stays correct.
+   */
+  private async prepareReferences(references: UserReference[]): Promise<void> {
+    if (references.length === 0) {
+      return;
+    }
+
+    await this.client.query(`
+      CREATE OR REPLACE FUNCTION users_reference_created_at()
+      RETURNS TRIGGER AS $$
+      BEGIN
+        -- TG_ARGV: the column referencing users(id), and its created_at copy
+        NEW := jsonb_populate_record(NEW, jsonb_build_object(TG_ARGV[1],
+          (SELECT created_at FROM users WHERE id = (to_jsonb(NEW) ->> TG_ARGV[0])::uuid)));
+        RETURN NEW;
+      END;
+      $$ language 'plpgsql';
+    `);
+
+    for (const { table, column, createdAtColumn } of references) {
+      // One statement batch, so no row is written between the two
+      await withLockRetry(this.directives, async () => {
+        await setLockTimeout(this.client, this.directives.lockTimeout);
+        await this.client.query(`
+          ALTER TABLE ${table} ADD COLUMN IF NOT EXISTS ${createdAtColumn} TIMESTAMP WITH TIME ZONE;
+          DROP TRIGGER IF EXISTS ${table}_${createdAtColumn} ON ${table};
+          CREATE TRIGGER ${table}_${createdAtColumn}
+            BEFORE INSERT OR UPDATE OF ${column} ON ${table}
+            FOR EACH ROW
+            EXECUTE FUNCTION users_reference_created_at('${column}', '${createdAtColumn}');
+        `);
+      });
+      await this.client.query('RESET lock_timeout');
+
+      const filled = await new Backfill(this.client, this.replica, `partition_users_${table}_${createdAtColumn}`, {
+        table,
+        set: `${createdAtColumn} = (SELECT created_at FROM users WHERE users.id = target.${column})`,
+        where: `${createdAtColumn} IS NULL AND ${column} IS NOT NULL`
+      }, this.directives).run();
+      logger.info(`Filled ${table}.${createdAtColumn} on ${filled} rows`);
+    }
+  }
+
+  /**
+   * Check existing rows against the foreign keys swap() re-created NOT
+   * VALID. VALIDATE CONSTRAINT takes SHARE UPDATE EXCLUSIVE on the
+   * referencing table, so writes carry on while it scans.
+   */
+  private async validateReferences(): Promise<void> {
+    const result = await this.client.query(`
+      SELECT conname AS name, conrelid::regclass::text AS table_name
+      FROM pg_constraint
+      WHERE contype = 'f' AND confrelid = 'users'::regclass AND NOT convalidated
+    `);
+
+    for (const { name, table_name: table } of result.rows as { name: string; table_name: string }[]) {
+      logger.info(`Validating foreign key ${table}.${name}`);
+      await this.client.query(`ALTER TABLE ${table} VALIDATE CONSTRAINT ${name}`);
+    }
+  }
+
+  private async swap(references: UserReference[]): Promise<void> {
+    await withLockRetry(this.directives, async () => {
+      await this.client.query('BEGIN');
+      try {
+        await setLockTimeout(this.client, this.directives.lockTimeout, true);
+        await this.client.query(`
+          LOCK TABLE users IN ACCESS EXCLUSIVE MODE;
+          DROP TRIGGER mirror_users_partitioned ON users;
+        `);
+
+        // The remaining triggers (updated_at) move to the partitioned table;
+        // left on users_unpartitioned they would fire on its cleanup. Foreign
+        // key triggers are internal and are re-created with the keys below.
+        const triggers = await this.client.query(`
+          SELECT tgname AS name, pg_get_triggerdef(oid) AS definition
+          FROM pg_trigger
+          WHERE tgrelid = 'users'::regclass AND NOT tgisinternal
+        `);
+        for (const { name } of triggers.rows as { name: string }[]) {
+          await this.client.query(`DROP TRIGGER ${name} ON users`);
+        }
+
+        await this.client.query(`
+          ALTER TABLE users RENAME TO users_unpartitioned;
+          ALTER TABLE users_partitioned RENAME TO users;
+        `);
+
+        // Definitions name public.users, which is now the partitioned table
+        for (const { definition } of triggers.rows as { definition: string }[]) {
+          await this.client.query(definition);
+        }
+
+        // Foreign keys followed the rename to users_unpartitioned. NOT VALID
+        // (PostgreSQL 12+ when referencing a partitioned table) skips
+        // scanning the referencing table while users is locked; MATCH FULL
+        // rejects a user id whose created_at copy is missing.
+        for (const ref of references) {
+          await this.client.query(`
+            ALTER TABLE ${ref.table} DROP CONSTRAINT ${ref.name};
+            ALTER TABLE ${ref.table} ADD CONSTRAINT ${ref.name}
+              FOREIGN KEY (${ref.column}, ${ref.createdAtColumn}) REFERENCES users (id, created_at) MATCH FULL
+              ON DELETE ${ref.onDelete} ON UPDATE ${ref.onUpdate} NOT VALID;
+          `);
+        }
+        await this.client.query('COMMIT');
+      } catch (error) {
+        await this.client.query('ROLLBACK');
+        throw error;
+      }
+    });
+
+    await this.client.query('DROP FUNCTION IF EXISTS mirror_users_to_partitioned()');
+  }
+
+  /**
+   * Ensure monthly partitions through premakeMonths beyond the newest row or
+   * today, whichever is later. During conversion coverage starts at the
+   * oldest row in users; afterwards at the current month.
+   */
+  private async createPartitionsFor(parent: string): Promise<void> {
+    const result = await this.client.query(`
+      SELECT COALESCE(MIN(created_at), NOW()) AS oldest,
+             GREATEST(COALESCE(MAX(created_at), NOW()), NOW()) AS newest
+      FROM users
+    `);
+
+    const oldest: Date = result.rows[0].oldest;
+    const newest: Date = result.rows[0].newest;
+    const months: MonthRange[] = [];
+
+    const start = parent === 'users' ? new Date() : oldest;
+    const endMonth = newest.getUTCFullYear() * 12 + newest.getUTCMonth() + config.migrations.partitions.premakeMonths;
+
+    for (let m = start.getUTCFullYear() * 12 + start.getUTCMonth(); m <= endMonth; m++) {
+      months.push(monthRange(Math.floor(m / 12), m % 12));
+    }
+
+    for (const month of months) {
+      await withLockRetry(this.directives, async () => {
+        await setLockTimeout(this.client, this.directives.lockTimeout);
+        await this.client.query(
+          `CREATE TABLE IF NOT EXISTS ${month.name} PARTITION OF ${parent} ` +
+          `FOR VALUES FROM ('${month.from}') TO ('${month.to}')`
+        );
+      });
+    }
+
+    await this.client.query('RESET lock_timeout');
+    logger.info(`Partitions ensured through ${months[months.length - 1]?.name}`);
+  }
+
+  /**
+   * Detach partitions older than retentionMonths and move them to the
+   * archive schema, where they can be dumped to cold storage and dropped.
+   * DETACH ... CONCURRENTLY (PostgreSQL 14+) does not block queries on users.
+   */
+  private async archiveExpiredPartitions(): Promise<void> {
+    const now = new Date();
+    const cutoff = now.getUTCFullYear() * 12 + now.getUTCMonth() - config.migrations.partitions.retentionMonths;
+
+    const result = await this.client.query(`
+      SELECT child.relname AS name
+      FROM pg_inherits
+      JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+      JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+      WHERE parent.oid = 'users'::regclass
+      ORDER BY child.relname
+    `);
+
+    await this.client.query('CREATE SCHEMA IF NOT EXISTS archive');
+
+    for (const { name } of result.rows as { name: string }[]) {
+      const match = PARTITION_NAME.exec(name);
+      if (!match || parseInt(match[1], 10) * 12 + parseInt(match[2], 10) - 1 >= cutoff) {
+        continue;
+      }
+
+      logger.info(`Archiving partition ${name}`);
+      await withLockRetry(this.directives, async () => {
+        await setLockTimeout(this.client, this.directives.lockTimeout);
+        await this.client.query(`ALTER TABLE users DETACH PARTITION ${name} CONCURRENTLY`);
+      });
+
+      await this.client.query(`
+        DELETE FROM user_emails e USING ${name} a WHERE e.email = a.email AND e.user_id = a.id;
+        ALTER TABLE ${name} SET SCHEMA archive;
+      `);
+    }
+
+    await this.client.query('RESET lock_timeout');
+  }
+}
@@ -0,0 +1,87 @@
+import http from 'http';
+import { AddressInfo } from 'net';
+
+jest.mock('./database', () => ({ db: { primary: { query: jest.fn() } } }));
+
+import { OutboxEvent, webhookHandler } from './outbox';
+
+const event: OutboxEvent = {
+  id: '42',
+  type: 'user.created',
+  aggregateId: '7f1c0d2e-8a51-4c3b-9a0e-2b7f6c1d9e10',
+  payload: { id: '7f1c0d2e-8a51-4c3b-9a0e-2b7f6c1d9e10', email: 'jane@example.com' },
+  attempts: 0,
+  createdAt: '2024-01-02T03:04:05.678Z'
+};
+
+interface Received {
+  headers: http.IncomingHttpHeaders;
+  body: any;
+}
+
+// A receiver answering with status after delayMs, recording what it was sent
+const receiver = async (status: number, delayMs = 0) => {
+  const received: Received[] = [];
+  const server = http.createServer((req, res) => {
+    const chunks: Buffer[] = [];
+    req.on('data', (chunk: Buffer) => chunks.push(chunk));
+    req.on('end', () => {
+      received.push({ headers: req.headers, body: JSON.parse(Buffer.concat(chunks).toString()) });
+      setTimeout(() => res.writeHead(status).end(), delayMs);
+    });
+  });
+  server.listen(0);
+  await new Promise((resolve) => server.once('listening', resolve));
+  const { port } = server.address() as AddressInfo;
+
+  return {
+    url: `http://127.0.0.1:${port}/events`,
+    received,
+    close: () => {
+      server.closeAllConnections();
+      return new Promise((resolve) => server.close(resolve));
+    }
+  };
+};
+
+describe('webhookHandler', () => {
+  const servers: Array<{ close: () => Promise<unknown> }> = [];
+  const start = async (status: number, delayMs?: number) => {
+    const server = await receiver(status, delayMs);
+    servers.push(server);
+    return server;
+  };
+
+  afterEach(async () => {
+    await Promise.all(servers.splice(0).map((server) => server.close()));
+  });
+
+  it('POSTs the event as JSON keyed by its id', async () => {
+    const { url, received } = await start(204);
+
+    await webhookHandler(url, 1000)(event);
+
+    expect(received).toHaveLength(1);
+    expect(received[0].headers['content-type']).toBe('application/json');
+    expect(received[0].headers['idempotency-key']).toBe('42');
+    expect(received[0].body).toEqual({
+      id: '42',
+      type: 'user.created',
+      aggregateId: event.aggregateId,
+      payload: event.payload,
+      createdAt: event.createdAt
+    });
+  });
+
+  it.each([400, 500, 503])('fails the event on %s', async (status) => {
+    const { url } = await start(status);
+
+    await expect(webhookHandler(url, 1000)(event)).rejects.toThrow(`Webhook responded ${status}`);
+  });
+
+  it('fails the event when the receiver is too slow', async () => {
+    const { url } = await start(200, 500);
+
+    await expect(webhookHandler(url, 50)(event)).rejects.toThrow('Webhook timed out after 50ms');
+  });
+});
@@ -0,0 +1,254 @@
+import http from 'http';
+import https from 'https';
+import { QueryResult } from 'pg';
+import { config } from './config';
+import { db } from './database';
+import { logger } from './logger';
+import { SqlQuery } from './user.queries';
+
+export interface OutboxEvent {
+  id: string;
+  type: string;
+  aggregateId: string;
+  payload: any;
+  attempts: number;
+  createdAt: Date | string;
+}
+
+export type OutboxHandler = (event: OutboxEvent) => Promise<void>;
+
+// Retries back off exponentially up to an hour apart
+const MAX_RETRY_DELAY_MS = 60 * 60 * 1000;
+
+// Handlers registered for this type receive every event
+export const ALL_EVENTS = '*';
+
+/**
+ * Wraps a write that RETURNs rows with an id in a CTE that also inserts one
+ * outbox event per returned row, carrying the row as its payload. One
+ * statement, so the event commits or rolls back with the change at no
+ * extra round trip.
+ */
+export const withOutboxEvent = (query: SqlQuery, eventType: string): SqlQuery => ({
+  text: `
+      WITH changed AS (${query.text}),
+      event AS (
+        INSERT INTO outbox (event_type, aggregate_id, payload)
+        SELECT $${query.values.length + 1}, changed.id, row_to_json(changed)::jsonb FROM changed
+      )
+      SELECT * FROM changed
+    `,
+  values: [...query.values, eventType]
+});
+
+/**
+ * Leases up to limit due events by moving their available_at leaseMs ahead,
+ * in one autocommitted statement; rows another worker is claiming at the
+ * same moment are skipped rather than waited on. Events not marked done or
+ * failed when the lease runs out (the worker died) become due again.
+ */
+const claimEventsQuery = (limit: number, leaseMs: number): SqlQuery => ({
+  text: `
+      WITH claimed AS (
+        UPDATE outbox o
+        SET available_at = NOW() + $2 * INTERVAL '1 millisecond'
+        FROM (
+          SELECT id FROM outbox
+          WHERE available_at <= NOW()
+          ORDER BY available_at, id
+          LIMIT $1
+          FOR UPDATE SKIP LOCKED
+        ) due
+        WHERE o.id = due.id
+        RETURNING o.id, o.event_type as "type", o.aggregate_id as "aggregateId", o.payload,
+                  o.attempts, o.created_at as "createdAt"
+      )
+      SELECT * FROM claimed ORDER BY id
+    `,
+  values: [limit, leaseMs]
+});
+
+const deleteEventsQuery = (ids: string[]): SqlQuery => ({
+  text: 'DELETE FROM outbox WHERE id = ANY($1::bigint[])',
+  values: [ids]
+});
+
+const retryEventsQuery = (
+  failures: Array<{ id: string; error: string; delayMs: number }>,
+  maxAttempts: number
+): SqlQuery => ({
+  text: `
+      UPDATE outbox o
+      SET attempts = o.attempts + 1,
+          last_error = f.error,
+          available_at = CASE WHEN o.attempts + 1 >= $4 THEN 'infinity'
+                              ELSE NOW() + f.delay_ms * INTERVAL '1 millisecond' END
+      FROM unnest($1::bigint[], $2::text[], $3::int[]) AS f(id, error, delay_ms)
+      WHERE o.id = f.id
+    `,
+  values: [
+    failures.map((f) => f.id),
+    failures.map((f) => f.error),
+    failures.map((f) => f.delayMs),
+    maxAttempts
+  ]
+});
+
+/**
+ * POSTs each event as JSON to url, with the event id as Idempotency-Key so
+ * the receiver can drop redeliveries. Anything but a 2xx within timeoutMs
+ * fails the event, which is then retried.
+ */
+export const webhookHandler = (url: string, timeoutMs: number): OutboxHandler => {
+  const target = new URL(url);
+  const transport = target.protocol === 'https:' ? https : http;
+
+  return (event) => new Promise((resolve, reject) => {
+    const body = JSON.stringify({
+      id: event.id,
+      type: event.type,
+      aggregateId: event.aggregateId,
+      payload: event.payload,
+      createdAt: event.createdAt
+    });
+
+    const req = transport.request(target, {
+      method: 'POST',
+      timeout: timeoutMs,
+      headers: {
+        'Content-Type': 'application/json',
+        'Content-Length': Buffer.byteLength(body),
+        'Idempotency-Key': event.id
+      }
+    }, (res) => {
+      res.resume();
+      const status = res.statusCode ?? 0;
+      if (status >= 200 && status < 300) {
+        resolve();
+      } else {
+        reject(new Error(`Webhook responded ${status}`));
+      }
+    });
+
+    req.on('timeout', () => req.destroy(new Error(`Webhook timed out after ${timeoutMs}ms`)));
+    req.on('error', reject);
+    req.end(body);
+  });
+};
+
+/**
+ * Delivers outbox events to the handlers registered for their type, and to
+ * those registered for ALL_EVENTS. A
+ * batch is leased in one short statement, delivered with no transaction or
+ * connection held, then delivered events are deleted and failed ones are
+ * retried later with exponential backoff, parked once out of attempts.
+ * Delivery is at least once (a crash, or a batch outlasting its lease,
+ * redelivers), so handlers must be idempotent. Events with no handler are
+ * simply deleted.
+ */
+export class OutboxWorker {
+  private handlers = new Map<string, OutboxHandler[]>();
+  private timer?: NodeJS.Timeout;
+  private running?: Promise<void>;
+  private stopped = true;
+
+  public on(eventType: string, handler: OutboxHandler): this {
+    this.handlers.set(eventType, [...(this.handlers.get(eventType) ?? []), handler]);
+    return this;
+  }
+
+  public get hasHandlers(): boolean {
+    return this.handlers.size > 0;
+  }
+
+  public start(): void {
+    const { batchSize, pollInterval } = config.outbox;
+    logger.info(`Outbox worker started (batch ${batchSize}, poll ${pollInterval}ms)`);
+    this.stopped = false;
+    this.schedule(0);
+  }
+
+  /**
+   * Stop polling and wait for the batch in progress to finish
+   */
+  public async stop(): Promise<void> {
+    this.stopped = true;
+    if (this.timer) {
+      clearTimeout(this.timer);
+      this.timer = undefined;
+    }
+    await this.running;
+  }
+
+  /**
+   * Deliver one batch of due events; returns how many were claimed
+   */
+  public async drain(): Promise<number> {
+    const { batchSize, maxAttempts, retryBaseDelay, lease } = config.outbox;
+
+    const { rows: events }: QueryResult<OutboxEvent> = await db.primary.query(claimEventsQuery(batchSize, lease));
+    if (events.length === 0) {
+      return 0;
+    }
+
+    const delivered: string[] = [];
+    const failures: Array<{ id: string; error: string; delayMs: number }> = [];
+
+    for (const event of events) {
+      const handlers = [...(this.handlers.get(event.type) ?? []), ...(this.handlers.get(ALL_EVENTS) ?? [])];
+      try {
+        for (const handler of handlers) {
+          await handler(event);
+        }
+        delivered.push(event.id);
+      } catch (error) {
+        const message = error instanceof Error ? error.message : String(error);
+        if (event.attempts + 1 >= maxAttempts) {
+          logger.error(`Outbox event ${event.id} (${event.type}) parked after ${maxAttempts} attempts: ${message}`);
+        } else {
+          logger.warn(`Outbox event ${event.id} (${event.type}) failed, will retry: ${message}`);
+        }
+        failures.push({
+          id: event.id,
+          error: message,
+          delayMs: Math.min(MAX_RETRY_DELAY_MS, retryBaseDelay * 2 ** event.attempts)
+        });
+      }
+    }
+
+    // Each is one statement; a failure here leaves the events leased, so
+    // they are redelivered once the lease runs out
+    if (delivered.length > 0) {
+      await db.primary.query(deleteEventsQuery(delivered));
+    }
+    if (failures.length > 0) {
+      await db.primary.query(retryEventsQuery(failures, maxAttempts));
+    }
+
+    logger.debug(`Outbox batch: ${delivered.length} delivered, ${failures.length} failed`);
+    return events.length;
+  }
+
+  private schedule(delay: number): void {
+    this.timer = setTimeout(() => {
+      this.running = this.tick();
+    }, delay);
+    this.timer.unref();
+  }
+
+  private async tick(): Promise<void> {
+    let claimed = 0;
+    try {
+      claimed = await this.drain();
+    } catch (error) {
+      logger.error('Outbox batch failed:', error);
+    }
+
+    // A full batch suggests a backlog, so the next one starts right away
+    if (!this.stopped) {
+      this.schedule(claimed >= config.outbox.batchSize ? 0 : config.outbox.pollInterval);
+    }
+  }
+}
+
+export const outboxWorker = new OutboxWorker();
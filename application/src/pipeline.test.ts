@@ -0,0 +1,97 @@
+import { FieldDef } from 'pg';
+import { Pipeline } from './pipeline';
+
+const field = (name: string, dataTypeID: number): FieldDef => ({
+  name,
+  dataTypeID,
+  tableID: 0,
+  columnID: 0,
+  dataTypeSize: -1,
+  dataTypeModifier: -1,
+  format: 'text'
+});
+
+const connection = () => {
+  const sent: Array<[string, unknown]> = [];
+  const record = (message: string) => (arg?: unknown) => { sent.push([message, arg]); };
+  return {
+    sent,
+    parse: record('parse'),
+    bind: record('bind'),
+    describe: record('describe'),
+    execute: record('execute'),
+    sync: record('sync')
+  };
+};
+
+const INT4 = 23;
+const TEXT = 25;
+const parsers = (oid: number) => (oid === INT4 ? (value: string) => parseInt(value, 10) : (value: string) => value);
+
+describe('Pipeline', () => {
+  it('sends every statement then a single Sync', () => {
+    const conn = connection();
+    const pipeline = new Pipeline([
+      { text: 'SELECT $1::int AS n', values: [1] },
+      { text: 'UPDATE users SET is_active = $1 WHERE id = $2', values: [false, 'abc'] }
+    ], parsers);
+
+    expect(pipeline.submit(conn)).toBeUndefined();
+    expect(conn.sent.map(([message]) => message)).toEqual([
+      'parse', 'bind', 'describe', 'execute',
+      'parse', 'bind', 'describe', 'execute',
+      'sync'
+    ]);
+    expect(conn.sent[1][1]).toEqual({ values: ['1'] });
+    expect(conn.sent[5][1]).toEqual({ values: ['false', 'abc'] });
+  });
+
+  it('sends parameters as Postgres text', () => {
+    const conn = connection();
+    const at = new Date('2024-01-02T03:04:05.678Z');
+    const bytes = Buffer.from([1, 2]);
+    new Pipeline([{ text: 'SELECT $1, $2, $3, $4', values: [at, null, undefined, bytes] }], parsers).submit(conn);
+
+    expect(conn.sent[1][1]).toEqual({ values: ['2024-01-02T03:04:05.678Z', null, null, bytes] });
+  });
+
+  it('refuses object parameters before sending anything', () => {
+    const conn = connection();
+    const error = new Pipeline([
+      { text: 'SELECT 1', values: [] },
+      { text: 'SELECT $1', values: [{ nested: true }] }
+    ], parsers).submit(conn);
+
+    expect(error).toBeInstanceOf(TypeError);
+    expect(conn.sent).toEqual([]);
+  });
+
+  it('resolves with one parsed result per statement, in order', async () => {
+    const pipeline = new Pipeline([], parsers);
+
+    pipeline.handleRowDescription({ fields: [field('n', INT4), field('name', TEXT)] });
+    pipeline.handleDataRow({ fields: ['1', 'one'] });
+    pipeline.handleDataRow({ fields: ['2', null] });
+    pipeline.handleCommandComplete({ text: 'SELECT 2' });
+    pipeline.handleCommandComplete({ text: 'INSERT 0 1' });
+    pipeline.handleEmptyQuery();
+    pipeline.handleReadyForQuery();
+
+    const [select, insert, empty] = await pipeline.done;
+    expect(select).toMatchObject({ command: 'SELECT', rowCount: 2, rows: [{ n: 1, name: 'one' }, { n: 2, name: null }] });
+    expect(select.fields.map((f) => f.name)).toEqual(['n', 'name']);
+    expect(insert).toMatchObject({ command: 'INSERT', rowCount: 1, rows: [], fields: [] });
+    expect(empty).toMatchObject({ command: '', rowCount: 0, rows: [] });
+  });
+
+  it('rejects with the first error and ignores the ReadyForQuery after it', async () => {
+    const pipeline = new Pipeline([], parsers);
+    const error = new Error('duplicate key value violates unique constraint');
+
+    pipeline.handleCommandComplete({ text: 'UPDATE 1' });
+    pipeline.handleError(error);
+    pipeline.handleReadyForQuery();
+
+    await expect(pipeline.done).rejects.toBe(error);
+  });
+});
@@ -0,0 +1,146 @@
+import { FieldDef, QueryConfig, QueryResult } from 'pg';
+
+type TypeParser = (value: string) => any;
+
+// The parts of pg's Connection a submittable writes to
+interface ProtocolConnection {
+  parse(query: { text: string; name?: string; types?: number[] }): void;
+  bind(config: { portal?: string; statement?: string; values?: any[] }): void;
+  describe(msg: { type: 'P' | 'S'; name?: string }): void;
+  execute(config: { portal?: string; rows?: number }): void;
+  sync(): void;
+}
+
+interface RowDescriptionMessage {
+  fields: FieldDef[];
+}
+
+interface DataRowMessage {
+  fields: Array<string | null>;
+}
+
+interface CommandCompleteMessage {
+  text: string;
+}
+
+/**
+ * Parameters as Postgres text. pg's own mapping is internal to its Query
+ * class; statements sent here only use scalars.
+ */
+const prepareValue = (value: unknown): string | Buffer | null => {
+  if (value === null || value === undefined) {
+    return null;
+  }
+  if (Buffer.isBuffer(value)) {
+    return value;
+  }
+  if (value instanceof Date) {
+    return value.toISOString();
+  }
+  if (typeof value === 'object') {
+    throw new TypeError('Pipelined statements take scalar parameters only');
+  }
+  return String(value);
+};
+
+/**
+ * Several statements sent on one connection in a single write: Parse, Bind,
+ * Describe and Execute for each, then one Sync, so the whole batch costs one
+ * round trip instead of one per statement. Results come back in order.
+ *
+ * Statements up to the Sync form one implicit transaction: if any fails,
+ * Postgres skips the rest and rolls back those before it, and the pipeline
+ * rejects with that error. Pass it to client.query like pg-cursor and
+ * await done.
+ */
+export class Pipeline {
+  public readonly done: Promise<QueryResult[]>;
+  // Read by client.query, which enforces it and wraps callback to clear the timer
+  public query_timeout?: number;
+  public callback!: (error: Error | null, results?: QueryResult[]) => void;
+  private results: QueryResult[] = [];
+  private current?: { fields: FieldDef[]; parsers: TypeParser[]; rows: any[] };
+  private settled = false;
+
+  constructor(
+    private queries: QueryConfig[],
+    private getTypeParser: (oid: number, format: 'text') => TypeParser
+  ) {
+    this.done = new Promise((resolve, reject) => {
+      this.callback = (error, results) => (error ? reject(error) : resolve(results as QueryResult[]));
+    });
+  }
+
+  // Called by the client when the connection is free; returning an Error
+  // fails the pipeline without anything having been sent
+  submit(connection: ProtocolConnection): Error | undefined {
+    let prepared: Array<{ text: string; values: Array<string | Buffer | null> }>;
+    try {
+      prepared = this.queries.map(({ text, values }) => ({ text, values: (values ?? []).map(prepareValue) }));
+    } catch (error) {
+      return error as Error;
+    }
+
+    for (const { text, values } of prepared) {
+      connection.parse({ text });
+      connection.bind({ values });
+      connection.describe({ type: 'P' });
+      connection.execute({ rows: 0 });
+    }
+    connection.sync();
+    return undefined;
+  }
+
+  handleRowDescription(msg: RowDescriptionMessage): void {
+    this.current = {
+      fields: msg.fields,
+      parsers: msg.fields.map((field) => this.getTypeParser(field.dataTypeID, 'text')),
+      rows: []
+    };
+  }
+
+  handleDataRow(msg: DataRowMessage): void {
+    const { fields, parsers, rows } = this.current as NonNullable<Pipeline['current']>;
+    const row: Record<string, any> = {};
+    for (let i = 0; i < fields.length; i++) {
+      const value = msg.fields[i];
+      row[fields[i].name] = value === null ? null : parsers[i](value);
+    }
+    rows.push(row);
+  }
+
+  handleCommandComplete(msg: CommandCompleteMessage): void {
+    // e.g. 'SELECT 20', 'UPDATE 1', 'INSERT 0 1'
+    const parts = msg.text.split(' ');
+    const count = parseInt(parts[parts.length - 1], 10);
+
+    this.results.push({
+      command: parts[0],
+      rowCount: isNaN(count) ? 0 : count,
+      oid: 0,
+      fields: this.current?.fields ?? [],
+      rows: this.current?.rows ?? []
+    });
+    this.current = undefined;
+  }
+
+  handleEmptyQuery(): void {
+    this.results.push({ command: '', rowCount: 0, oid: 0, fields: [], rows: [] });
+  }
+
+  handleError(error: Error): void {
+    this.finish(error);
+  }
+
+  handleReadyForQuery(): void {
+    this.finish(null, this.results);
+  }
+
+  // After an error Postgres still sends ReadyForQuery; only the first counts
+  private finish(error: Error | null, results?: QueryResult[]): void {
+    if (!this.settled) {
+      this.settled = true;
+      this.callback(error, results);
+    }
+  }
+}
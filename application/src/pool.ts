@@ -0,0 +1,398 @@
+import { Connection, Pool, PoolClient, PoolConfig, QueryConfig, QueryResult } from 'pg';
+import { config } from './config';
+import { logger } from './logger';
+import { Deadline, currentDeadline } from './deadline';
+import { Pipeline } from './pipeline';
+
+export type PoolRole = 'primary' | 'replica';
+
+export type PoolerMode = 'none' | 'transaction';
+
+export interface PoolerOptions {
+  mode: PoolerMode;
+  preparedStatements: boolean;
+}
+
+// The parts of pg's Connection used to send a CancelRequest
+interface CancelConnection {
+  connect(port: number, host: string): void;
+  requestSsl(): void;
+  cancel(processID: number, secretKey: number): void;
+  on(event: string, listener: (...args: any[]) => void): void;
+}
+
+export interface PoolLimits {
+  min: number;
+  max: number;
+}
+
+export interface PoolStats {
+  role: PoolRole;
+  size: number;
+  idle: number;
+  waiting: number;
+  max: number;
+  limits: PoolLimits;
+  acquisitions: number;
+  avgQueueWaitMs: number;
+  maxQueueWaitMs: number;
+  avgHoldMs: number;
+  peakInUse: number;
+}
+
+interface StatsWindow {
+  acquisitions: number;
+  totalQueueWait: number;
+  maxQueueWait: number;
+  releases: number;
+  totalHold: number;
+  peakInUse: number;
+}
+
+const emptyWindow = (): StatsWindow => ({
+  acquisitions: 0,
+  totalQueueWait: 0,
+  maxQueueWait: 0,
+  releases: 0,
+  totalHold: 0,
+  peakInUse: 0
+});
+
+// Passed to release() so pg-pool destroys a connection that was sent a cancel
+const cancelledError = (): Error => new Error('Connection was sent a cancel request');
+
+/**
+ * pg Pool that measures how long callers wait for a connection and how long
+ * each connection is held. Hold time stands in for DB-side latency.
+ */
+export class MeteredPool extends Pool {
+  public readonly role: PoolRole;
+  public readonly limits: PoolLimits;
+  private window: StatsWindow = emptyWindow();
+  private lastWindow: StatsWindow = emptyWindow();
+  private checkedOutAt = new WeakMap<PoolClient, number>();
+
+  constructor(
+    role: PoolRole,
+    limits: PoolLimits,
+    poolConfig: PoolConfig,
+    private pooler: PoolerOptions = { mode: 'none', preparedStatements: true }
+  ) {
+    super(poolConfig);
+    this.role = role;
+    this.limits = limits;
+
+    if (pooler.mode === 'transaction' && !pooler.preparedStatements) {
+      // Consecutive transactions may run on different server connections, so
+      // a statement pg prepared on one may not exist on the next. Unnamed
+      // statements are parsed with every execution and never outlive it.
+      this.on('connect', (client) => {
+        const query = client.query.bind(client) as (...args: any[]) => any;
+        client.query = ((queryConfig: any, ...rest: any[]) => {
+          const named = queryConfig?.name && typeof queryConfig.submit !== 'function';
+          return query(named ? { ...queryConfig, name: undefined } : queryConfig, ...rest);
+        }) as PoolClient['query'];
+      });
+    }
+
+    this.on('acquire', (client) => {
+      this.checkedOutAt.set(client, Date.now());
+      this.window.peakInUse = Math.max(this.window.peakInUse, this.totalCount - this.idleCount);
+    });
+
+    this.on('release', (_err, client) => {
+      const startedAt = this.checkedOutAt.get(client);
+      if (startedAt !== undefined) {
+        this.window.releases++;
+        this.window.totalHold += Date.now() - startedAt;
+        this.checkedOutAt.delete(client);
+      }
+    });
+  }
+
+  // Pool.query() checks out through connect(), so this covers both paths
+  connect(callback?: any): any {
+    const startedAt = Date.now();
+
+    if (callback) {
+      return super.connect((err: any, client: any, done: any) => {
+        if (!err) {
+          this.recordQueueWait(Date.now() - startedAt);
+        }
+        callback(err, client, done);
+      });
+    }
+
+    return super.connect().then((client) => {
+      this.recordQueueWait(Date.now() - startedAt);
+      return client;
+    });
+  }
+
+  /**
+   * Promise-style queries issued inside a request deadline get a timeout
+   * matching the time left, and their backend is cancelled if the deadline
+   * aborts (timeout or client disconnect). Everything else goes straight to pg.
+   */
+  query(...args: any[]): any {
+    const deadline = currentDeadline();
+    const [queryTextOrConfig, values] = args;
+
+    if (
+      !deadline ||
+      typeof args[args.length - 1] === 'function' ||
+      typeof queryTextOrConfig?.submit === 'function'
+    ) {
+      return (super.query as (...params: any[]) => any)(...args);
+    }
+
+    return this.queryWithDeadline(deadline, queryTextOrConfig, values);
+  }
+
+  /**
+   * Checks out one connection for fn under the current request deadline: its
+   * backend is cancelled if the deadline aborts while fn runs, and it is
+   * discarded rather than reused once a cancel was sent, or if fn fails after
+   * the deadline expired or calls discard() (e.g. a connection left
+   * mid-transaction). A deadline that expires while the connection is being
+   * acquired returns it untouched. Connections that errored are removed by
+   * pg-pool itself on release.
+   */
+  public async withClient<T>(fn: (client: PoolClient, discard: () => void) => Promise<T>): Promise<T> {
+    const deadline = currentDeadline();
+    deadline?.throwIfExpired();
+
+    const client = await this.connect() as PoolClient;
+    if (deadline?.expired) {
+      client.release();
+      deadline.throwIfExpired();
+    }
+
+    let cancelled = false;
+    const cancel = () => {
+      cancelled = true;
+      this.cancel(client);
+    };
+    deadline?.signal.addEventListener('abort', cancel, { once: true });
+
+    let failed: Error | undefined;
+    let discarded = false;
+    try {
+      return await fn(client, () => {
+        discarded = true;
+      });
+    } catch (error) {
+      failed = error as Error;
+      deadline?.throwIfExpired();
+      throw error;
+    } finally {
+      deadline?.signal.removeEventListener('abort', cancel);
+      const reusable = !cancelled && !(failed && (discarded || deadline?.expired));
+      client.release(reusable ? undefined : failed ?? cancelledError());
+    }
+  }
+
+  /**
+   * Runs the statements on one connection in one round trip (see Pipeline),
+   * under the current request deadline like query()
+   */
+  public pipeline(queries: QueryConfig[]): Promise<QueryResult[]> {
+    return this.withClient((client) => {
+      const pipeline = new Pipeline(queries, (oid, format) =>
+        (client as unknown as { getTypeParser: (oid: number, format: 'text') => (value: string) => any })
+          .getTypeParser(oid, format)
+      );
+      const deadline = currentDeadline();
+      if (deadline) {
+        pipeline.query_timeout = deadline.remaining();
+      }
+
+      client.query(pipeline);
+      return pipeline.done;
+    });
+  }
+
+  public get maxSize(): number {
+    return this.settings().max as number;
+  }
+
+  public resize(max: number): void {
+    this.settings().max = Math.min(this.limits.max, Math.max(this.limits.min, max));
+  }
+
+  /**
+   * Close the current measurement window and return its stats
+   */
+  public rotateWindow(): PoolStats {
+    this.lastWindow = this.window;
+    this.window = emptyWindow();
+    return this.getStats();
+  }
+
+  public getStats(): PoolStats {
+    const w = this.lastWindow;
+    return {
+      role: this.role,
+      size: this.totalCount,
+      idle: this.idleCount,
+      waiting: this.waitingCount,
+      max: this.maxSize,
+      limits: this.limits,
+      acquisitions: w.acquisitions,
+      avgQueueWaitMs: w.acquisitions ? w.totalQueueWait / w.acquisitions : 0,
+      maxQueueWaitMs: w.maxQueueWait,
+      avgHoldMs: w.releases ? w.totalHold / w.releases : 0,
+      peakInUse: w.peakInUse
+    };
+  }
+
+  /**
+   * Queue wait seen recently: the larger of the last closed window and the
+   * window in progress, so a sudden spike shows up before the next rotation
+   */
+  public recentQueueWaitMs(): number {
+    const current = this.window.acquisitions ? this.window.totalQueueWait / this.window.acquisitions : 0;
+    const last = this.lastWindow.acquisitions ? this.lastWindow.totalQueueWait / this.lastWindow.acquisitions : 0;
+    return Math.max(current, last);
+  }
+
+  public isSaturated(maxQueueWaitMs: number, maxWaiting: number): boolean {
+    return this.waitingCount >= maxWaiting || this.recentQueueWaitMs() > maxQueueWaitMs;
+  }
+
+  private async queryWithDeadline(
+    deadline: Deadline,
+    queryTextOrConfig: string | QueryConfig,
+    values?: any[]
+  ): Promise<QueryResult> {
+    deadline.throwIfExpired();
+
+    const client = await this.connect() as PoolClient;
+    if (deadline.expired) {
+      // Nothing ran on it yet, so the connection is still good
+      client.release();
+      deadline.throwIfExpired();
+    }
+
+    let cancelled = false;
+    const cancel = () => {
+      cancelled = true;
+      this.cancel(client);
+    };
+
+    deadline.signal.addEventListener('abort', cancel, { once: true });
+
+    let failed: Error | undefined;
+    try {
+      const queryConfig = typeof queryTextOrConfig === 'string'
+        ? { text: queryTextOrConfig, values }
+        : { ...queryTextOrConfig, values: values ?? queryTextOrConfig.values };
+
+      return await client.query({ ...queryConfig, query_timeout: deadline.remaining() } as QueryConfig);
+    } catch (error) {
+      failed = error as Error;
+      deadline.throwIfExpired();
+      throw error;
+    } finally {
+      deadline.signal.removeEventListener('abort', cancel);
+      // A cancel may land after the query finished, so the connection is not
+      // reused: on the next checkout it would interrupt someone else's query
+      const reusable = !cancelled && !(failed && deadline.expired);
+      client.release(reusable ? undefined : failed ?? cancelledError());
+    }
+  }
+
+  /**
+   * Cancel over the protocol: a new connection outside the pool carrying the
+   * session's key, so it never queues behind the waiters a deadline usually
+   * expires among. Behind a pooler the pooler forwards it to the server
+   * running this client's transaction.
+   */
+  private cancel(client: PoolClient): void {
+    const { processID, secretKey } = client as unknown as { processID: number; secretKey: number };
+    const { host, port, ssl } = this.settings();
+    const con = new Connection({ ssl } as any) as unknown as CancelConnection;
+    const send = () => {
+      con.cancel(processID, secretKey);
+      logger.debug(`Sent cancel request for ${this.role} session ${processID}`);
+    };
+
+    con.on('connect', () => (ssl ? con.requestSsl() : send()));
+    con.on('sslconnect', send);
+    con.on('error', (error) => logger.warn(`Failed to cancel ${this.role} session ${processID}:`, error));
+    con.connect(port ?? 5432, host ?? 'localhost');
+  }
+
+  private recordQueueWait(ms: number): void {
+    this.window.acquisitions++;
+    this.window.totalQueueWait += ms;
+    this.window.maxQueueWait = Math.max(this.window.maxQueueWait, ms);
+  }
+
+  // pg-pool reads options.max on every checkout, so mutating it resizes the pool
+  private settings(): PoolConfig {
+    return (this as unknown as { options: PoolConfig }).options;
+  }
+}
+
+/**
+ * Rotates the stats window of each pool on a fixed interval. With adaptive
+ * sizing on, it also grows a pool while callers queue for connections and the
+ * database is still answering quickly, and shrinks it when the pool sits
+ * mostly idle. Connections above the new maximum are closed by the idle timeout.
+ */
+export class PoolMonitor {
+  private timer?: NodeJS.Timeout;
+
+  constructor(private pools: MeteredPool[]) {}
+
+  public start(): void {
+    const interval = config.database.pool.statsInterval;
+    this.timer = setInterval(() => this.tick(), interval);
+    this.timer.unref();
+
+    if (config.database.pool.adaptive.enabled) {
+      logger.info(`Adaptive pool sizing enabled (interval ${interval}ms)`);
+    }
+  }
+
+  public stop(): void {
+    if (this.timer) {
+      clearInterval(this.timer);
+      this.timer = undefined;
+    }
+  }
+
+  private tick(): void {
+    for (const pool of this.pools) {
+      const stats = pool.rotateWindow();
+      if (config.database.pool.adaptive.enabled) {
+        this.adjust(pool, stats);
+      }
+    }
+  }
+
+  private adjust(pool: MeteredPool, stats: PoolStats): void {
+    const { targetQueueWait, latencyCeiling } = config.database.pool.adaptive;
+    const current = stats.max;
+    let next = current;
+
+    if (stats.avgQueueWaitMs > targetQueueWait || stats.waiting > 0) {
+      // Queueing with a slow database means it is already saturated; more
+      // connections would only add contention there
+      if (stats.avgHoldMs <= latencyCeiling) {
+        next = current + Math.max(1, Math.ceil(current * 0.25));
+      }
+    } else if (stats.peakInUse < current / 2) {
+      next = current - 1;
+    }
+
+    pool.resize(next);
+    if (pool.maxSize !== current) {
+      logger.info(
+        `Resized ${pool.role} pool ${current} -> ${pool.maxSize} ` +
+        `(queue wait ${stats.avgQueueWaitMs.toFixed(1)}ms, hold ${stats.avgHoldMs.toFixed(1)}ms)`
+      );
+    }
+  }
+}
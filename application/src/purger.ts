@@ -0,0 +1,132 @@
+import { config } from './config';
+import { db, dbManager } from './database';
+import { logger } from './logger';
+import { purgeDeletedUsersQuery } from './user.queries';
+
+// Transaction-level advisory lock so one process purges at a time; unlike a
+// session lock it is released at commit, which keeps it safe behind a pooler
+const PURGE_LOCK_KEY = 7239051;
+
+/**
+ * Hour range [start, end) in UTC from '1-5'; wraps past midnight ('22-4')
+ */
+const inWindow = (window: string, now: Date): boolean => {
+  const match = /^(\d{1,2})-(\d{1,2})$/.exec(window.trim());
+  if (!match) {
+    return true;
+  }
+
+  const [start, end] = [parseInt(match[1], 10), parseInt(match[2], 10)];
+  const hour = now.getUTCHours();
+  return start <= end ? hour >= start && hour < end : hour >= start || hour < end;
+};
+
+/**
+ * Removes soft-deleted users once they are past retention, in small batches
+ * with a pause between them, so the deletes (and the vacuum and replica
+ * replay work they cause) are spread out instead of arriving with the
+ * requests that deleted the users. Batches only run inside the configured
+ * window, while the primary pool has no one waiting and the replica keeps
+ * up; otherwise the purger checks again after the interval.
+ */
+export class UserPurger {
+  private timer?: NodeJS.Timeout;
+  private running?: Promise<void>;
+  private stopped = true;
+
+  public start(): void {
+    const { batchSize, retention, window } = config.softDelete.purge;
+    logger.info(`User purger started (batch ${batchSize}, retention ${retention / 3600000}h` +
+      `${window ? `, window ${window} UTC` : ''})`);
+    this.stopped = false;
+    this.schedule(config.softDelete.purge.interval);
+  }
+
+  /**
+   * Stop scheduling and wait for the batch in progress to commit
+   */
+  public async stop(): Promise<void> {
+    this.stopped = true;
+    if (this.timer) {
+      clearTimeout(this.timer);
+      this.timer = undefined;
+    }
+    await this.running;
+  }
+
+  /**
+   * Purge one batch; returns the rows removed, or null when another process
+   * holds the purge lock
+   */
+  public purgeBatch(): Promise<number | null> {
+    const { retention, batchSize } = config.softDelete.purge;
+
+    return dbManager.withTransaction('primary', async (tx) => {
+      const lock = await tx.query('SELECT pg_try_advisory_xact_lock($1) AS locked', [PURGE_LOCK_KEY]);
+      if (!lock.rows[0].locked) {
+        return null;
+      }
+
+      const result = await tx.query(purgeDeletedUsersQuery(retention, batchSize));
+      return result.rowCount;
+    });
+  }
+
+  private async isQuiet(): Promise<boolean> {
+    const { window, maxQueueWait, maxReplicaLag } = config.softDelete.purge;
+    if (!inWindow(window, new Date()) || !dbManager.isQuiet('primary', maxQueueWait)) {
+      return false;
+    }
+
+    const lag = await this.replicaLagMs();
+    if (lag > maxReplicaLag) {
+      logger.debug(`Replica lag ${Math.round(lag)}ms above ${maxReplicaLag}ms, deferring purge`);
+      return false;
+    }
+    return true;
+  }
+
+  /**
+   * Replay lag on the replica; zero when the replica pool reaches the primary
+   */
+  private async replicaLagMs(): Promise<number> {
+    const result = await db.replica.query(`
+      SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM NOW() - pg_last_xact_replay_timestamp()) * 1000, 0)
+      END AS lag_ms
+    `);
+    return Number(result.rows[0].lag_ms);
+  }
+
+  private schedule(delay: number): void {
+    this.timer = setTimeout(() => {
+      this.running = this.tick();
+    }, delay);
+    this.timer.unref();
+  }
+
+  private async tick(): Promise<void> {
+    const { batchSize, pause, interval } = config.softDelete.purge;
+    let purged: number | null = 0;
+
+    try {
+      if (await this.isQuiet()) {
+        purged = await this.purgeBatch();
+        if (purged) {
+          logger.info(`Purged ${purged} soft-deleted users`);
+        }
+      }
+    } catch (error) {
+      logger.error('User purge batch failed:', error);
+    }
+
+    // A full batch means more are due: continue after the pause
+    if (!this.stopped) {
+      this.schedule(purged === batchSize ? pause : interval);
+    }
+  }
+}
+
+export const userPurger = new UserPurger();
@@ -0,0 +1,22 @@
+/**
+ * Rows grouped by key, in their original order within each group
+ */
+export const groupBy = <T, K>(rows: T[], key: (row: T) => K): Map<K, T[]> => {
+  const groups = new Map<K, T[]>();
+  for (const row of rows) {
+    const k = key(row);
+    const group = groups.get(k);
+    if (group) {
+      group.push(row);
+    } else {
+      groups.set(k, [row]);
+    }
+  }
+  return groups;
+};
+
+/**
+ * Rows by a unique key
+ */
+export const indexBy = <T, K>(rows: T[], key: (row: T) => K): Map<K, T> =>
+  new Map(rows.map((row) => [key(row), row]));
@@ -0,0 +1,114 @@
+import { Response } from 'express';
+
+export type Serializer<T> = (value: T) => string;
+
+export type FieldType = 'string' | 'number' | 'boolean' | 'date' | Serializer<any>;
+
+/**
+ * One entry per property of T, so the schema cannot drift from the type
+ */
+export type ObjectSchema<T> = { [K in keyof T]-?: FieldType };
+
+// Characters JSON.stringify would escape, or lone surrogates
+const NEEDS_ESCAPE = /[\u0000-\u001f"\\\ud800-\udfff]/;
+
+const writers: Record<Exclude<FieldType, Serializer<any>>, Serializer<any>> = {
+  string: (s: string) => (NEEDS_ESCAPE.test(s) ? JSON.stringify(s) : `"${s}"`),
+  number: (n: number) => (Number.isFinite(n) ? String(n) : 'null'),
+  boolean: (b: boolean) => (b ? 'true' : 'false'),
+  // pg returns Date for timestamps; strings pass through as JSON.stringify would
+  date: (d: Date | string) => (d instanceof Date ? `"${d.toISOString()}"` : JSON.stringify(d))
+};
+
+/**
+ * Compiles a serializer for objects of one known shape into straight-line
+ * code: keys are written in schema order without inspecting the object, and
+ * values go through a writer for their declared type. Output matches
+ * JSON.stringify for the declared properties: null stays null, undefined
+ * properties are left out, and properties missing from the schema are not
+ * written.
+ */
+export const compileObject = <T>(schema: ObjectSchema<T>): Serializer<T> => {
+  const entries = Object.entries(schema) as Array<[string, FieldType]>;
+  const write = entries.map(([, type]) => (typeof type === 'function' ? type : writers[type]));
+
+  const body = entries
+    .map(([key], i) => `
+  v = o[${JSON.stringify(key)}];
+  if (v !== undefined) {
+    out += sep + ${JSON.stringify(`${JSON.stringify(key)}:`)} + (v === null ? 'null' : w[${i}](v));
+    sep = ',';
+  }`)
+    .join('');
+
+  // Only keys from the schema, which is code, are embedded in the source
+  return new Function('w', `return function serialize(o) {
+  let out = '{';
+  let sep = '';
+  let v;${body}
+  return out + '}';
+};`)(write) as Serializer<T>;
+};
+
+export const arrayOf = <T>(item: Serializer<T>): Serializer<T[]> => (items) => {
+  let out = '[';
+  for (let i = 0; i < items.length; i++) {
+    if (i > 0) {
+      out += ',';
+    }
+    out += items[i] === null ? 'null' : item(items[i]);
+  }
+  return out + ']';
+};
+
+/**
+ * Sends an already serialized JSON body. res.send still answers HEAD and
+ * applies the ETag set on the response.
+ */
+export const sendJson = (res: Response, json: string, status = 200): void => {
+  res.status(status).type('json').send(json);
+};
+
+const STREAM_CHUNK_SIZE = 64;
+
+/**
+ * Writes an envelope whose large array is serialized a chunk at a time, so
+ * the whole body is never held as one string. head ends where the array
+ * begins and tail closes the envelope. Waits for the socket to drain
+ * between chunks when it falls behind.
+ */
+export const streamJsonArray = async <T>(
+  res: Response,
+  head: string,
+  items: T[],
+  item: Serializer<T>,
+  tail: string
+): Promise<void> => {
+  res.type('json');
+  let chunk = `${head}[`;
+
+  for (let i = 0; i < items.length; i++) {
+    chunk += (i > 0 ? ',' : '') + item(items[i]);
+
+    if ((i + 1) % STREAM_CHUNK_SIZE === 0 && i + 1 < items.length) {
+      if (!res.write(chunk)) {
+        await new Promise<void>((resolve) => {
+          // Disconnected clients never drain
+          const done = () => {
+            res.off('drain', done);
+            res.off('close', done);
+            resolve();
+          };
+          res.on('drain', done);
+          res.on('close', done);
+        });
+        if (res.destroyed) {
+          return;
+        }
+      }
+      chunk = '';
+    }
+  }
+
+  res.end(`${chunk}]${tail}`);
+};
@@ -0,0 +1,101 @@
+import { SingleFlight } from './singleflight';
+import { Deadline, DeadlineExceededError, currentDeadline, runWithDeadline } from './deadline';
+
+const deferred = <T>() => {
+  let resolve!: (value: T) => void;
+  let reject!: (error: Error) => void;
+  const promise = new Promise<T>((res, rej) => {
+    resolve = res;
+    reject = rej;
+  });
+  return { promise, resolve, reject };
+};
+
+describe('SingleFlight', () => {
+  it('runs concurrent calls with the same key once and shares the result', async () => {
+    const flight = new SingleFlight<number>();
+    const pending = deferred<number>();
+    const fn = jest.fn(() => pending.promise);
+
+    const calls = [flight.do('a', fn), flight.do('a', fn), flight.do('a', fn)];
+    expect(fn).toHaveBeenCalledTimes(1);
+    expect(flight.size).toBe(1);
+
+    pending.resolve(42);
+    await expect(Promise.all(calls)).resolves.toEqual([42, 42, 42]);
+  });
+
+  it('runs calls with different keys separately', async () => {
+    const flight = new SingleFlight<string>();
+    const fn = jest.fn((value: string) => Promise.resolve(value));
+
+    const results = await Promise.all([
+      flight.do('a', () => fn('a')),
+      flight.do('b', () => fn('b'))
+    ]);
+
+    expect(results).toEqual(['a', 'b']);
+    expect(fn).toHaveBeenCalledTimes(2);
+  });
+
+  it('rejects every coalesced waiter with the shared error', async () => {
+    const flight = new SingleFlight<number>();
+    const pending = deferred<number>();
+    const error = new Error('connection reset');
+
+    const calls = [1, 2, 3].map(() => flight.do('a', () => pending.promise));
+    pending.reject(error);
+
+    const settled = await Promise.allSettled(calls);
+    expect(settled).toEqual([1, 2, 3].map(() => ({ status: 'rejected', reason: error })));
+  });
+
+  it('forgets a key once its call settles', async () => {
+    const flight = new SingleFlight<number>();
+    const fn = jest.fn()
+      .mockRejectedValueOnce(new Error('first'))
+      .mockResolvedValueOnce(2);
+
+    await expect(flight.do('a', fn)).rejects.toThrow('first');
+    expect(flight.size).toBe(0);
+
+    await expect(flight.do('a', fn)).resolves.toBe(2);
+    expect(fn).toHaveBeenCalledTimes(2);
+    expect(flight.size).toBe(0);
+  });
+
+  it('runs the shared call outside the caller deadline', async () => {
+    const flight = new SingleFlight<Deadline | undefined>();
+    const deadline = new Deadline(1000);
+
+    const seen = await runWithDeadline(deadline, () =>
+      flight.do('a', async () => currentDeadline()));
+
+    expect(seen).toBeUndefined();
+  });
+
+  it('rejects only the caller whose deadline aborts', async () => {
+    const flight = new SingleFlight<number>();
+    const pending = deferred<number>();
+    const fn = () => pending.promise;
+    const abandoned = new Deadline(1000);
+
+    const first = runWithDeadline(abandoned, () => flight.do('a', fn));
+    const second = runWithDeadline(new Deadline(1000), () => flight.do('a', fn));
+
+    abandoned.cancel('client disconnected');
+    await expect(first).rejects.toBeInstanceOf(DeadlineExceededError);
+
+    pending.resolve(7);
+    await expect(second).resolves.toBe(7);
+  });
+
+  it('rejects at once when the caller deadline has already aborted', async () => {
+    const flight = new SingleFlight<number>();
+    const deadline = new Deadline(1000);
+    deadline.cancel('timeout');
+
+    await expect(runWithDeadline(deadline, () => flight.do('a', () => Promise.resolve(1))))
+      .rejects.toBeInstanceOf(DeadlineExceededError);
+  });
+});
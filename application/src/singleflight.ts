@@ -0,0 +1,48 @@
+import { DeadlineExceededError, currentDeadline, withoutDeadline } from './deadline';
+
+/**
+ * Collapses concurrent calls with the same key into one execution. Callers
+ * that arrive while a call is in flight share its result or error; nothing is
+ * kept once it settles, so results are never staler than a fresh call.
+ */
+export class SingleFlight<T> {
+  private inFlight = new Map<string, Promise<T>>();
+
+  public do(key: string, fn: () => Promise<T>): Promise<T> {
+    let flight = this.inFlight.get(key);
+
+    if (!flight) {
+      // The shared call must not be cancelled because the request that
+      // happened to start it timed out or disconnected
+      flight = withoutDeadline(fn).finally(() => this.inFlight.delete(key));
+      this.inFlight.set(key, flight);
+    }
+
+    return this.bindToDeadline(flight);
+  }
+
+  public get size(): number {
+    return this.inFlight.size;
+  }
+
+  // Each caller still gives up when its own deadline aborts
+  private bindToDeadline(flight: Promise<T>): Promise<T> {
+    const deadline = currentDeadline();
+    if (!deadline) {
+      return flight;
+    }
+
+    return new Promise<T>((resolve, reject) => {
+      const onAbort = () => reject(new DeadlineExceededError('shared query abandoned'));
+      if (deadline.signal.aborted) {
+        onAbort();
+        return;
+      }
+
+      deadline.signal.addEventListener('abort', onAbort, { once: true });
+      flight.then(resolve, reject).finally(() => {
+        deadline.signal.removeEventListener('abort', onAbort);
+      });
+    });
+  }
+}
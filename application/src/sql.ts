@@ -0,0 +1,4 @@
+/**
+ * Escape LIKE wildcards so user input only matches literally
+ */
+export const escapeLike = (value: string): string => value.replace(/[\\%_]/g, '\\$&');
@@ -0,0 +1,88 @@
+import zlib from 'zlib';
+import { logger } from '../logger';
+import { User } from '../user.types';
+import { serializeUser, serializeUserResponse, userListEnvelope } from '../user.serializers';
+
+interface Encoder {
+  name: string;
+  compress: (body: Buffer) => Buffer;
+}
+
+const ITERATIONS = 500;
+
+const encoders: Encoder[] = [
+  ...[1, 6, 9].map((level) => ({
+    name: `gzip ${level}`,
+    compress: (body: Buffer) => zlib.gzipSync(body, { level })
+  })),
+  ...[1, 4, 6, 11].map((quality) => ({
+    name: `br ${quality}`,
+    compress: (body: Buffer) =>
+      zlib.brotliCompressSync(body, { params: { [zlib.constants.BROTLI_PARAM_QUALITY]: quality } })
+  }))
+];
+
+const sampleUser = (i: number): User => ({
+  id: `00000000-0000-4000-8000-${String(i).padStart(12, '0')}`,
+  email: `user${i}@example.com`,
+  firstName: `First${i}`,
+  lastName: `Last${i % 97}`,
+  isActive: i % 10 !== 0,
+  createdAt: new Date(Date.UTC(2024, 0, 1) + i * 60000),
+  updatedAt: new Date(Date.UTC(2024, 6, 1) + i * 60000)
+});
+
+const listBody = (size: number): string => {
+  const users = Array.from({ length: size }, (_, i) => sampleUser(i));
+  const { head, tail } = userListEnvelope({ total: 10000, limit: size, offset: 0, hasMore: true });
+  return `${head}[${users.map(serializeUser).join(',')}]${tail}`;
+};
+
+const payloads: Array<[string, string]> = [
+  ['single user', serializeUserResponse({ success: true, data: sampleUser(1) })],
+  ['list of 10', listBody(10)],
+  ['list of 50', listBody(50)],
+  ['list of 100', listBody(100)]
+];
+
+// CPU time of the process, user plus system, in microseconds
+const cpuMicros = (): number => {
+  const { user, system } = process.cpuUsage();
+  return user + system;
+};
+
+/**
+ * CPU per response against bytes saved, for each encoder and for typical
+ * user payloads, to pick COMPRESSION_* settings:
+ *
+ *   npm run bench:compression
+ *
+ * A cache hit costs a Map lookup, so for cached list pages only the first
+ * response pays the figures below.
+ */
+const run = (): void => {
+  for (const [name, json] of payloads) {
+    const body = Buffer.from(json);
+    logger.info(`${name}: ${body.length} bytes`);
+
+    for (const encoder of encoders) {
+      encoder.compress(body);
+
+      const start = cpuMicros();
+      let size = 0;
+      for (let i = 0; i < ITERATIONS; i++) {
+        size = encoder.compress(body).length;
+      }
+      const perCall = (cpuMicros() - start) / ITERATIONS;
+      const saved = body.length - size;
+
+      logger.info(
+        `  ${encoder.name.padEnd(8)} ${String(size).padStart(7)} bytes  ` +
+        `saves ${String(saved).padStart(7)} (${((saved / body.length) * 100).toFixed(0)}%)  ` +
+        `${perCall.toFixed(1)}us cpu  ${saved > 0 ? (saved / perCall).toFixed(0) : 0} bytes saved/us`
+      );
+    }
+  }
+};
+
+run();
@@ -0,0 +1,486 @@
+import { Pool } from 'pg';
+import { config } from '../config';
+import { logger } from '../logger';
+import { QueryShape, userQueryShapes } from '../user.queries';
+import { PlanNode, walkPlan } from './plans';
+
+interface IndexInfo {
+  name: string;
+  table: string;
+  definition: string;
+  method: string;
+  columns: string[];
+  options: string;
+  unique: boolean;
+  constraint: boolean;
+  partial: boolean;
+  expression: boolean;
+  sizeBytes: number;
+  scans: number;
+}
+
+interface TableWrites {
+  inserts: number;
+  nonHotUpdates: number;
+}
+
+interface StatementStats {
+  query: string;
+  calls: number;
+  totalMs: number;
+  meanMs: number;
+}
+
+interface Finding {
+  kind: 'unused' | 'duplicate' | 'redundant' | 'low-selectivity' | 'missing';
+  index: string;
+  detail: string;
+  sql: string;
+}
+
+// Leading columns with at most this many distinct values make poor btree keys
+const LOW_CARDINALITY = 10;
+
+// Plan filters print as e.g. "((email)::text ~~* '%a%'::text)", "(id = $1)",
+// and booleans bare: "is_active", "(NOT is_active)"
+const ILIKE_FILTER = /\(?(\w+)\)?(?:::\w+)? ~~\* /g;
+const EQUALITY_FILTER = /\(\(?(\w+)\)?(?:::\w+)? = /g;
+const BOOLEAN_FILTER = /(?:^|\(|AND )(?:NOT )?(\w+)(?=\)(?!::)| AND|$)/g;
+
+const formatBytes = (bytes: number): string =>
+  bytes >= 1024 * 1024 ? `${(bytes / 1024 / 1024).toFixed(1)}MB` : `${Math.round(bytes / 1024)}KB`;
+
+/**
+ * Reviews the indexes in the public schema against how they are actually
+ * used. Index scan counts are summed over the primary and the replica,
+ * since reads are served by the replica and each instance keeps its own
+ * statistics. Missing indexes are found by EXPLAINing every query shape
+ * UserService issues, plus (on PostgreSQL 16+) the generic plans of the
+ * heaviest statements in pg_stat_statements.
+ */
+class IndexAdvisor {
+  private primary: Pool;
+  private replica: Pool | null = null;
+
+  constructor() {
+    this.primary = new Pool({
+      host: config.database.primary.host,
+      port: config.database.primary.port,
+      database: config.database.primary.database,
+      user: config.database.primary.user,
+      password: config.database.primary.password,
+      ssl: config.database.ssl,
+      max: 1
+    });
+
+    if (config.database.replica.host !== config.database.primary.host) {
+      this.replica = new Pool({
+        host: config.database.replica.host,
+        port: config.database.replica.port,
+        database: config.database.replica.database,
+        user: config.database.replica.user,
+        password: config.database.replica.password,
+        ssl: config.database.ssl,
+        max: 1
+      });
+    }
+  }
+
+  private get instances(): Pool[] {
+    return this.replica ? [this.primary, this.replica] : [this.primary];
+  }
+
+  async run(): Promise<void> {
+    try {
+      await this.reportStatsAge();
+
+      const indexes = await this.loadIndexes();
+      const writes = await this.loadTableWrites();
+      const statements = await this.loadStatements();
+
+      const findings = [
+        ...this.findUnused(indexes),
+        ...this.findDuplicates(indexes),
+        ...(await this.findLowSelectivity(indexes)),
+        ...(await this.findMissing(statements, indexes))
+      ];
+
+      this.reportStatements(statements);
+      this.reportFindings(findings, indexes, writes);
+    } finally {
+      await Promise.all(this.instances.map((pool) => pool.end()));
+    }
+  }
+
+  /**
+   * Scan counts only mean something over a representative period
+   */
+  private async reportStatsAge(): Promise<void> {
+    for (const pool of this.instances) {
+      const result = await pool.query(`
+        SELECT pg_is_in_recovery() AS replica, stats_reset
+        FROM pg_stat_database WHERE datname = current_database()
+      `);
+      const { replica, stats_reset } = result.rows[0];
+      logger.info(`${replica ? 'Replica' : 'Primary'} statistics collected since ${stats_reset ?? 'cluster start'}`);
+    }
+  }
+
+  private async loadIndexes(): Promise<IndexInfo[]> {
+    const query = `
+      SELECT s.indexrelname AS name, s.relname AS table_name,
+             pg_get_indexdef(i.indexrelid) AS definition,
+             am.amname AS method,
+             ARRAY(
+               SELECT a.attname FROM unnest(i.indkey) WITH ORDINALITY AS k(attnum, ord)
+               JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k.attnum
+               ORDER BY k.ord
+             ) AS columns,
+             i.indoption::text AS options,
+             i.indisunique AS is_unique,
+             EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid) AS is_constraint,
+             i.indpred IS NOT NULL AS is_partial,
+             i.indexprs IS NOT NULL AS is_expression,
+             pg_relation_size(i.indexrelid) AS size_bytes,
+             s.idx_scan
+      FROM pg_stat_user_indexes s
+      JOIN pg_index i ON i.indexrelid = s.indexrelid
+      JOIN pg_class c ON c.oid = s.indexrelid
+      JOIN pg_am am ON am.oid = c.relam
+      WHERE s.schemaname = 'public'
+      ORDER BY s.relname, s.indexrelname
+    `;
+
+    const [primary, ...others] = await Promise.all(this.instances.map((pool) => pool.query(query)));
+    const indexes: IndexInfo[] = primary.rows.map((row) => ({
+      name: row.name,
+      table: row.table_name,
+      definition: row.definition,
+      method: row.method,
+      columns: row.columns,
+      options: row.options,
+      unique: row.is_unique,
+      constraint: row.is_constraint,
+      partial: row.is_partial,
+      expression: row.is_expression,
+      sizeBytes: Number(row.size_bytes),
+      scans: Number(row.idx_scan)
+    }));
+
+    const byName = new Map(indexes.map((index) => [index.name, index]));
+    for (const result of others) {
+      for (const row of result.rows) {
+        const index = byName.get(row.name);
+        if (index) {
+          index.scans += Number(row.idx_scan);
+        }
+      }
+    }
+
+    return indexes;
+  }
+
+  /**
+   * Every INSERT, and every UPDATE that is not HOT, writes one entry into
+   * each index on the table
+   */
+  private async loadTableWrites(): Promise<Map<string, TableWrites>> {
+    const result = await this.primary.query(`
+      SELECT relname AS table_name, n_tup_ins, n_tup_upd - n_tup_hot_upd AS non_hot_upd
+      FROM pg_stat_user_tables
+      WHERE schemaname = 'public'
+    `);
+
+    return new Map(result.rows.map((row) => [row.table_name, {
+      inserts: Number(row.n_tup_ins),
+      nonHotUpdates: Number(row.non_hot_upd)
+    }]));
+  }
+
+  /**
+   * Heaviest statements by total execution time, merged across instances
+   */
+  private async loadStatements(): Promise<StatementStats[]> {
+    const merged = new Map<string, StatementStats>();
+
+    for (const pool of this.instances) {
+      try {
+        const version = await pool.query("SELECT current_setting('server_version_num')::int AS num");
+        const totalColumn = version.rows[0].num >= 130000 ? 'total_exec_time' : 'total_time';
+        const result = await pool.query(`
+          SELECT query, calls, ${totalColumn} AS total_ms
+          FROM pg_stat_statements
+          WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+            AND query ~* '\\musers\\M'
+          ORDER BY ${totalColumn} DESC
+          LIMIT 50
+        `);
+
+        for (const row of result.rows) {
+          const entry = merged.get(row.query) ?? { query: row.query, calls: 0, totalMs: 0, meanMs: 0 };
+          entry.calls += Number(row.calls);
+          entry.totalMs += Number(row.total_ms);
+          entry.meanMs = entry.totalMs / Math.max(entry.calls, 1);
+          merged.set(row.query, entry);
+        }
+      } catch (error) {
+        logger.warn('pg_stat_statements unavailable (is it in shared_preload_libraries?):', (error as Error).message);
+      }
+    }
+
+    return [...merged.values()].sort((a, b) => b.totalMs - a.totalMs).slice(0, 20);
+  }
+
+  private findUnused(indexes: IndexInfo[]): Finding[] {
+    return indexes
+      .filter((index) => index.scans === 0 && !index.unique && !index.constraint)
+      .map((index) => ({
+        kind: 'unused' as const,
+        index: index.name,
+        detail: `never scanned on any instance (${formatBytes(index.sizeBytes)})`,
+        sql: `DROP INDEX CONCURRENTLY IF EXISTS ${index.name};`
+      }));
+  }
+
+  /**
+   * Same table, method and key columns (duplicate), or key columns that are a
+   * leading prefix of another index (redundant). Unique and constraint
+   * indexes are always the ones kept.
+   */
+  private findDuplicates(indexes: IndexInfo[]): Finding[] {
+    const findings: Finding[] = [];
+    const plain = (index: IndexInfo) => !index.partial && !index.expression && index.columns.length > 0;
+    const options = (index: IndexInfo) => index.options.split(' ');
+
+    for (const index of indexes) {
+      if (!plain(index) || index.unique || index.constraint) {
+        continue;
+      }
+
+      for (const other of indexes) {
+        if (other === index || other.table !== index.table || other.method !== index.method || !plain(other)) {
+          continue;
+        }
+
+        const isPrefix = index.columns.every((column, i) =>
+          other.columns[i] === column && options(other)[i] === options(index)[i]);
+        if (!isPrefix || other.columns.length < index.columns.length) {
+          continue;
+        }
+
+        if (other.columns.length === index.columns.length) {
+          // Between two plain duplicates, keep the more used one
+          if (!other.unique && !other.constraint &&
+              (other.scans < index.scans || (other.scans === index.scans && other.name > index.name))) {
+            continue;
+          }
+          findings.push({
+            kind: 'duplicate',
+            index: index.name,
+            detail: `same key as ${other.name}`,
+            sql: `DROP INDEX CONCURRENTLY IF EXISTS ${index.name};`
+          });
+        } else if (index.method === 'btree') {
+          findings.push({
+            kind: 'redundant',
+            index: index.name,
+            detail: `leading columns of ${other.name}, which can serve the same lookups`,
+            sql: `DROP INDEX CONCURRENTLY IF EXISTS ${index.name};`
+          });
+        }
+        break;
+      }
+    }
+
+    return findings;
+  }
+
+  /**
+   * Btree indexes led by a column with only a handful of distinct values,
+   * such as a boolean, rarely beat a sequential scan unless the value
+   * searched for is rare
+   */
+  private async findLowSelectivity(indexes: IndexInfo[]): Promise<Finding[]> {
+    const result = await this.primary.query(`
+      SELECT tablename, attname, n_distinct, most_common_vals::text AS values, most_common_freqs AS freqs
+      FROM pg_stats WHERE schemaname = 'public'
+    `);
+    const stats = new Map(result.rows.map((row) => [`${row.tablename}.${row.attname}`, row]));
+    const findings: Finding[] = [];
+
+    for (const index of indexes) {
+      if (index.method !== 'btree' || index.unique || index.partial || index.columns.length !== 1) {
+        continue;
+      }
+
+      const column = stats.get(`${index.table}.${index.columns[0]}`);
+      const distinct = column ? Number(column.n_distinct) : 0;
+      if (!column || distinct <= 0 || distinct > LOW_CARDINALITY) {
+        continue;
+      }
+
+      const freqs: number[] = (column.freqs || []).map(Number);
+      const rarest = freqs.length ? Math.min(...freqs) : 1;
+      findings.push({
+        kind: 'low-selectivity',
+        index: index.name,
+        detail: `${index.columns[0]} has ${distinct} distinct values (values ${column.values}, ` +
+          `rarest ${(rarest * 100).toFixed(1)}% of rows); only worth keeping as a partial index on a rare value`,
+        sql: `DROP INDEX CONCURRENTLY IF EXISTS ${index.name};`
+      });
+    }
+
+    return findings;
+  }
+
+  /**
+   * Sequential scans of users in the plans of our own query shapes and of
+   * the heaviest recorded statements
+   */
+  private async findMissing(statements: StatementStats[], indexes: IndexInfo[]): Promise<Finding[]> {
+    const reader = this.replica ?? this.primary;
+    const sample = await reader.query('SELECT id, email FROM users ORDER BY created_at DESC LIMIT 1');
+    const plans: Array<{ source: string; plan: PlanNode }> = [];
+
+    if (sample.rows.length > 0) {
+      const { id, email } = sample.rows[0];
+      const shapes: QueryShape[] = userQueryShapes({
+        id,
+        email,
+        emailFragment: email.split('@')[0].slice(0, 4),
+        deepOffset: 1000
+      });
+
+      for (const shape of shapes.filter((s) => !s.write)) {
+        const result = await reader.query(`EXPLAIN (FORMAT JSON) ${shape.query.text}`, shape.query.values);
+        plans.push({ source: shape.name, plan: result.rows[0]['QUERY PLAN'][0].Plan });
+      }
+    } else {
+      logger.warn('users is empty, skipping EXPLAIN of UserService query shapes');
+    }
+
+    const version = await reader.query("SELECT current_setting('server_version_num')::int AS num");
+    if (version.rows[0].num >= 160000) {
+      for (const statement of statements.filter((s) => /^\s*(SELECT|UPDATE|DELETE)\b/i.test(s.query))) {
+        try {
+          const result = await reader.query(`EXPLAIN (FORMAT JSON, GENERIC_PLAN) ${statement.query}`);
+          plans.push({
+            source: `pg_stat_statements (${statement.calls} calls, ${statement.meanMs.toFixed(1)}ms mean)`,
+            plan: result.rows[0]['QUERY PLAN'][0].Plan
+          });
+        } catch (error) {
+          logger.debug(`Could not EXPLAIN statement: ${statement.query}`, error);
+        }
+      }
+    }
+
+    const suggestions = new Map<string, Finding>();
+    const covered = (columns: string[]) => indexes.some((index) =>
+      index.table === 'users' && index.method === 'btree' && !index.partial &&
+      columns.every((column, i) => index.columns[i] === column));
+
+    const suggest = (name: string, sql: string, source: string) => {
+      const existing = suggestions.get(sql);
+      if (existing) {
+        existing.detail += `, ${source}`;
+      } else {
+        suggestions.set(sql, { kind: 'missing', index: name, detail: `seq scan in ${source}`, sql });
+      }
+    };
+
+    for (const { source, plan } of plans) {
+      walkPlan(plan, (node, parents) => {
+        if (node['Node Type'] !== 'Seq Scan' || node['Relation Name'] !== 'users' || !node.Filter) {
+          return;
+        }
+
+        const fuzzy = [...node.Filter.matchAll(ILIKE_FILTER)].map((m) => m[1]);
+        const equal = [
+          ...[...node.Filter.matchAll(EQUALITY_FILTER)].map((m) => m[1]),
+          ...[...node.Filter.matchAll(BOOLEAN_FILTER)].map((m) => m[1])
+        ];
+        const sort = parents.find((parent) => parent['Node Type'] === 'Sort')?.['Sort Key'] ?? [];
+
+        for (const column of fuzzy) {
+          suggest(
+            `idx_users_${column}_trgm`,
+            `CREATE EXTENSION IF NOT EXISTS pg_trgm; ` +
+            `CREATE INDEX CONCURRENTLY idx_users_${column}_trgm ON users USING gin (${column} gin_trgm_ops);`,
+            source
+          );
+        }
+
+        const sortKeys = sort.map((key) => key.replace(/^users\./, ''));
+        const keyColumns = [...equal, ...sortKeys.map((key) => key.split(' ')[0])];
+        if (equal.length > 0 && !covered(keyColumns)) {
+          const name = `idx_users_${keyColumns.join('_')}`;
+          suggest(name, `CREATE INDEX CONCURRENTLY ${name} ON users (${[...equal, ...sortKeys].join(', ')});`, source);
+        }
+      });
+    }
+
+    return [...suggestions.values()];
+  }
+
+  private reportStatements(statements: StatementStats[]): void {
+    if (statements.length === 0) {
+      return;
+    }
+
+    logger.info('Heaviest statements on users:');
+    for (const statement of statements.slice(0, 10)) {
+      logger.info(
+        `  ${statement.totalMs.toFixed(0)}ms total, ${statement.calls} calls, ${statement.meanMs.toFixed(2)}ms mean: ` +
+        statement.query.replace(/\s+/g, ' ').slice(0, 160)
+      );
+    }
+  }
+
+  /**
+   * Print findings, and for the indexes proposed for removal the index
+   * writes they cost since statistics were reset. Treating the heap and
+   * each index as one write each, dropping k of a table's n indexes cuts the
+   * page writes per INSERT by about k / (n + 1).
+   */
+  private reportFindings(findings: Finding[], indexes: IndexInfo[], writes: Map<string, TableWrites>): void {
+    if (findings.length === 0) {
+      logger.info('No index findings');
+      return;
+    }
+
+    for (const finding of findings) {
+      logger.info(`[${finding.kind}] ${finding.index}: ${finding.detail}`);
+      logger.info(`    ${finding.sql}`);
+    }
+
+    const removable = new Set(findings.filter((f) => f.kind !== 'missing').map((f) => f.index));
+    const byTable = new Map<string, IndexInfo[]>();
+    for (const index of indexes) {
+      byTable.set(index.table, [...(byTable.get(index.table) || []), index]);
+    }
+
+    for (const [table, tableIndexes] of byTable) {
+      const dropped = tableIndexes.filter((index) => removable.has(index.name));
+      const tableWrites = writes.get(table);
+      if (dropped.length === 0 || !tableWrites) {
+        continue;
+      }
+
+      const entries = (tableWrites.inserts + tableWrites.nonHotUpdates) * dropped.length;
+      const bytes = dropped.reduce((sum, index) => sum + index.sizeBytes, 0);
+      const share = (dropped.length / (tableIndexes.length + 1)) * 100;
+      logger.info(
+        `Dropping ${dropped.length} of ${tableIndexes.length} indexes on ${table} would have saved ` +
+        `${entries} index entry writes (${tableWrites.inserts} inserts, ${tableWrites.nonHotUpdates} non-HOT updates), ` +
+        `~${share.toFixed(0)}% of page writes per INSERT, and ${formatBytes(bytes)} of index storage`
+      );
+    }
+  }
+}
+
+new IndexAdvisor().run()
+  .then(() => process.exit(0))
+  .catch((error) => {
+    logger.error('Index advisor failed:', error);
+    process.exit(1);
+  });
@@ -0,0 +1,71 @@
+import { performance } from 'perf_hooks';
+import { dbManager } from '../database';
+import { logger } from '../logger';
+import { UserService } from '../user.service';
+import { serializeUser, userListEnvelope } from '../user.serializers';
+
+const ITERATIONS = parseInt(process.env.LIST_BENCH_ITERATIONS || '200', 10);
+const PAGE_SIZES = [10, 50, 100];
+
+type Mode = (limit: number) => Promise<string>;
+
+// CPU time of this process, user plus system, in microseconds
+const cpuMicros = (): number => {
+  const { user, system } = process.cpuUsage();
+  return user + system;
+};
+
+/**
+ * Compares the two ways GET /api/users can build a page against the
+ * configured replica: rows through the driver and serializeUser, or the
+ * json_agg text from Postgres passed through (LIST_JSON_PROJECTION). Reports
+ * wall time and this process's CPU per page; database CPU is not included.
+ *
+ *   npm run bench:list
+ */
+const run = async (): Promise<void> => {
+  const service = new UserService();
+  const modes: Array<[string, Mode]> = [
+    ['rows', async (limit) => {
+      const { users, total } = await service.getUsers({ limit });
+      const { head, tail } = userListEnvelope({ total, limit, offset: 0, hasMore: limit < total });
+      return `${head}[${users.map(serializeUser).join(',')}]${tail}`;
+    }],
+    ['json_agg', async (limit) => {
+      const { json, total } = await service.getUsersJson({ limit });
+      const { head, tail } = userListEnvelope({ total, limit, offset: 0, hasMore: limit < total });
+      return head + json + tail;
+    }]
+  ];
+
+  for (const limit of PAGE_SIZES) {
+    for (const [name, mode] of modes) {
+      // Warm the connection pool, plan cache and JIT
+      for (let i = 0; i < 10; i++) {
+        await mode(limit);
+      }
+
+      let bytes = 0;
+      const cpuStart = cpuMicros();
+      const wallStart = performance.now();
+      for (let i = 0; i < ITERATIONS; i++) {
+        bytes = Buffer.byteLength(await mode(limit));
+      }
+      const wallMs = (performance.now() - wallStart) / ITERATIONS;
+      const cpuUs = (cpuMicros() - cpuStart) / ITERATIONS;
+
+      logger.info(
+        `limit ${String(limit).padStart(3)}  ${name.padEnd(8)}  ${wallMs.toFixed(2)}ms wall  ` +
+        `${cpuUs.toFixed(0)}us cpu  ${bytes} bytes`
+      );
+    }
+  }
+};
+
+run()
+  .then(() => dbManager.gracefulShutdown())
+  .then(() => process.exit(0))
+  .catch((error) => {
+    logger.error('List benchmark failed:', error);
+    process.exit(1);
+  });
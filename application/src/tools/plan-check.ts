@@ -0,0 +1,211 @@
+import { Pool, PoolClient } from 'pg';
+import { existsSync, readFileSync, writeFileSync } from 'fs';
+import { config } from '../config';
+import { logger } from '../logger';
+import { QueryShape, userQueryShapes } from '../user.queries';
+import { PlanNode, planShape } from './plans';
+
+interface PlanSummary {
+  plan: string[];
+  totalCost: number;
+  sharedBuffers: number;
+  executionMs: number;
+}
+
+interface Baseline {
+  rows: number;
+  shapes: Record<string, PlanSummary>;
+}
+
+// Synthetic data lives in its own schema so the check never touches real rows
+const SCHEMA = 'plan_check';
+
+/**
+ * Loads a synthetic users table and runs EXPLAIN (ANALYZE, BUFFERS) for
+ * every query shape UserService can issue, comparing each against the
+ * stored baseline. A shape fails when a sequential scan of users appears
+ * that the baseline did not have, or when its estimated cost or buffer
+ * count grows past config.planCheck.tolerance times the baseline.
+ *
+ *   npm run plan-check            compare against the baseline
+ *   npm run plan-check -- --update  record a new baseline
+ *
+ * Meant for a local or CI database: it creates and fills the plan_check
+ * schema, copying the current structure of public.users, indexes included,
+ * and drops the schema again when done. A shape missing from the baseline
+ * fails the check until the baseline is re-recorded and committed.
+ */
+class PlanCheck {
+  private pool: Pool;
+
+  constructor() {
+    this.pool = new Pool({
+      host: config.database.primary.host,
+      port: config.database.primary.port,
+      database: config.database.primary.database,
+      user: config.database.primary.user,
+      password: config.database.primary.password,
+      ssl: config.database.ssl,
+      max: 1
+    });
+  }
+
+  async run(update: boolean): Promise<boolean> {
+    const client = await this.pool.connect();
+
+    try {
+      await this.loadDataset(client);
+      const results = await this.explainShapes(client);
+
+      if (update) {
+        const baseline: Baseline = { rows: config.planCheck.rows, shapes: results };
+        writeFileSync(config.planCheck.baselineFile, JSON.stringify(baseline, null, 2) + '\n');
+        logger.info(`Recorded ${Object.keys(results).length} plans in ${config.planCheck.baselineFile}; commit it`);
+        return true;
+      }
+
+      return this.compare(results);
+    } finally {
+      await this.dropDataset(client);
+      client.release();
+      await this.pool.end();
+    }
+  }
+
+  /**
+   * The synthetic table is rebuilt on every run, so nothing is kept between
+   * runs; dropping it leaves no stray copy of users (and its indexes) behind
+   */
+  private async dropDataset(client: PoolClient): Promise<void> {
+    try {
+      await client.query(`DROP SCHEMA IF EXISTS ${SCHEMA} CASCADE`);
+    } catch (error) {
+      logger.warn(`Could not drop the ${SCHEMA} schema:`, error);
+    }
+  }
+
+  /**
+   * Rebuild plan_check.users with the same columns, defaults and indexes as
+   * public.users, so index changes in migrations show up in the plans
+   */
+  private async loadDataset(client: PoolClient): Promise<void> {
+    const rows = config.planCheck.rows;
+    await client.query(`CREATE SCHEMA IF NOT EXISTS ${SCHEMA}`);
+    await client.query(`SET search_path = ${SCHEMA}, public`);
+
+    logger.info(`Loading ${rows} synthetic users into ${SCHEMA}.users`);
+    await client.query(`
+      DROP TABLE IF EXISTS ${SCHEMA}.users;
+      CREATE TABLE ${SCHEMA}.users (LIKE public.users INCLUDING ALL);
+    `);
+
+    // Deterministic data: 90% active, one row per minute going back in time
+    await client.query(`
+      INSERT INTO ${SCHEMA}.users (email, first_name, last_name, is_active, created_at, updated_at)
+      SELECT 'user' || g || '@example.com', 'First' || (g % 1000), 'Last' || (g % 5000),
+             g % 10 <> 0, NOW() - g * INTERVAL '1 minute', NOW() - g * INTERVAL '1 minute'
+      FROM generate_series(1, $1) AS g
+    `, [rows]);
+    await client.query(`VACUUM ANALYZE ${SCHEMA}.users`);
+  }
+
+  private async explainShapes(client: PoolClient): Promise<Record<string, PlanSummary>> {
+    const sample = await client.query(
+      'SELECT id, email FROM users WHERE email = $1',
+      [`user${Math.ceil(config.planCheck.rows / 2)}@example.com`]
+    );
+    const shapes: QueryShape[] = userQueryShapes({
+      id: sample.rows[0].id,
+      email: sample.rows[0].email,
+      emailFragment: 'user12',
+      deepOffset: Math.min(10000, Math.floor(config.planCheck.rows / 2))
+    });
+
+    const results: Record<string, PlanSummary> = {};
+    for (const shape of shapes) {
+      // ANALYZE executes the statement; writes are rolled back
+      await client.query('BEGIN');
+      try {
+        const result = await client.query(
+          `EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ${shape.query.text}`,
+          shape.query.values
+        );
+        const explained = result.rows[0]['QUERY PLAN'][0];
+        results[shape.name] = this.summarize(explained.Plan, explained['Execution Time']);
+      } finally {
+        await client.query('ROLLBACK');
+      }
+    }
+
+    return results;
+  }
+
+  private summarize(plan: PlanNode, executionMs: number): PlanSummary {
+    // Buffer counts of the top node include those of its children
+    return {
+      plan: planShape(plan),
+      totalCost: plan['Total Cost'],
+      sharedBuffers: (plan['Shared Hit Blocks'] || 0) + (plan['Shared Read Blocks'] || 0),
+      executionMs: Math.round(executionMs * 1000) / 1000
+    };
+  }
+
+  private compare(results: Record<string, PlanSummary>): boolean {
+    if (!existsSync(config.planCheck.baselineFile)) {
+      throw new Error(`No baseline at ${config.planCheck.baselineFile}; run with --update to record one`);
+    }
+
+    const baseline: Baseline = JSON.parse(readFileSync(config.planCheck.baselineFile, 'utf8'));
+    if (baseline.rows !== config.planCheck.rows) {
+      throw new Error(`Baseline was recorded with ${baseline.rows} rows, PLAN_CHECK_ROWS is ${config.planCheck.rows}`);
+    }
+
+    const tolerance = config.planCheck.tolerance;
+    const seqScans = (plan: string[]) => plan.filter((line) => line.trim() === 'Seq Scan on users').length;
+    let passed = true;
+
+    for (const [name, current] of Object.entries(results)) {
+      const expected = baseline.shapes[name];
+      if (!expected) {
+        passed = false;
+        logger.error(`${name}: not in ${config.planCheck.baselineFile}; record it with --update and commit the file`);
+        continue;
+      }
+
+      const problems: string[] = [];
+      if (seqScans(current.plan) > seqScans(expected.plan)) {
+        problems.push('new sequential scan of users');
+      }
+      if (current.totalCost > expected.totalCost * tolerance) {
+        problems.push(`cost ${current.totalCost} vs ${expected.totalCost}`);
+      }
+      if (current.sharedBuffers > Math.max(expected.sharedBuffers, 1) * tolerance) {
+        problems.push(`buffers ${current.sharedBuffers} vs ${expected.sharedBuffers}`);
+      }
+
+      const changed = current.plan.join('\n') !== expected.plan.join('\n');
+      if (problems.length > 0) {
+        passed = false;
+        logger.error(`${name}: plan degraded (${problems.join(', ')})`);
+        logger.error(`  baseline:\n${expected.plan.join('\n')}\n  current:\n${current.plan.join('\n')}`);
+      } else if (changed) {
+        logger.warn(`${name}: plan changed within thresholds:\n${current.plan.join('\n')}`);
+      } else {
+        logger.info(`${name}: ok (cost ${current.totalCost}, ${current.sharedBuffers} buffers, ${current.executionMs}ms)`);
+      }
+    }
+
+    for (const name of Object.keys(baseline.shapes).filter((name) => !results[name])) {
+      logger.warn(`${name}: in baseline but no longer generated`);
+    }
+
+    return passed;
+  }
+}
+
+new PlanCheck().run(process.argv.includes('--update'))
+  .then((passed) => process.exit(passed ? 0 : 1))
+  .catch((error) => {
+    logger.error('Plan check failed:', error);
+    process.exit(1);
+  });
@@ -0,0 +1,36 @@
+export interface PlanNode {
+  'Node Type': string;
+  'Relation Name'?: string;
+  'Index Name'?: string;
+  'Filter'?: string;
+  'Sort Key'?: string[];
+  'Total Cost': number;
+  'Shared Hit Blocks'?: number;
+  'Shared Read Blocks'?: number;
+  'Plans'?: PlanNode[];
+}
+
+export const walkPlan = (
+  node: PlanNode,
+  visit: (node: PlanNode, parents: PlanNode[]) => void,
+  parents: PlanNode[] = []
+): void => {
+  visit(node, parents);
+  for (const child of node.Plans || []) {
+    walkPlan(child, visit, [...parents, node]);
+  }
+};
+
+/**
+ * One line per node, e.g. "Index Scan using users_pkey on users", indented
+ * by depth; stable across runs where costs and row counts are not
+ */
+export const planShape = (plan: PlanNode): string[] => {
+  const lines: string[] = [];
+  walkPlan(plan, (node, parents) => {
+    const index = node['Index Name'] ? ` using ${node['Index Name']}` : '';
+    const relation = node['Relation Name'] ? ` on ${node['Relation Name']}` : '';
+    lines.push(`${'  '.repeat(parents.length)}${node['Node Type']}${index}${relation}`);
+  });
+  return lines;
+};
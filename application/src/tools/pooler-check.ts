@@ -0,0 +1,110 @@
+import { randomUUID } from 'crypto';
+import { db, dbManager } from '../database';
+import { config } from '../config';
+import { Deadline, runWithDeadline } from '../deadline';
+import { logger } from '../logger';
+import { getUserById } from '../generated/user.queries';
+
+const CONCURRENCY = 8;
+const ROUNDS = 25;
+
+type Check = [string, () => Promise<void>];
+
+const assert = (condition: unknown, message: string): void => {
+  if (!condition) {
+    throw new Error(message);
+  }
+};
+
+const checks: Check[] = [
+  // Each round's transactions may land on different server connections; a
+  // statement prepared on one and only executed on the next fails here
+  ['named statements', async () => {
+    for (let round = 0; round < ROUNDS; round++) {
+      await Promise.all(Array.from({ length: CONCURRENCY }, () => {
+        const { name, text, values } = getUserById(randomUUID());
+        return db.replica.query({ name, text, values });
+      }));
+    }
+  }],
+
+  ['pipeline', async () => {
+    const [one, two] = await dbManager.pipeline('replica', [
+      { text: 'SELECT $1::int AS n', values: [1] },
+      { text: 'SELECT $1::int AS n', values: [2] }
+    ]);
+    assert(one.rows[0].n === 1 && two.rows[0].n === 2, 'pipelined results out of order');
+  }],
+
+  // Statements of one transaction must share a server connection, and a
+  // failed savepoint must leave the transaction usable
+  ['transaction with savepoint', async () => {
+    await dbManager.withTransaction('primary', async (tx) => {
+      const first = await tx.query('SELECT txid_current() AS txid');
+      await tx.savepoint(() => tx.query('SELECT 1 / 0')).catch(() => undefined);
+      const second = await tx.query('SELECT txid_current() AS txid');
+      assert(first.rows[0].txid === second.rows[0].txid, 'transaction spanned server connections');
+    });
+  }],
+
+  ['timestamps', async () => {
+    const { rows } = await db.replica.query(`SELECT '2024-01-02 03:04:05.678+00'::timestamptz AS at`);
+    const at = rows[0].at;
+    assert(new Date(at).toISOString() === '2024-01-02T03:04:05.678Z', `timestamp decoded as ${at}`);
+  }],
+
+  // The pooler must route the cancel to the server running the query, and
+  // the pool must keep working afterwards
+  ['deadline cancel', async () => {
+    const deadline = new Deadline(200);
+    setTimeout(() => deadline.cancel('timeout'), 200).unref();
+
+    const startedAt = Date.now();
+    const error = await runWithDeadline(deadline, () => db.primary.query('SELECT pg_sleep(10)'))
+      .then(() => undefined, (err: Error) => err);
+    const elapsed = Date.now() - startedAt;
+    assert(error, 'pg_sleep was not interrupted');
+    assert(elapsed < 5000, `cancel took ${elapsed}ms`);
+
+    const { rows } = await db.primary.query('SELECT 1 AS ok');
+    assert(rows[0].ok === 1, 'pool unusable after cancel');
+  }]
+];
+
+/**
+ * Runs the app's query paths through the configured pools and reports any
+ * that break behind a transaction pooler: named statements, pipelines,
+ * transactions, timestamp decoding and deadline cancellation. Point it at
+ * PgBouncer or infrastructure/pooler/txpool.py with DB_POOLER_MODE=transaction;
+ * infrastructure/pooler/check.sh does both.
+ *
+ *   npm run check:pooler
+ */
+const run = async (): Promise<boolean> => {
+  const { mode, primaryHost, port, preparedStatements } = config.database.pooler;
+  logger.info(`Pooler mode ${mode}` +
+    (mode === 'transaction' ? ` via ${primaryHost}:${port}, prepared statements ${preparedStatements ? 'on' : 'off'}` : ''));
+
+  let failures = 0;
+  for (const [name, check] of checks) {
+    try {
+      await check();
+      logger.info(`ok    ${name}`);
+    } catch (error) {
+      failures++;
+      logger.error(`FAIL  ${name}: ${(error as Error).message}`);
+    }
+  }
+
+  return failures === 0;
+};
+
+run()
+  .then(async (passed) => {
+    await dbManager.gracefulShutdown();
+    process.exit(passed ? 0 : 1);
+  })
+  .catch((error) => {
+    logger.error('Pooler check failed:', error);
+    process.exit(1);
+  });
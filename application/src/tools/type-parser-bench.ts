@@ -0,0 +1,57 @@
+import { performance } from 'perf_hooks';
+import { types } from 'pg';
+import { logger } from '../logger';
+import { parseTimestamptz } from '../type-parsers';
+
+const ROWS = 10000;
+const ROUNDS = 20;
+const TIMESTAMPTZ_OID = 1184;
+
+// createdAt and updatedAt as Postgres sends them with TimeZone=UTC
+const rows = Array.from({ length: ROWS }, (_, i) => {
+  const created = new Date(Date.UTC(2024, 0, 1) + i * 61013);
+  const text = (date: Date, micros: number) =>
+    `${date.toISOString().slice(0, 19).replace('T', ' ')}.${String(micros).padStart(6, '0')}+00`;
+  return [text(created, (i * 7919) % 1000000), text(new Date(created.getTime() + 86400000), (i * 104729) % 1000000)];
+});
+
+const time = (decode: (text: string) => unknown): number => {
+  const start = performance.now();
+  for (let round = 0; round < ROUNDS; round++) {
+    for (const [createdAt, updatedAt] of rows) {
+      decode(createdAt);
+      decode(updatedAt);
+    }
+  }
+  return (performance.now() - start) / ROUNDS;
+};
+
+/**
+ * Decodes the timestamp columns of a 10k-row users result both ways and
+ * checks they agree: pg's default parser plus the toISOString that
+ * serialization does afterwards, against the fast string-only parser.
+ *
+ *   npm run bench:types
+ */
+const run = (): boolean => {
+  const parseDate = types.getTypeParser(TIMESTAMPTZ_OID, 'text');
+  const viaDate = (text: string) => (parseDate(text) as Date).toISOString();
+
+  const mismatches = rows.flat().filter((text) => viaDate(text) !== parseTimestamptz(text));
+  if (mismatches.length > 0) {
+    logger.error(`${mismatches.length} values decode differently, e.g. ${mismatches[0]}`);
+  }
+
+  // Warm both paths before measuring
+  time(viaDate);
+  time(parseTimestamptz);
+
+  const dateMs = time(viaDate);
+  const fastMs = time(parseTimestamptz);
+  logger.info(`${ROWS} rows x 2 timestamptz: Date + toISOString ${dateMs.toFixed(2)}ms, fast ${fastMs.toFixed(2)}ms ` +
+    `(${(dateMs / fastMs).toFixed(1)}x)`);
+
+  return mismatches.length === 0;
+};
+
+process.exit(run() ? 0 : 1);
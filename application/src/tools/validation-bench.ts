@@ -0,0 +1,106 @@
+import { performance } from 'perf_hooks';
+import { isDeepStrictEqual } from 'util';
+import Joi from 'joi';
+import { logger } from '../logger';
+import {
+  createUserSchema,
+  updateUserSchema,
+  validateCreateUser,
+  validateUpdateUser
+} from '../user.validation';
+
+interface Case {
+  name: string;
+  schema: Joi.ObjectSchema;
+  compiled: (input: unknown) => Joi.ValidationResult;
+  bodies: unknown[];
+}
+
+const ITERATIONS = 200000;
+
+const cases: Case[] = [
+  {
+    name: 'create (valid)',
+    schema: createUserSchema,
+    compiled: validateCreateUser,
+    bodies: [
+      { email: 'john.doe@example.com', firstName: 'John', lastName: 'Doe' },
+      { email: 'jane+test@mail.example.org', firstName: 'Jane', lastName: 'Roe', isActive: false }
+    ]
+  },
+  {
+    name: 'update (valid)',
+    schema: updateUserSchema,
+    compiled: validateUpdateUser,
+    bodies: [{ firstName: 'Johnny' }, { email: 'j.doe@example.com', isActive: true }]
+  },
+  {
+    name: 'create (invalid)',
+    schema: createUserSchema,
+    compiled: validateCreateUser,
+    bodies: [
+      { email: 'not-an-email', firstName: 'John', lastName: 'Doe' },
+      { email: 'john@example.com', firstName: '', lastName: 'Doe' },
+      { email: 'john@example.com', firstName: 'John', lastName: 'Doe', role: 'admin' },
+      { email: 'john@example.com', firstName: 'John', lastName: 'Doe', isActive: 'true' },
+      { email: 'john@example.invalidtld', firstName: 'John', lastName: 'Doe' },
+      'john@example.com'
+    ]
+  },
+  {
+    name: 'update (invalid)',
+    schema: updateUserSchema,
+    compiled: validateUpdateUser,
+    bodies: [{}, { lastName: 'x'.repeat(101) }, { email: 42 }]
+  }
+];
+
+const outcome = (result: Joi.ValidationResult) => ({
+  value: result.value,
+  errors: result.error?.details.map((d) => d.message)
+});
+
+const time = (validate: (input: unknown) => unknown, bodies: unknown[]): number => {
+  const start = performance.now();
+  for (let i = 0; i < ITERATIONS; i++) {
+    validate(bodies[i % bodies.length]);
+  }
+  return performance.now() - start;
+};
+
+/**
+ * Checks that the compiled validators agree with Joi on every sample body,
+ * then times both:
+ *
+ *   npm run bench:validation
+ */
+const run = (): boolean => {
+  let agreed = true;
+
+  for (const { name, schema, compiled, bodies } of cases) {
+    for (const body of bodies) {
+      const expected = outcome(schema.validate(body));
+      const actual = outcome(compiled(body));
+      if (!isDeepStrictEqual(expected, actual)) {
+        agreed = false;
+        logger.error(`${name}: results differ for ${JSON.stringify(body)}`, { expected, actual });
+      }
+    }
+
+    // Warm both paths before measuring
+    time((body) => schema.validate(body), bodies);
+    time(compiled, bodies);
+
+    const joiMs = time((body) => schema.validate(body), bodies);
+    const compiledMs = time(compiled, bodies);
+    const perCall = (ms: number) => `${((ms * 1000) / ITERATIONS).toFixed(2)}us/call`;
+    logger.info(
+      `${name.padEnd(18)} joi ${perCall(joiMs)}  compiled ${perCall(compiledMs)}  ` +
+      `${(joiMs / compiledMs).toFixed(1)}x`
+    );
+  }
+
+  return agreed;
+};
+
+process.exit(run() ? 0 : 1);
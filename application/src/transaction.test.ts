@@ -0,0 +1,170 @@
+import { PoolClient } from 'pg';
+import { Deadline, runWithDeadline } from './deadline';
+import { MeteredPool } from './pool';
+import { RetryPolicy, Transaction, TransactionConflictError, isRetryableError, runTransaction } from './transaction';
+
+const pgError = (code: string, message = `error ${code}`) => Object.assign(new Error(message), { code });
+
+// A pool handing out one client that records every statement it is sent
+const fakePool = () => {
+  const client = { query: jest.fn().mockResolvedValue({ rows: [], rowCount: 0 }) };
+  const discard = jest.fn();
+  const pool = {
+    withClient: jest.fn((fn: (client: PoolClient, discard: () => void) => Promise<unknown>) =>
+      fn(client as unknown as PoolClient, discard))
+  };
+  const statements = () => client.query.mock.calls.map(([query]) => (typeof query === 'string' ? query : query.text));
+  return { pool: pool as unknown as MeteredPool, client, discard, statements };
+};
+
+const policy: RetryPolicy = { maxRetries: 3, baseDelayMs: 0, maxDelayMs: 0 };
+
+describe('isRetryableError', () => {
+  it.each(['40001', '40P01'])('retries %s', (code) => {
+    expect(isRetryableError(pgError(code))).toBe(true);
+  });
+
+  it.each(['23505', '23503', '40002', '57014', '08006', undefined])('does not retry %s', (code) => {
+    expect(isRetryableError(code === undefined ? new Error('plain') : pgError(code))).toBe(false);
+  });
+
+  it('copes with values that are not errors', () => {
+    expect(isRetryableError(undefined)).toBe(false);
+    expect(isRetryableError('40001')).toBe(false);
+  });
+});
+
+describe('runTransaction', () => {
+  it('commits when fn resolves', async () => {
+    const { pool, statements } = fakePool();
+
+    const result = await runTransaction(pool, async (tx) => {
+      await tx.query('UPDATE users SET is_active = $1', [false]);
+      return 'done';
+    }, { isolation: 'serializable', readOnly: false }, policy);
+
+    expect(result).toBe('done');
+    expect(statements()).toEqual(['BEGIN ISOLATION LEVEL SERIALIZABLE', 'UPDATE users SET is_active = $1', 'COMMIT']);
+  });
+
+  it('rolls back and rethrows when fn throws', async () => {
+    const { pool, statements } = fakePool();
+    const error = new Error('boom');
+
+    await expect(runTransaction(pool, async () => { throw error; }, {}, policy)).rejects.toBe(error);
+    expect(statements()).toEqual(['BEGIN', 'ROLLBACK']);
+  });
+
+  it.each(['40001', '40P01'])('reruns fn from the start after %s', async (code) => {
+    const { pool, statements } = fakePool();
+    const fn = jest.fn()
+      .mockRejectedValueOnce(pgError(code))
+      .mockRejectedValueOnce(pgError(code))
+      .mockResolvedValueOnce('done');
+
+    await expect(runTransaction(pool, fn, {}, policy)).resolves.toBe('done');
+    expect(fn).toHaveBeenCalledTimes(3);
+    expect(statements()).toEqual(['BEGIN', 'ROLLBACK', 'BEGIN', 'ROLLBACK', 'BEGIN', 'COMMIT']);
+  });
+
+  it.each(['23505', '23503', '57014'])('does not retry %s', async (code) => {
+    const { pool } = fakePool();
+    const error = pgError(code);
+    const fn = jest.fn().mockRejectedValue(error);
+
+    await expect(runTransaction(pool, fn, {}, policy)).rejects.toBe(error);
+    expect(fn).toHaveBeenCalledTimes(1);
+  });
+
+  it('gives up with TransactionConflictError once retries run out', async () => {
+    const { pool } = fakePool();
+    const error = pgError('40001');
+    const fn = jest.fn().mockRejectedValue(error);
+
+    const thrown = await runTransaction(pool, fn, { maxRetries: 2 }, policy).catch((e) => e);
+
+    expect(thrown).toBeInstanceOf(TransactionConflictError);
+    expect(thrown.attempts).toBe(3);
+    expect(thrown.cause).toBe(error);
+    expect(fn).toHaveBeenCalledTimes(3);
+  });
+
+  it('stops retrying when the deadline would expire during the backoff', async () => {
+    const { pool } = fakePool();
+    const fn = jest.fn().mockRejectedValue(pgError('40P01'));
+    const slow: RetryPolicy = { maxRetries: 5, baseDelayMs: 60000, maxDelayMs: 60000 };
+    jest.spyOn(Math, 'random').mockReturnValue(0.5);
+
+    try {
+      const thrown = await runWithDeadline(new Deadline(1000), () => runTransaction(pool, fn, {}, slow)).catch((e) => e);
+      expect(thrown).toBeInstanceOf(TransactionConflictError);
+      expect(fn).toHaveBeenCalledTimes(1);
+    } finally {
+      jest.restoreAllMocks();
+    }
+  });
+
+  it('bounds the transaction by the time left under a deadline', async () => {
+    const { pool, client, statements } = fakePool();
+
+    await runWithDeadline(new Deadline(5000), () => runTransaction(pool, (tx) => tx.query('SELECT 1'), {}, policy));
+
+    expect(statements()[1]).toMatch(/^SET LOCAL statement_timeout = \d+$/);
+    const timeout = Number(statements()[1].split('= ')[1]);
+    expect(timeout).toBeGreaterThan(0);
+    expect(timeout).toBeLessThanOrEqual(5000);
+    expect(client.query.mock.calls[2][0].query_timeout).toBeLessThanOrEqual(5000);
+  });
+
+  it('discards the connection when the rollback fails', async () => {
+    const { pool, client, discard } = fakePool();
+    client.query.mockImplementation(async (query: string) => {
+      if (query === 'ROLLBACK') {
+        throw new Error('connection terminated');
+      }
+      return { rows: [], rowCount: 0 };
+    });
+    const error = new Error('boom');
+
+    await expect(runTransaction(pool, async () => { throw error; }, {}, policy)).rejects.toBe(error);
+    expect(discard).toHaveBeenCalledTimes(1);
+  });
+});
+
+describe('Transaction.savepoint', () => {
+  it('releases the savepoint when fn resolves', async () => {
+    const { client, statements } = fakePool();
+    const tx = new Transaction(client as unknown as PoolClient);
+
+    await expect(tx.savepoint(async () => 'ok')).resolves.toBe('ok');
+    expect(statements()).toEqual(['SAVEPOINT sp_1', 'RELEASE SAVEPOINT sp_1']);
+  });
+
+  it('rolls back to the savepoint and rethrows, leaving the transaction usable', async () => {
+    const { client, statements } = fakePool();
+    const tx = new Transaction(client as unknown as PoolClient);
+    const error = pgError('23505');
+
+    await expect(tx.savepoint(async () => { throw error; })).rejects.toBe(error);
+    await tx.query('SELECT 1');
+    expect(statements()).toEqual(['SAVEPOINT sp_1', 'ROLLBACK TO SAVEPOINT sp_1', 'SELECT 1']);
+  });
+
+  it('names nested savepoints by depth', async () => {
+    const { client, statements } = fakePool();
+    const tx = new Transaction(client as unknown as PoolClient);
+
+    await tx.savepoint((outer) => outer.savepoint(async () => undefined));
+    expect(statements()).toEqual(['SAVEPOINT sp_1', 'SAVEPOINT sp_2', 'RELEASE SAVEPOINT sp_2', 'RELEASE SAVEPOINT sp_1']);
+  });
+
+  it('refuses to send a statement once the deadline has expired', () => {
+    const { client } = fakePool();
+    const deadline = new Deadline(1000);
+    deadline.cancel('client closed');
+    const tx = new Transaction(client as unknown as PoolClient, deadline);
+
+    expect(() => tx.query('SELECT 1')).toThrow('Deadline exceeded: client closed');
+    expect(client.query).not.toHaveBeenCalled();
+  });
+});
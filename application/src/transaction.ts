@@ -0,0 +1,143 @@
+import { PoolClient, QueryConfig, QueryResult, QueryResultRow } from 'pg';
+import { Deadline, currentDeadline } from './deadline';
+import { logger } from './logger';
+import { MeteredPool } from './pool';
+
+export type IsolationLevel = 'read committed' | 'repeatable read' | 'serializable';
+
+export interface TransactionOptions {
+  isolation?: IsolationLevel;
+  readOnly?: boolean;
+  // Attempts after the first; defaults to config
+  maxRetries?: number;
+}
+
+export interface RetryPolicy {
+  maxRetries: number;
+  baseDelayMs: number;
+  maxDelayMs: number;
+}
+
+// serialization_failure and deadlock_detected: the transaction lost a
+// conflict and is expected to succeed if run again from the start
+const RETRYABLE_CODES = new Set(['40001', '40P01']);
+
+export const isRetryableError = (error: unknown): boolean =>
+  RETRYABLE_CODES.has((error as { code?: string })?.code as string);
+
+/**
+ * A transaction still conflicting after every retry. Surfaces as 503 with
+ * Retry-After rather than a 500, since the request itself was fine.
+ */
+export class TransactionConflictError extends Error {
+  constructor(public readonly attempts: number, public readonly cause: Error) {
+    super(`Transaction conflicted after ${attempts} attempts: ${cause.message}`);
+    this.name = 'TransactionConflictError';
+  }
+}
+
+/**
+ * The connection a transaction runs on. savepoint() nests: a failure inside
+ * rolls back to the savepoint and rethrows, leaving the outer transaction
+ * usable if the caller handles it. Under a request deadline every statement
+ * gets a timeout matching the time left, as MeteredPool.query does.
+ */
+export class Transaction {
+  private depth = 0;
+
+  constructor(private client: PoolClient, private deadline?: Deadline) {}
+
+  query<R extends QueryResultRow = any>(text: string | QueryConfig, values?: unknown[]): Promise<QueryResult<R>> {
+    const queryConfig: QueryConfig = typeof text === 'string' ? { text, values } : text;
+    if (!this.deadline) {
+      return this.client.query<R>(queryConfig);
+    }
+
+    this.deadline.throwIfExpired();
+    return this.client.query<R>({ ...queryConfig, query_timeout: this.deadline.remaining() } as QueryConfig);
+  }
+
+  async savepoint<T>(fn: (tx: Transaction) => Promise<T>): Promise<T> {
+    const name = `sp_${++this.depth}`;
+    await this.query(`SAVEPOINT ${name}`);
+
+    try {
+      const result = await fn(this);
+      await this.query(`RELEASE SAVEPOINT ${name}`);
+      return result;
+    } catch (error) {
+      await this.query(`ROLLBACK TO SAVEPOINT ${name}`);
+      throw error;
+    } finally {
+      this.depth--;
+    }
+  }
+}
+
+const beginStatement = ({ isolation, readOnly }: TransactionOptions): string =>
+  ['BEGIN', isolation && `ISOLATION LEVEL ${isolation.toUpperCase()}`, readOnly && 'READ ONLY']
+    .filter(Boolean)
+    .join(' ');
+
+// Full jitter: anywhere up to the exponential bound, so retrying callers
+// that collided once do not collide again in lockstep
+const backoff = (attempt: number, { baseDelayMs, maxDelayMs }: RetryPolicy): number =>
+  Math.random() * Math.min(maxDelayMs, baseDelayMs * 2 ** attempt);
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+/**
+ * Runs fn in a transaction on one connection of the pool, committing if it
+ * resolves and rolling back if it throws. Serialization failures and
+ * deadlocks rerun fn from the start after a jittered backoff, so fn must
+ * not have side effects outside the database. Retries stop early when the
+ * request deadline would expire during the backoff.
+ *
+ * Under a deadline, statement_timeout is set for the transaction to the time
+ * left, so the server ends a statement that would outlive the request and
+ * releases its locks even if the cancel sent on abort is lost.
+ */
+export const runTransaction = async <T>(
+  pool: MeteredPool,
+  fn: (tx: Transaction) => Promise<T>,
+  options: TransactionOptions,
+  policy: RetryPolicy
+): Promise<T> => {
+  const maxRetries = options.maxRetries ?? policy.maxRetries;
+
+  for (let attempt = 0; ; attempt++) {
+    try {
+      return await pool.withClient(async (client, discard) => {
+        const deadline = currentDeadline();
+        await client.query(beginStatement(options));
+        try {
+          if (deadline) {
+            await client.query(`SET LOCAL statement_timeout = ${Math.max(1, Math.ceil(deadline.remaining()))}`);
+          }
+          const result = await fn(new Transaction(client, deadline));
+          await client.query('COMMIT');
+          return result;
+        } catch (error) {
+          await client.query('ROLLBACK').catch((rollbackError) => {
+            logger.warn('Rollback failed, discarding connection:', rollbackError);
+            discard();
+          });
+          throw error;
+        }
+      });
+    } catch (error) {
+      if (!isRetryableError(error)) {
+        throw error;
+      }
+
+      const delay = backoff(attempt, policy);
+      const deadline = currentDeadline();
+      if (attempt >= maxRetries || (deadline && deadline.remaining() <= delay)) {
+        throw new TransactionConflictError(attempt + 1, error as Error);
+      }
+
+      logger.debug(`Transaction conflict (${(error as { code: string }).code}), retry ${attempt + 1} in ${delay.toFixed(0)}ms`);
+      await sleep(delay);
+    }
+  }
+};
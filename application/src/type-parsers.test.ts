@@ -0,0 +1,54 @@
+import { types } from 'pg';
+import { parseTimestamptz, typeParsers } from './type-parsers';
+
+const TIMESTAMPTZ_OID = 1184;
+const parseDate = types.getTypeParser(TIMESTAMPTZ_OID, 'text');
+
+// What a response carried with pg's parser: the Date, serialized
+const viaDate = (text: string): string => JSON.parse(JSON.stringify({ at: parseDate(text) })).at;
+
+describe('parseTimestamptz', () => {
+  it.each([
+    ['no fraction', '2024-01-02 03:04:05+00'],
+    ['one fractional digit', '2024-01-02 03:04:05.1+00'],
+    ['two fractional digits', '2024-01-02 03:04:05.12+00'],
+    ['milliseconds', '2024-01-02 03:04:05.123+00'],
+    ['microseconds', '2024-01-02 03:04:05.123456+00'],
+    ['microseconds below a millisecond', '2024-01-02 03:04:05.000999+00'],
+    ['microseconds just under a second', '2024-12-31 23:59:59.999999+00'],
+    ['a leap day', '2024-02-29 12:00:00.5+00'],
+    ['the epoch', '1970-01-01 00:00:00+00'],
+    ['a year before 1000', '0099-06-15 08:30:00.25+00'],
+    ['a positive offset with minutes', '2024-01-02 03:04:05.123456+05:30'],
+    ['a negative offset', '2024-01-02 03:04:05.5-08'],
+    ['an offset crossing midnight', '2024-01-01 23:30:00+14'],
+    ['a BC date', '0044-03-15 12:00:00+00 BC'],
+    ['a BC date with a fraction and offset', '0001-01-01 00:00:00.75+01 BC'],
+    ['a five-digit year', '10000-01-01 00:00:00+00']
+  ])('matches a serialized Date for %s', (_, text) => {
+    expect(parseTimestamptz(text)).toBe(viaDate(text));
+  });
+
+  it('returns the UTC fast path without building a Date', () => {
+    expect(parseTimestamptz('2024-01-02 03:04:05.123456+00')).toBe('2024-01-02T03:04:05.123Z');
+  });
+
+  // A Date cannot hold them: pg returns Infinity, which serializes as null
+  it.each(['infinity', '-infinity'])('keeps %s as text', (text) => {
+    expect(parseTimestamptz(text)).toBe(text);
+  });
+});
+
+describe('typeParsers', () => {
+  it("leaves pg's parsers in place for 'pg'", () => {
+    expect(typeParsers('pg')).toBeUndefined();
+  });
+
+  it("swaps in the string parser for text timestamptz only with 'fast'", () => {
+    const parsers = typeParsers('fast');
+
+    expect(parsers?.getTypeParser(TIMESTAMPTZ_OID, 'text')).toBe(parseTimestamptz);
+    expect(parsers?.getTypeParser(TIMESTAMPTZ_OID, 'binary')).toBe(types.getTypeParser(TIMESTAMPTZ_OID, 'binary'));
+    expect(parsers?.getTypeParser(20, 'text')).toBe(types.getTypeParser(20, 'text'));
+  });
+});
@@ -0,0 +1,45 @@
+import { CustomTypesConfig, types } from 'pg';
+
+export type TypeParserMode = 'pg' | 'fast';
+
+const TIMESTAMPTZ_OID = 1184;
+
+// Text form of a timestamptz in a session with TimeZone=UTC
+const UTC_TIMESTAMP = /^(\d{4}-\d{2}-\d{2}) (\d{2}:\d{2}:\d{2})(?:\.(\d{1,6}))?\+00$/;
+
+const parseDate = types.getTypeParser(TIMESTAMPTZ_OID, 'text');
+
+/**
+ * timestamptz text to the ISO string a Date would serialize to, without
+ * creating the Date: '2024-01-02 03:04:05.123456+00' -> '2024-01-02T03:04:05.123Z'.
+ * Other offsets, BC dates and infinity go through the default parser.
+ */
+export const parseTimestamptz = (text: string): string => {
+  const match = UTC_TIMESTAMP.exec(text);
+  if (match) {
+    return `${match[1]}T${match[2]}.${(match[3] ?? '').padEnd(3, '0').slice(0, 3)}Z`;
+  }
+
+  const date = parseDate(text);
+  return date instanceof Date && !isNaN(date.getTime()) ? date.toISOString() : text;
+};
+
+/**
+ * Type parsers for one pool. 'pg' keeps pg's own parsers (timestamptz as
+ * Date). 'fast' returns timestamptz columns as ISO strings, which is all the
+ * API does with them; the pool should also set TimeZone=UTC so every value
+ * takes the string-only path. Everything else (uuid, text and int8 are
+ * already left as strings) uses pg's parsers.
+ */
+export const typeParsers = (mode: TypeParserMode): CustomTypesConfig | undefined => {
+  if (mode !== 'fast') {
+    return undefined;
+  }
+
+  return {
+    getTypeParser: ((oid: number, format?: any) =>
+      oid === TIMESTAMPTZ_OID && format !== 'binary'
+        ? parseTimestamptz
+        : types.getTypeParser(oid, format)) as typeof types.getTypeParser
+  };
+};
@@ -1,8 +1,12 @@
 import { Request, Response, NextFunction } from 'express';
-import Joi from 'joi';
-import { UserService } from './user.service';
+import { EmailTakenError, UserService } from './user.service';
 import { CreateUserRequest, UpdateUserRequest, UserFilters } from './user.types';
+import { config } from './config';
 import { logger } from './logger';
+import { sendNotModified, weakEtag } from './etag';
+import { sendJson, streamJsonArray } from './serializer';
+import { serializeUser, serializeUserResponse, userListEnvelope } from './user.serializers';
+import { validateCreateUser, validateUpdateUser } from './user.validation';
 
 export class UserController {
   private userService: UserService;
@@ -11,21 +15,6 @@ export class UserController {
     this.userService = new UserService();
   }
 
-  // Validation schemas
-  private createUserSchema = Joi.object({
-    email: Joi.string().email().required(),
-    firstName: Joi.string().min(1).max(100).required(),
-    lastName: Joi.string().min(1).max(100).required(),
-    isActive: Joi.boolean().optional()
-  });
-
-  private updateUserSchema = Joi.object({
-    email: Joi.string().email().optional(),
-    firstName: Joi.string().min(1).max(100).optional(),
-    lastName: Joi.string().min(1).max(100).optional(),
-    isActive: Joi.boolean().optional()
-  }).min(1);
-
   /**
    * Create a new user
    * POST /api/users
@@ -33,7 +22,7 @@ export class UserController {
   createUser = async (req: Request, res: Response, next: NextFunction): Promise<void> => {
     try {
       // Validate request body
-      const { error, value } = this.createUserSchema.validate(req.body);
+      const { error, value } = validateCreateUser(req.body);
       if (error) {
         res.status(400).json({
           success: false,
@@ -58,11 +47,11 @@ export class UserController {
       // Create user
       const user = await this.userService.createUser(userData);
 
-      res.status(201).json({
+      sendJson(res, serializeUserResponse({
         success: true,
         message: 'User created successfully',
         data: user
-      });
+      }), 201);
     } catch (error) {
       logger.error('Error in createUser controller:', error);
       next(error);
@@ -72,6 +61,8 @@ export class UserController {
   /**
    * Get user by ID
    * GET /api/users/:id
+   * A client revalidating with If-None-Match gets 304 from a version lookup
+   * alone when its copy is current.
    */
   getUserById = async (req: Request, res: Response, next: NextFunction): Promise<void> => {
     try {
@@ -85,9 +76,16 @@ export class UserController {
         return;
       }
 
-      const user = await this.userService.getUserById(id);
+      if (req.headers['if-none-match']) {
+        const version = await this.userService.getUserVersion(id);
+        if (version && sendNotModified(req, res, weakEtag(id, version))) {
+          return;
+        }
+      }
+
+      const found = await this.userService.getUserById(id);
 
-      if (!user) {
+      if (!found) {
         res.status(404).json({
           success: false,
           message: 'User not found'
@@ -95,10 +93,14 @@ export class UserController {
         return;
       }
 
-      res.json({
+      if (sendNotModified(req, res, weakEtag(id, found.version))) {
+        return;
+      }
+
+      sendJson(res, serializeUserResponse({
         success: true,
-        data: user
-      });
+        data: found.user
+      }));
     } catch (error) {
       logger.error('Error in getUserById controller:', error);
       next(error);
@@ -108,6 +110,8 @@ export class UserController {
   /**
    * Get users with optional filters
    * GET /api/users
+   * The page's ETag covers each row's id and microsecond version plus the total, so an
+   * unchanged page is answered with 304 before it is serialized.
    */
   getUsers = async (req: Request, res: Response, next: NextFunction): Promise<void> => {
     try {
@@ -135,18 +139,39 @@ export class UserController {
         return;
       }
 
-      const result = await this.userService.getUsers(filters);
+      const limit = filters.limit || 50;
+      const offset = filters.offset || 0;
+      const envelope = (total: number) =>
+        userListEnvelope({ total, limit, offset, hasMore: offset + limit < total });
 
-      res.json({
-        success: true,
-        data: result.users,
-        pagination: {
-          total: result.total,
-          limit: filters.limit || 50,
-          offset: filters.offset || 0,
-          hasMore: (filters.offset || 0) + (filters.limit || 50) < result.total
+      if (config.database.listJsonProjection) {
+        // Postgres built the array; the text is tagged and sent untouched
+        const { json, total } = await this.userService.getUsersJson(filters);
+        if (sendNotModified(req, res, weakEtag(total, limit, offset, json))) {
+          return;
         }
-      });
+
+        const { head, tail } = envelope(total);
+        sendJson(res, head + json + tail);
+        return;
+      }
+
+      const result = await this.userService.getUsers(filters);
+
+      // Microsecond versions, as for single users: two updates within one
+      // millisecond must not share a tag
+      const etag = weakEtag(
+        result.total,
+        limit,
+        offset,
+        ...result.users.map((user, i) => `${user.id}@${result.versions[i]}`)
+      );
+      if (sendNotModified(req, res, etag)) {
+        return;
+      }
+
+      const { head, tail } = envelope(result.total);
+      await streamJsonArray(res, head, result.users, serializeUser, tail);
     } catch (error) {
       logger.error('Error in getUsers controller:', error);
       next(error);
@@ -170,7 +195,7 @@ export class UserController {
       }
 
       // Validate request body
-      const { error, value } = this.updateUserSchema.validate(req.body);
+      const { error, value } = validateUpdateUser(req.body);
       if (error) {
         res.status(400).json({
           success: false,
@@ -182,18 +207,7 @@ export class UserController {
 
       const userData: UpdateUserRequest = value;
 
-      // Check if email already exists (excluding current user)
-      if (userData.email) {
-        const emailExists = await this.userService.emailExists(userData.email, id);
-        if (emailExists) {
-          res.status(409).json({
-            success: false,
-            message: 'Email already exists'
-          });
-          return;
-        }
-      }
-
+      // The email check runs with the UPDATE, pipelined on the primary
       const updatedUser = await this.userService.updateUser(id, userData);
 
       if (!updatedUser) {
@@ -204,12 +218,20 @@ export class UserController {
         return;
       }
 
-      res.json({
+      sendJson(res, serializeUserResponse({
         success: true,
         message: 'User updated successfully',
         data: updatedUser
-      });
+      }));
     } catch (error) {
+      if (error instanceof EmailTakenError) {
+        res.status(409).json({
+          success: false,
+          message: 'Email already exists'
+        });
+        return;
+      }
+
       logger.error('Error in updateUser controller:', error);
       next(error);
     }
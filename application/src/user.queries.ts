@@ -0,0 +1,285 @@
+import { CreateUserRequest, UpdateUserRequest, UserFilters } from './user.types';
+
+export interface SqlQuery {
+  text: string;
+  values: any[];
+}
+
+export const DEFAULT_PAGE_SIZE = 50;
+
+// Soft-deleted users (deleted_at set) are invisible to every read and write
+// below; only the purger and emailExistsQuery see them
+const LIVE = 'deleted_at IS NULL';
+
+export const USER_COLUMNS = `id, email, first_name as "firstName", last_name as "lastName",
+             is_active as "isActive", created_at as "createdAt", updated_at as "updatedAt"`;
+
+// updated_at (maintained by the update_users_updated_at trigger) in
+// microseconds; a Date would drop the last three digits
+const USER_VERSION = '(extract(epoch from updated_at) * 1000000)::bigint';
+
+/**
+ * Multi-row INSERT ... RETURNING for one or more users
+ */
+export const insertUsersQuery = (users: CreateUserRequest[]): SqlQuery => {
+  const rows: string[] = [];
+  const values: any[] = [];
+  users.forEach((userData, i) => {
+    const p = i * 4;
+    rows.push(`($${p + 1}, $${p + 2}, $${p + 3}, $${p + 4}, NOW(), NOW())`);
+    values.push(userData.email, userData.firstName, userData.lastName, userData.isActive ?? true);
+  });
+
+  return {
+    text: `
+      INSERT INTO users (email, first_name, last_name, is_active, created_at, updated_at)
+      VALUES ${rows.join(', ')}
+      RETURNING ${USER_COLUMNS}
+    `,
+    values
+  };
+};
+
+export const userByIdQuery = (id: string): SqlQuery => ({
+  text: `
+      SELECT ${USER_COLUMNS}, ${USER_VERSION} as "_version"
+      FROM users
+      WHERE id = $1 AND ${LIVE}
+    `,
+  values: [id]
+});
+
+/**
+ * Just the version of one user, for answering If-None-Match without the row
+ */
+export const userVersionQuery = (id: string): SqlQuery => ({
+  text: `SELECT ${USER_VERSION} as version FROM users WHERE id = $1 AND ${LIVE}`,
+  values: [id]
+});
+
+/**
+ * The COUNT and page queries behind getUsers; both share the WHERE clause
+ */
+export const listUsersQueries = (filters: UserFilters): { count: SqlQuery; page: SqlQuery } => {
+  let whereClause = `WHERE ${LIVE}`;
+  const values: any[] = [];
+  let paramIndex = 1;
+
+  // Build dynamic WHERE clause
+  if (filters.isActive !== undefined) {
+    whereClause += ` AND is_active = $${paramIndex}`;
+    values.push(filters.isActive);
+    paramIndex++;
+  }
+
+  if (filters.email) {
+    whereClause += ` AND email ILIKE $${paramIndex}`;
+    values.push(`%${filters.email}%`);
+    paramIndex++;
+  }
+
+  const limit = filters.limit || DEFAULT_PAGE_SIZE;
+  const offset = filters.offset || 0;
+
+  return {
+    count: {
+      text: `SELECT COUNT(*) as total FROM users ${whereClause}`,
+      values
+    },
+    page: {
+      text: `
+      SELECT ${USER_COLUMNS}, ${USER_VERSION} as "_version"
+      FROM users
+      ${whereClause}
+      ORDER BY created_at DESC
+      LIMIT $${paramIndex} OFFSET $${paramIndex + 1}
+    `,
+      values: [...values, limit, offset]
+    }
+  };
+};
+
+// Same text as JSON.stringify gives for a Date: UTC, milliseconds, Z
+const isoTimestamp = (column: string) =>
+  `to_char(${column} AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS.MS"Z"')`;
+
+/**
+ * The page of listUsersQueries as one JSON array built by Postgres, with the
+ * keys and values serializeUser writes (only the spacing differs). It comes
+ * back as text, so the driver neither parses it nor creates an object per row.
+ */
+export const listUsersJsonQuery = (filters: UserFilters): SqlQuery => {
+  const { page } = listUsersQueries(filters);
+
+  return {
+    text: `
+      SELECT coalesce(json_agg(json_build_object(
+        'id', p.id, 'email', p.email, 'firstName', p."firstName", 'lastName', p."lastName",
+        'isActive', p."isActive", 'createdAt', ${isoTimestamp('p."createdAt"')},
+        'updatedAt', ${isoTimestamp('p."updatedAt"')}
+      ) ORDER BY p."createdAt" DESC), '[]')::text as data
+      FROM (${page.text}) p
+    `,
+    values: page.values
+  };
+};
+
+/**
+ * UPDATE for the fields present in userData, or null when there are none
+ */
+export const updateUserQuery = (id: string, userData: UpdateUserRequest): SqlQuery | null => {
+  const updates: string[] = [];
+  const values: any[] = [];
+  let paramIndex = 1;
+
+  // Build dynamic SET clause
+  if (userData.email !== undefined) {
+    updates.push(`email = $${paramIndex}`);
+    values.push(userData.email);
+    paramIndex++;
+  }
+
+  if (userData.firstName !== undefined) {
+    updates.push(`first_name = $${paramIndex}`);
+    values.push(userData.firstName);
+    paramIndex++;
+  }
+
+  if (userData.lastName !== undefined) {
+    updates.push(`last_name = $${paramIndex}`);
+    values.push(userData.lastName);
+    paramIndex++;
+  }
+
+  if (userData.isActive !== undefined) {
+    updates.push(`is_active = $${paramIndex}`);
+    values.push(userData.isActive);
+    paramIndex++;
+  }
+
+  if (updates.length === 0) {
+    return null;
+  }
+
+  updates.push(`updated_at = NOW()`);
+  values.push(id);
+
+  // A new email ($1) already held by another user leaves the row untouched,
+  // even where no unique index enforces it (partitioned users)
+  const emailGuard = userData.email !== undefined
+    ? ` AND NOT EXISTS (SELECT 1 FROM users WHERE email = $1 AND id != $${paramIndex})`
+    : '';
+
+  return {
+    text: `
+      UPDATE users
+      SET ${updates.join(', ')}
+      WHERE id = $${paramIndex} AND ${LIVE}${emailGuard}
+      RETURNING ${USER_COLUMNS}
+    `,
+    values
+  };
+};
+
+/**
+ * Soft deletion marks the row and leaves removing it to the purger. Either
+ * way an already deleted user is not found; only the purger removes those.
+ */
+export const deleteUserQuery = (id: string, soft: boolean): SqlQuery => ({
+  text: soft
+    ? `UPDATE users SET deleted_at = NOW() WHERE id = $1 AND ${LIVE} RETURNING id`
+    : `DELETE FROM users WHERE id = $1 AND ${LIVE} RETURNING id`,
+  values: [id]
+});
+
+/**
+ * Hard-delete up to limit users soft-deleted more than olderThanMs ago,
+ * oldest first. Rows locked by a concurrent write are left for a later batch.
+ * (id, created_at) identifies a row whether or not users is partitioned.
+ */
+export const purgeDeletedUsersQuery = (olderThanMs: number, limit: number): SqlQuery => ({
+  text: `
+      DELETE FROM users
+      WHERE (id, created_at) IN (
+        SELECT id, created_at FROM users
+        WHERE deleted_at < NOW() - $1 * INTERVAL '1 millisecond'
+        ORDER BY deleted_at
+        LIMIT $2
+        FOR UPDATE SKIP LOCKED
+      )
+    `,
+  values: [olderThanMs, limit]
+});
+
+// Counts soft-deleted users too: users_email_key holds their email until purge
+export const emailExistsQuery = (email: string, excludeId?: string): SqlQuery => {
+  if (excludeId) {
+    return { text: 'SELECT 1 FROM users WHERE email = $1 AND id != $2', values: [email, excludeId] };
+  }
+  return { text: 'SELECT 1 FROM users WHERE email = $1', values: [email] };
+};
+
+export interface QueryShape {
+  name: string;
+  query: SqlQuery;
+  // Writes modify rows if executed, e.g. by EXPLAIN ANALYZE
+  write: boolean;
+}
+
+export interface ShapeSample {
+  id: string;
+  email: string;
+  emailFragment: string;
+  deepOffset: number;
+}
+
+/**
+ * Every distinct statement UserService can send, with sample parameters:
+ * each getUsers filter combination (shallow and deep pages), the point
+ * lookups, and one representative of each write.
+ */
+export const userQueryShapes = (sample: ShapeSample): QueryShape[] => {
+  const shapes: QueryShape[] = [];
+
+  for (const isActive of [undefined, true, false]) {
+    for (const email of [undefined, sample.emailFragment]) {
+      for (const offset of [0, sample.deepOffset]) {
+        const filters: UserFilters = { isActive, email, offset };
+        const label = [
+          isActive === undefined ? 'all' : isActive ? 'active' : 'inactive',
+          email ? 'email' : null,
+          offset ? 'deep' : null
+        ].filter(Boolean).join('_');
+
+        const { count, page } = listUsersQueries(filters);
+        if (!offset) {
+          shapes.push({ name: `count_users_${label}`, query: count, write: false });
+        }
+        shapes.push({ name: `list_users_${label}`, query: page, write: false });
+        shapes.push({ name: `list_users_json_${label}`, query: listUsersJsonQuery(filters), write: false });
+      }
+    }
+  }
+
+  shapes.push(
+    { name: 'user_by_id', query: userByIdQuery(sample.id), write: false },
+    { name: 'user_version', query: userVersionQuery(sample.id), write: false },
+    { name: 'email_exists', query: emailExistsQuery(sample.email), write: false },
+    { name: 'email_exists_excluding', query: emailExistsQuery(sample.email, sample.id), write: false },
+    {
+      name: 'insert_user',
+      query: insertUsersQuery([{ email: `new.${sample.email}`, firstName: 'Sample', lastName: 'User' }]),
+      write: true
+    },
+    {
+      name: 'update_user',
+      query: updateUserQuery(sample.id, { email: sample.email, firstName: 'Sample', isActive: true }) as SqlQuery,
+      write: true
+    },
+    { name: 'delete_user', query: deleteUserQuery(sample.id, false), write: true },
+    { name: 'soft_delete_user', query: deleteUserQuery(sample.id, true), write: true },
+    { name: 'purge_deleted_users', query: purgeDeletedUsersQuery(86400000, 500), write: true }
+  );
+
+  return shapes;
+};
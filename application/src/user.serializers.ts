@@ -0,0 +1,45 @@
+import { compileObject } from './serializer';
+import { User } from './user.types';
+
+export interface Pagination {
+  total: number;
+  limit: number;
+  offset: number;
+  hasMore: boolean;
+}
+
+// Typed against User: adding a field to the interface without adding it
+// here fails to compile
+export const serializeUser = compileObject<User>({
+  id: 'string',
+  email: 'string',
+  firstName: 'string',
+  lastName: 'string',
+  isActive: 'boolean',
+  createdAt: 'date',
+  updatedAt: 'date'
+});
+
+const serializePagination = compileObject<Pagination>({
+  total: 'number',
+  limit: 'number',
+  offset: 'number',
+  hasMore: 'boolean'
+});
+
+/**
+ * { success, message?, data } envelope around one user
+ */
+export const serializeUserResponse = compileObject<{ success: boolean; message?: string; data: User }>({
+  success: 'boolean',
+  message: 'string',
+  data: serializeUser
+});
+
+/**
+ * The list envelope around the data array, for streamJsonArray
+ */
+export const userListEnvelope = (pagination: Pagination): { head: string; tail: string } => ({
+  head: '{"success":true,"data":',
+  tail: `,"pagination":${serializePagination(pagination)}}`
+});
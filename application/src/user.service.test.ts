@@ -0,0 +1,78 @@
+import { User, CreateUserRequest } from './user.types';
+
+const mockTx = {
+  query: jest.fn(),
+  savepoint: jest.fn((fn: () => Promise<unknown>) => fn())
+};
+
+jest.mock('./database', () => ({
+  db: { primary: { query: jest.fn() }, replica: { query: jest.fn() } },
+  dbManager: { withTransaction: jest.fn((_role: string, fn: (t: typeof mockTx) => Promise<unknown>) => fn(mockTx)) }
+}));
+
+import { UserService } from './user.service';
+
+const pgError = (code: string, message: string) => Object.assign(new Error(message), { code });
+
+const batch: CreateUserRequest[] = [
+  { email: 'a@example.com', firstName: 'A', lastName: 'One' },
+  { email: 'b@example.com', firstName: 'B', lastName: 'Two' },
+  { email: 'c@example.com', firstName: 'C', lastName: 'Three' }
+];
+
+const rowFor = (userData: CreateUserRequest, id: string) => ({ id, ...userData }) as unknown as User;
+
+describe('UserService batched inserts', () => {
+  const service = new UserService();
+  const insertUsers = (users: CreateUserRequest[]) => service['insertUsers'](users);
+
+  beforeEach(() => {
+    mockTx.query.mockReset();
+    mockTx.savepoint.mockClear();
+  });
+
+  it('maps each caller to its row from one multi-row INSERT', async () => {
+    mockTx.query.mockResolvedValueOnce({ rows: [rowFor(batch[2], '3'), rowFor(batch[0], '1'), rowFor(batch[1], '2')] });
+
+    const results = await insertUsers(batch);
+
+    expect(mockTx.query).toHaveBeenCalledTimes(1);
+    expect(results.map((user) => (user as User).id)).toEqual(['1', '2', '3']);
+  });
+
+  it('falls back to per-row inserts so only the failing row errors', async () => {
+    const duplicate = pgError('23505', 'duplicate key value violates unique constraint "users_email_key"');
+    mockTx.query
+      .mockRejectedValueOnce(duplicate)
+      .mockResolvedValueOnce({ rows: [rowFor(batch[0], '1')] })
+      .mockRejectedValueOnce(duplicate)
+      .mockResolvedValueOnce({ rows: [rowFor(batch[2], '3')] });
+
+    const results = await insertUsers(batch);
+
+    expect(mockTx.query).toHaveBeenCalledTimes(4);
+    expect(mockTx.savepoint).toHaveBeenCalledTimes(4);
+    expect(results[0]).toMatchObject({ id: '1' });
+    expect(results[1]).toBe(duplicate);
+    expect(results[2]).toMatchObject({ id: '3' });
+  });
+
+  it('rethrows a serialization failure instead of retrying rows', async () => {
+    const conflict = pgError('40001', 'could not serialize access');
+    mockTx.query.mockRejectedValueOnce(conflict);
+
+    await expect(insertUsers(batch)).rejects.toBe(conflict);
+    expect(mockTx.query).toHaveBeenCalledTimes(1);
+  });
+
+  it('rethrows a deadlock hit during the per-row fallback', async () => {
+    const deadlock = pgError('40P01', 'deadlock detected');
+    mockTx.query
+      .mockRejectedValueOnce(pgError('23505', 'duplicate key'))
+      .mockResolvedValueOnce({ rows: [rowFor(batch[0], '1')] })
+      .mockRejectedValueOnce(deadlock);
+
+    await expect(insertUsers(batch)).rejects.toBe(deadlock);
+    expect(mockTx.query).toHaveBeenCalledTimes(3);
+  });
+});
@@ -1,68 +1,157 @@
 import { Pool, QueryResult } from 'pg';
-import { db } from './database';
+import { db, dbManager } from './database';
+import { config } from './config';
 import { logger } from './logger';
-import { User, CreateUserRequest, UpdateUserRequest, UserFilters } from './user.types';
+import { SingleFlight } from './singleflight';
+import { MicroBatcher } from './batcher';
+import { TransactionConflictError, isRetryableError } from './transaction';
+import { User, CreateUserRequest, UpdateUserRequest, UserEventType, UserFilters, UserPage, VersionedUser } from './user.types';
+import { withOutboxEvent } from './outbox';
+import {
+  DEFAULT_PAGE_SIZE,
+  deleteUserQuery,
+  emailExistsQuery,
+  insertUsersQuery,
+  listUsersJsonQuery,
+  listUsersQueries,
+  SqlQuery,
+  updateUserQuery,
+  userByIdQuery,
+  userVersionQuery
+} from './user.queries';
+
+export class EmailTakenError extends Error {
+  constructor(email: string) {
+    super(`Email already exists: ${email}`);
+    this.name = 'EmailTakenError';
+  }
+}
 
 export class UserService {
   private primaryDb: Pool;
   private replicaDb: Pool;
+  private userFlights = new SingleFlight<VersionedUser | null>();
+  private versionFlights = new SingleFlight<string | null>();
+  private listFlights = new SingleFlight<UserPage>();
+  private listJsonFlights = new SingleFlight<{ json: string; total: number }>();
+  private createBatcher?: MicroBatcher<CreateUserRequest, User>;
 
   constructor() {
     this.primaryDb = db.primary;
     this.replicaDb = db.replica;
+
+    const { enabled, maxSize, maxWaitMs } = config.database.writeBatch;
+    if (enabled) {
+      this.createBatcher = new MicroBatcher((batch) => this.insertUsers(batch), maxSize, maxWaitMs);
+    }
   }
 
   /**
    * Create a new user (Write operation - uses primary DB)
+   * With write batching on, concurrent creates share one multi-row INSERT.
    */
   async createUser(userData: CreateUserRequest): Promise<User> {
-    const query = `
-      INSERT INTO users (email, first_name, last_name, is_active, created_at, updated_at)
-      VALUES ($1, $2, $3, $4, NOW(), NOW())
-      RETURNING id, email, first_name as "firstName", last_name as "lastName", 
-                is_active as "isActive", created_at as "createdAt", updated_at as "updatedAt"
-    `;
-
-    const values = [
-      userData.email,
-      userData.firstName,
-      userData.lastName,
-      userData.isActive ?? true
-    ];
-
     try {
       logger.info(`Creating user with email: ${userData.email}`);
-      const result: QueryResult<User> = await this.primaryDb.query(query, values);
-      logger.info(`User created successfully with ID: ${result.rows[0].id}`);
-      return result.rows[0];
+      const user = this.createBatcher
+        ? await this.createBatcher.submit(userData)
+        : await this.insertUser(userData);
+      logger.info(`User created successfully with ID: ${user.id}`);
+      return user;
     } catch (error) {
       logger.error('Error creating user:', error);
+      if (error instanceof TransactionConflictError) {
+        throw error;
+      }
       throw new Error(`Failed to create user: ${error}`);
     }
   }
 
+  /**
+   * The write, plus its outbox event in the same statement when the outbox is on
+   */
+  private recorded(query: SqlQuery, eventType: UserEventType): SqlQuery {
+    return config.outbox.enabled ? withOutboxEvent(query, eventType) : query;
+  }
+
+  private async insertUser(userData: CreateUserRequest): Promise<User> {
+    const { text, values } = this.recorded(insertUsersQuery([userData]), 'user.created');
+    const result: QueryResult<User> = await this.primaryDb.query(text, values);
+    return result.rows[0];
+  }
+
+  /**
+   * Insert a batch of users in one transaction: a multi-row INSERT (one round
+   * trip) under a savepoint, and if that fails, e.g. on a duplicate email,
+   * each row under its own savepoint so only the offending callers see an
+   * error. Either way the batch costs a single commit.
+   */
+  private async insertUsers(batch: CreateUserRequest[]): Promise<Array<User | Error>> {
+    if (batch.length === 1) {
+      return [await this.insertUser(batch[0])];
+    }
+
+    const { text, values } = this.recorded(insertUsersQuery(batch), 'user.created');
+
+    return dbManager.withTransaction('primary', async (tx) => {
+      try {
+        const result = await tx.savepoint(() => tx.query<User>(text, values));
+        logger.debug(`Inserted batch of ${batch.length} users`);
+
+        // Emails are unique, so they tie each returned row back to its caller
+        const byEmail = new Map(result.rows.map((user) => [user.email, user]));
+        return batch.map((userData) => byEmail.get(userData.email) ?? new Error('User missing from batch result'));
+      } catch (error) {
+        if (isRetryableError(error)) {
+          throw error;
+        }
+        logger.warn(`Batched insert of ${batch.length} users failed, retrying individually:`, error);
+
+        const results: Array<User | Error> = [];
+        for (const userData of batch) {
+          const row = this.recorded(insertUsersQuery([userData]), 'user.created');
+          try {
+            const result = await tx.savepoint(() => tx.query<User>(row.text, row.values));
+            results.push(result.rows[0]);
+          } catch (err) {
+            // A conflict means the whole transaction reruns, not just this row
+            if (isRetryableError(err)) {
+              throw err;
+            }
+            results.push(err as Error);
+          }
+        }
+        return results;
+      }
+    });
+  }
+
   /**
    * Get user by ID (Read operation - uses replica DB for better performance)
+   * Concurrent lookups of the same ID share one query.
    */
-  async getUserById(id: string): Promise<User | null> {
-    const query = `
-      SELECT id, email, first_name as "firstName", last_name as "lastName",
-             is_active as "isActive", created_at as "createdAt", updated_at as "updatedAt"
-      FROM users 
-      WHERE id = $1
-    `;
+  async getUserById(id: string): Promise<VersionedUser | null> {
+    if (!config.database.coalesceReads) {
+      return this.fetchUserById(id);
+    }
+    return this.userFlights.do(id, () => this.fetchUserById(id));
+  }
+
+  private async fetchUserById(id: string): Promise<VersionedUser | null> {
+    const { text, values } = userByIdQuery(id);
 
     try {
       logger.debug(`Fetching user with ID: ${id}`);
-      const result: QueryResult<User> = await this.replicaDb.query(query, [id]);
+      const result: QueryResult<User & { _version: string }> = await this.replicaDb.query(text, values);
 
       if (result.rows.length === 0) {
         logger.info(`User not found with ID: ${id}`);
         return null;
       }
 
-      logger.debug(`User found: ${result.rows[0].email}`);
-      return result.rows[0];
+      const { _version, ...user } = result.rows[0];
+      logger.debug(`User found: ${user.email}`);
+      return { user, version: _version };
     } catch (error) {
       logger.error('Error fetching user by ID:', error);
       throw new Error(`Failed to fetch user: ${error}`);
@@ -70,115 +159,131 @@ export class UserService {
   }
 
   /**
-   * Get users with filters (Read operation - uses replica DB)
+   * Current version of a user, or null if it does not exist (Read operation -
+   * uses replica DB). A primary key lookup returning one bigint, so checking a
+   * client's cached copy costs far less than fetching and serializing the row.
    */
-  async getUsers(filters: UserFilters = {}): Promise<{ users: User[]; total: number }> {
-    let whereClause = 'WHERE 1=1';
-    const values: any[] = [];
-    let paramIndex = 1;
-
-    // Build dynamic WHERE clause
-    if (filters.isActive !== undefined) {
-      whereClause += ` AND is_active = $${paramIndex}`;
-      values.push(filters.isActive);
-      paramIndex++;
+  async getUserVersion(id: string): Promise<string | null> {
+    if (!config.database.coalesceReads) {
+      return this.fetchUserVersion(id);
     }
+    return this.versionFlights.do(id, () => this.fetchUserVersion(id));
+  }
+
+  private async fetchUserVersion(id: string): Promise<string | null> {
+    const { text, values } = userVersionQuery(id);
 
-    if (filters.email) {
-      whereClause += ` AND email ILIKE $${paramIndex}`;
-      values.push(`%${filters.email}%`);
-      paramIndex++;
+    try {
+      const result = await this.replicaDb.query(text, values);
+      return result.rows[0]?.version ?? null;
+    } catch (error) {
+      logger.error('Error fetching user version:', error);
+      throw new Error(`Failed to fetch user version: ${error}`);
     }
+  }
 
-    // Count query
-    const countQuery = `SELECT COUNT(*) as total FROM users ${whereClause}`;
+  /**
+   * Get users with filters (Read operation - uses replica DB)
+   * Concurrent requests for the same page and filters share one query.
+   */
+  async getUsers(filters: UserFilters = {}): Promise<UserPage> {
+    if (!config.database.coalesceReads) {
+      return this.fetchUsers(filters);
+    }
+
+    return this.listFlights.do(this.listKey(filters), () => this.fetchUsers(filters));
+  }
 
-    // Main query with pagination
-    const limit = filters.limit || 50;
-    const offset = filters.offset || 0;
+  /**
+   * getUsers with the page as a JSON array built by Postgres, for sending
+   * as is (Read operation - uses replica DB)
+   */
+  async getUsersJson(filters: UserFilters = {}): Promise<{ json: string; total: number }> {
+    if (!config.database.coalesceReads) {
+      return this.fetchUsersJson(filters);
+    }
+    return this.listJsonFlights.do(this.listKey(filters), () => this.fetchUsersJson(filters));
+  }
 
-    const mainQuery = `
-      SELECT id, email, first_name as "firstName", last_name as "lastName",
-             is_active as "isActive", created_at as "createdAt", updated_at as "updatedAt"
-      FROM users 
-      ${whereClause}
-      ORDER BY created_at DESC
-      LIMIT $${paramIndex} OFFSET $${paramIndex + 1}
-    `;
+  private listKey(filters: UserFilters): string {
+    return JSON.stringify([
+      filters.isActive,
+      filters.email,
+      filters.limit || DEFAULT_PAGE_SIZE,
+      filters.offset || 0
+    ]);
+  }
 
-    values.push(limit, offset);
+  private async fetchUsers(filters: UserFilters): Promise<UserPage> {
+    const { count, page } = listUsersQueries(filters);
 
     try {
       logger.debug('Fetching users with filters:', filters);
 
-      const [countResult, usersResult] = await Promise.all([
-        this.replicaDb.query(countQuery, values.slice(0, paramIndex - 1)),
-        this.replicaDb.query(mainQuery, values)
-      ]);
+      // One connection and one round trip for both statements
+      const [countResult, usersResult] = await dbManager.pipeline('replica', [count, page]);
 
       const total = parseInt(countResult.rows[0].total, 10);
-      const users = usersResult.rows;
+      const rows: Array<User & { _version: string }> = usersResult.rows;
+      const versions = rows.map((row) => row._version);
+      const users: User[] = rows.map(({ _version, ...user }) => user);
 
       logger.info(`Fetched ${users.length} users out of ${total} total`);
 
-      return { users, total };
+      return { users, versions, total };
     } catch (error) {
       logger.error('Error fetching users:', error);
       throw new Error(`Failed to fetch users: ${error}`);
     }
   }
 
-  /**
-   * Update user (Write operation - uses primary DB)
-   */
-  async updateUser(id: string, userData: UpdateUserRequest): Promise<User | null> {
-    const updates: string[] = [];
-    const values: any[] = [];
-    let paramIndex = 1;
-
-    // Build dynamic SET clause
-    if (userData.email !== undefined) {
-      updates.push(`email = $${paramIndex}`);
-      values.push(userData.email);
-      paramIndex++;
-    }
+  private async fetchUsersJson(filters: UserFilters): Promise<{ json: string; total: number }> {
+    const { count } = listUsersQueries(filters);
+    const page = listUsersJsonQuery(filters);
 
-    if (userData.firstName !== undefined) {
-      updates.push(`first_name = $${paramIndex}`);
-      values.push(userData.firstName);
-      paramIndex++;
-    }
+    try {
+      logger.debug('Fetching users as JSON with filters:', filters);
 
-    if (userData.lastName !== undefined) {
-      updates.push(`last_name = $${paramIndex}`);
-      values.push(userData.lastName);
-      paramIndex++;
-    }
+      const [countResult, pageResult] = await dbManager.pipeline('replica', [count, page]);
 
-    if (userData.isActive !== undefined) {
-      updates.push(`is_active = $${paramIndex}`);
-      values.push(userData.isActive);
-      paramIndex++;
+      return {
+        json: pageResult.rows[0].data,
+        total: parseInt(countResult.rows[0].total, 10)
+      };
+    } catch (error) {
+      logger.error('Error fetching users as JSON:', error);
+      throw new Error(`Failed to fetch users: ${error}`);
     }
+  }
 
-    if (updates.length === 0) {
+  /**
+   * Update user (Write operation - uses primary DB)
+   * A new email is checked in the same pipeline as the UPDATE, which skips
+   * the row when the email is taken; throws EmailTakenError in that case.
+   */
+  async updateUser(id: string, userData: UpdateUserRequest): Promise<User | null> {
+    const update = updateUserQuery(id, userData);
+    if (!update) {
       throw new Error('No fields to update');
     }
-
-    updates.push(`updated_at = NOW()`);
-    values.push(id);
-
-    const query = `
-      UPDATE users 
-      SET ${updates.join(', ')}
-      WHERE id = $${paramIndex}
-      RETURNING id, email, first_name as "firstName", last_name as "lastName",
-                is_active as "isActive", created_at as "createdAt", updated_at as "updatedAt"
-    `;
+    const query = this.recorded(update, 'user.updated');
 
     try {
       logger.info(`Updating user with ID: ${id}`);
-      const result: QueryResult<User> = await this.primaryDb.query(query, values);
+      let result: QueryResult<User>;
+
+      if (userData.email !== undefined) {
+        const [taken, updated] = await dbManager.pipeline('primary', [
+          emailExistsQuery(userData.email, id),
+          query
+        ]);
+        if (taken.rows.length > 0) {
+          throw new EmailTakenError(userData.email);
+        }
+        result = updated;
+      } else {
+        result = await this.primaryDb.query(query.text, query.values);
+      }
 
       if (result.rows.length === 0) {
         logger.info(`User not found for update with ID: ${id}`);
@@ -188,6 +293,14 @@ export class UserService {
       logger.info(`User updated successfully: ${result.rows[0].email}`);
       return result.rows[0];
     } catch (error) {
+      // unique_violation: another user took the email between check and update
+      if (error instanceof EmailTakenError || (error as { code?: string }).code === '23505') {
+        throw error instanceof EmailTakenError ? error : new EmailTakenError(userData.email as string);
+      }
+      // Deadlocked with a concurrent writer: report as contention, not a failure
+      if (isRetryableError(error)) {
+        throw new TransactionConflictError(1, error as Error);
+      }
       logger.error('Error updating user:', error);
       throw new Error(`Failed to update user: ${error}`);
     }
@@ -195,13 +308,14 @@ export class UserService {
 
   /**
    * Delete user (Write operation - uses primary DB)
+   * With soft delete on, the row is only marked and the purger removes it later.
    */
   async deleteUser(id: string): Promise<boolean> {
-    const query = 'DELETE FROM users WHERE id = $1';
+    const { text, values } = this.recorded(deleteUserQuery(id, config.softDelete.enabled), 'user.deleted');
 
     try {
       logger.info(`Deleting user with ID: ${id}`);
-      const result = await this.primaryDb.query(query, [id]);
+      const result = await this.primaryDb.query(text, values);
 
       const deleted = result.rowCount > 0;
       if (deleted) {
@@ -221,16 +335,10 @@ export class UserService {
    * Check if email exists (Read operation - uses replica DB)
    */
   async emailExists(email: string, excludeId?: string): Promise<boolean> {
-    let query = 'SELECT 1 FROM users WHERE email = $1';
-    const values: any[] = [email];
-
-    if (excludeId) {
-      query += ' AND id != $2';
-      values.push(excludeId);
-    }
+    const { text, values } = emailExistsQuery(email, excludeId);
 
     try {
-      const result = await this.replicaDb.query(query, values);
+      const result = await this.replicaDb.query(text, values);
       return result.rows.length > 0;
     } catch (error) {
       logger.error('Error checking email existence:', error);
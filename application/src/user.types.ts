@@ -4,8 +4,9 @@ export interface User {
   firstName: string;
   lastName: string;
   isActive: boolean;
-  createdAt: Date;
-  updatedAt: Date;
+  // ISO strings when the pool uses the fast type parsers
+  createdAt: Date | string;
+  updatedAt: Date | string;
 }
 
 export interface CreateUserRequest {
@@ -27,4 +28,20 @@ export interface UserFilters {
   email?: string;
   limit?: number;
   offset?: number;
-}
\ No newline at end of file
+}
+
+export interface VersionedUser {
+  user: User;
+  // updated_at in microseconds, identifies this state of the row
+  version: string;
+}
+
+export interface UserPage {
+  users: User[];
+  // Microsecond version of each user, in the same order
+  versions: string[];
+  total: number;
+}
+
+// Outbox events recorded with each user write; the payload is the row as returned
+export type UserEventType = 'user.created' | 'user.updated' | 'user.deleted';
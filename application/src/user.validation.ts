@@ -0,0 +1,21 @@
+import Joi from 'joi';
+import { compileValidator } from './validation';
+import { CreateUserRequest, UpdateUserRequest } from './user.types';
+
+export const createUserSchema = Joi.object({
+  email: Joi.string().email().min(1).max(255).required(),
+  firstName: Joi.string().min(1).max(100).required(),
+  lastName: Joi.string().min(1).max(100).required(),
+  isActive: Joi.boolean().optional()
+});
+
+export const updateUserSchema = Joi.object({
+  email: Joi.string().email().min(1).max(255).optional(),
+  firstName: Joi.string().min(1).max(100).optional(),
+  lastName: Joi.string().min(1).max(100).optional(),
+  isActive: Joi.boolean().optional()
+}).min(1);
+
+// Compiled once at startup; same results and error messages as the schemas
+export const validateCreateUser = compileValidator<CreateUserRequest>(createUserSchema);
+export const validateUpdateUser = compileValidator<UpdateUserRequest>(updateUserSchema);
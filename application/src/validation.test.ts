@@ -0,0 +1,74 @@
+import Joi from 'joi';
+import { compileValidator } from './validation';
+import { createUserSchema, updateUserSchema } from './user.validation';
+
+const valid = { email: 'jane.doe@example.com', firstName: 'Jane', lastName: 'Doe' };
+
+const createInputs: Array<[string, unknown]> = [
+  ['a valid body', valid],
+  ['a valid body with isActive', { ...valid, isActive: false }],
+  ['a missing email', { firstName: 'Jane', lastName: 'Doe' }],
+  ['an undefined email', { ...valid, email: undefined }],
+  ['a malformed email', { ...valid, email: 'not-an-email' }],
+  ['an email with an unknown TLD', { ...valid, email: 'jane@example.notatld' }],
+  ['an email with a quoted local part', { ...valid, email: '"jane doe"@example.com' }],
+  ['an email with a subdomain and plus tag', { ...valid, email: 'Jane+Tag@Mail.Example.CO.UK' }],
+  ['an email over 255 characters', { ...valid, email: `${'a'.repeat(64)}@${'b'.repeat(63)}.${'c'.repeat(63)}.${'d'.repeat(63)}.com` }],
+  ['an empty firstName', { ...valid, firstName: '' }],
+  ['a firstName of 100 characters', { ...valid, firstName: 'x'.repeat(100) }],
+  ['a lastName of 101 characters', { ...valid, lastName: 'x'.repeat(101) }],
+  ['a numeric firstName', { ...valid, firstName: 42 }],
+  ['a null lastName', { ...valid, lastName: null }],
+  ['isActive as a string', { ...valid, isActive: 'true' }],
+  ['isActive as a number', { ...valid, isActive: 1 }],
+  ['an unknown key', { ...valid, role: 'admin' }],
+  ['several errors at once', { email: 'x', firstName: '', extra: true }],
+  ['null', null],
+  ['an array', [valid]],
+  ['a string', JSON.stringify(valid)]
+];
+
+const updateInputs: Array<[string, unknown]> = [
+  ['one field', { firstName: 'Jane' }],
+  ['only isActive', { isActive: true }],
+  ['an empty body', {}],
+  ['only undefined fields', { email: undefined }],
+  ['an invalid email', { email: 'jane@' }],
+  ['an unknown key', { firstName: 'Jane', id: 'abc' }]
+];
+
+// The outcome a caller sees: the value, and Joi's error message and details
+const outcome = (result: Joi.ValidationResult<unknown>) => ({
+  value: result.value,
+  message: result.error?.message,
+  details: result.error?.details
+});
+
+describe('compileValidator', () => {
+  const validateCreate = compileValidator(createUserSchema);
+  const validateUpdate = compileValidator(updateUserSchema);
+
+  it.each(createInputs)('matches Joi on create with %s', (_, input) => {
+    expect(outcome(validateCreate(input))).toEqual(outcome(createUserSchema.validate(input)));
+  });
+
+  it.each(updateInputs)('matches Joi on update with %s', (_, input) => {
+    expect(outcome(validateUpdate(input))).toEqual(outcome(updateUserSchema.validate(input)));
+  });
+
+  it('returns a copy of a valid body rather than the body itself', () => {
+    const input = { ...valid };
+    const result = validateCreate(input);
+
+    expect(result.error).toBeUndefined();
+    expect(result.value).toEqual(input);
+    expect(result.value).not.toBe(input);
+  });
+
+  it('refuses schemas with rules it cannot reproduce', () => {
+    expect(() => compileValidator(Joi.object({ name: Joi.string().pattern(/^a/) }))).toThrow('Cannot compile');
+    expect(() => compileValidator(Joi.object({ name: Joi.string().allow('') }))).toThrow('Cannot compile');
+    expect(() => compileValidator(Joi.object({ age: Joi.number() }))).toThrow('Cannot compile');
+    expect(() => compileValidator(Joi.object({ name: Joi.string() }).unknown())).toThrow('Cannot compile');
+  });
+});
@@ -0,0 +1,148 @@
+import Joi from 'joi';
+
+type Check = (value: unknown) => boolean;
+
+interface RuleDescription {
+  name: string;
+  args?: Record<string, any>;
+}
+
+interface SchemaDescription {
+  type: string;
+  flags?: Record<string, any>;
+  rules?: RuleDescription[];
+  keys?: Record<string, SchemaDescription>;
+}
+
+// The subset of addresses Joi's email() accepts that can be recognized
+// without it; the domain is then confirmed once by Joi itself and cached
+const SIMPLE_EMAIL = /^[A-Za-z0-9_+-]+(?:\.[A-Za-z0-9_+-]+)*@((?:[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)+[A-Za-z]{2,63})$/;
+const MAX_CACHED_DOMAINS = 10000;
+
+const emailSchema = Joi.string().email();
+const acceptedDomains = new Set<string>();
+
+const isEmail = (value: string): boolean => {
+  const match = value.length <= 254 ? SIMPLE_EMAIL.exec(value) : null;
+  if (!match || value.indexOf('@') > 64) {
+    return false;
+  }
+
+  const domain = match[1].toLowerCase();
+  if (acceptedDomains.has(domain)) {
+    return true;
+  }
+  if (emailSchema.validate(`a@${domain}`).error) {
+    return false;
+  }
+
+  if (acceptedDomains.size >= MAX_CACHED_DOMAINS) {
+    acceptedDomains.clear();
+  }
+  acceptedDomains.add(domain);
+  return true;
+};
+
+const compileString = (rules: RuleDescription[]): Check => {
+  let min = 1; // Joi rejects '' unless allow('') is set
+  let max = Infinity;
+  let email = false;
+
+  for (const rule of rules) {
+    if (rule.name === 'min') {
+      min = Math.max(min, rule.args?.limit);
+    } else if (rule.name === 'max') {
+      max = rule.args?.limit;
+    } else if (rule.name === 'email' && !rule.args?.options) {
+      email = true;
+    } else {
+      throw new Error(`Cannot compile string rule ${rule.name}`);
+    }
+  }
+
+  return (value) =>
+    typeof value === 'string' &&
+    value.length >= min &&
+    value.length <= max &&
+    (!email || isEmail(value));
+};
+
+const compileKey = (key: string, description: SchemaDescription): Check => {
+  const { type, flags, rules, ...rest } = description;
+  const { presence, ...otherFlags } = flags ?? {};
+  // e.g. allow, valid or preferences, which change what Joi accepts
+  const unsupported = [...Object.keys(rest), ...Object.keys(otherFlags)];
+  if (presence === 'forbidden') {
+    unsupported.push('presence');
+  }
+  if (unsupported.length > 0) {
+    throw new Error(`Cannot compile ${unsupported.join(', ')} on ${key}`);
+  }
+
+  if (type === 'string') {
+    return compileString(rules ?? []);
+  }
+  if (type === 'boolean' && !rules?.length) {
+    // 'true'/'false' strings are left to Joi, which converts them
+    return (value) => typeof value === 'boolean';
+  }
+  throw new Error(`Cannot compile ${type} schema for ${key}`);
+};
+
+/**
+ * Compiles a Joi object schema of plain string and boolean keys into a
+ * validator with a fast path: a body that plainly satisfies the schema is
+ * accepted with a few typeof and length checks, without Joi's interpreter.
+ * Anything else, including every invalid body, goes to schema.validate, so
+ * errors and conversions are exactly Joi's. Throws at compile time for
+ * rules or flags it does not understand rather than guessing at them.
+ */
+export const compileValidator = <T>(schema: Joi.ObjectSchema<T>): ((input: unknown) => Joi.ValidationResult<T>) => {
+  const description = schema.describe() as SchemaDescription;
+  if (description.flags) {
+    throw new Error(`Cannot compile object flags ${Object.keys(description.flags).join(', ')}`);
+  }
+
+  let minKeys = 0;
+  for (const rule of description.rules ?? []) {
+    if (rule.name !== 'min') {
+      throw new Error(`Cannot compile object rule ${rule.name}`);
+    }
+    minKeys = rule.args?.limit;
+  }
+
+  const keys = Object.entries(description.keys ?? {}).map(([key, keyDescription]) => ({
+    key,
+    required: keyDescription.flags?.presence === 'required',
+    check: compileKey(key, keyDescription)
+  }));
+  const known = new Set(keys.map(({ key }) => key));
+
+  const accepts = (input: unknown): input is Record<string, unknown> => {
+    if (typeof input !== 'object' || input === null || Array.isArray(input)) {
+      return false;
+    }
+
+    const body = input as Record<string, unknown>;
+    let present = 0;
+    for (const key in body) {
+      if (!known.has(key) || body[key] === undefined) {
+        return false;
+      }
+      present++;
+    }
+    if (present < minKeys) {
+      return false;
+    }
+
+    for (const { key, required, check } of keys) {
+      const value = body[key];
+      if (value === undefined ? required : !check(value)) {
+        return false;
+      }
+    }
+    return true;
+  };
+
+  return (input) => (accepts(input) ? { error: undefined, value: { ...input } as T } : schema.validate(input));
+};
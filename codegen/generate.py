@@ -0,0 +1,883 @@
+# Generate the TypeScript API and SQL DDL for every entity in model.json
+#
+#   python3 codegen/generate.py
+#
+# For each entity this writes, under application/src/generated/:
+#   <name>.types.ts       row, request, filter and page interfaces
+#   <name>.queries.ts     named (prepared) statements with explicit column lists
+#   <name>.validation.ts  Joi schemas
+#   <name>.service.ts     CRUD with keyset pagination, reads on the replica,
+#                         and batched loaders for the entity's relations
+#   <name>.controller.ts  Express handlers
+# plus index.ts mounting every controller, and a numbered migration in
+# infrastructure/migrations/ for each table no migration creates yet.
+#
+#   python3 codegen/generate.py --check
+#
+# --check writes nothing. It fails when a generated file is stale, or when a
+# table's migrations or the hand-written v1 layer (see V1_LAYER) disagree
+# with the model.
+#
+# Generation is incremental: .cache.json records a hash of each output's
+# inputs (template, entity model, this script) and of the content written.
+# Outputs whose inputs are unchanged are not rendered again, and files are
+# only rewritten when their content differs, so mtimes stay put and tsc
+# --incremental and nodemon see no change.
+
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CODEGEN_DIR = os.path.join(ROOT, 'codegen')
+TEMPLATE_DIR = os.path.join(CODEGEN_DIR, 'templates')
+OUTPUT_DIR = os.path.join(ROOT, 'application', 'src', 'generated')
+MIGRATIONS_DIR = os.path.join(ROOT, 'infrastructure', 'migrations')
+CACHE_FILE = os.path.join(CODEGEN_DIR, '.cache.json')
+
+# Every entity in the model, for cross-entity lookups while rendering
+ENTITIES: List['Entity'] = []
+
+HEADER = '// Generated by codegen/generate.py from codegen/model.json. Do not edit.'
+
+# Entities that also have a hand-written /api/users (v1) layer in
+# application/src/<name>.{types,queries,validation}.ts. It stays hand-written,
+# and is canonical for v1 behaviour (batching, coalescing, outbox, ETags).
+# model.json stays canonical for the schema, and --check fails when v1's
+# columns, types or validation rules, or the outbox events it records, drift
+# from it.
+V1_LAYER = ('user',)
+V1_DIR = os.path.join(ROOT, 'application', 'src')
+
+# type: (TypeScript type, SQL type, Joi schema)
+TYPES = {
+    'uuid': ('string', 'UUID', 'Joi.string().uuid()'),
+    'string': ('string', 'VARCHAR({maxLength})', 'Joi.string().min(1).max({maxLength})'),
+    'text': ('string', 'TEXT', 'Joi.string()'),
+    'boolean': ('boolean', 'BOOLEAN', 'Joi.boolean()'),
+    'integer': ('number', 'INTEGER', 'Joi.number().integer()'),
+    'numeric': ('string', 'NUMERIC({precision}, {scale})', "Joi.number().precision({scale}).cast('string')"),
+    # A string with DB_TYPE_PARSERS=fast (see src/type-parsers.ts)
+    'timestamp': ('Date | string', 'TIMESTAMP WITH TIME ZONE', 'Joi.date().iso()'),
+}
+
+# Children returned per parent by a hasMany loader unless the relation sets a limit
+DEFAULT_RELATION_LIMIT = 20
+
+# Database-side values for generated columns
+GENERATED_DEFAULTS = {
+    'uuid': 'uuid_generate_v4()',
+    'timestamp': 'NOW()',
+}
+
+
+def snake(name: str) -> str:
+    return re.sub(r'(?<!^)(?=[A-Z])', '_', name).lower()
+
+
+def pascal(name: str) -> str:
+    return name[0].upper() + name[1:]
+
+
+def sql_literal(value) -> str:
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+@dataclass
+class Field:
+    name: str
+    type: str
+    column: str
+    required: bool = False
+    nullable: bool = False
+    generated: bool = False
+    touch: bool = False
+    unique: bool = False
+    default: Optional[object] = None
+    filter: Optional[str] = None
+    format: Optional[str] = None
+    references: Optional[str] = None
+    on_delete: Optional[str] = None
+    options: Dict[str, object] = field(default_factory=dict)
+
+    @property
+    def ts_type(self) -> str:
+        ts = TYPES[self.type][0]
+        return f'{ts} | null' if self.nullable else ts
+
+    @property
+    def sql_type(self) -> str:
+        return TYPES[self.type][1].format(**self.options)
+
+    def joi(self) -> str:
+        schema = TYPES[self.type][2].format(**self.options)
+        if self.format == 'email':
+            schema = schema.replace('Joi.string()', 'Joi.string().email()')
+        if self.nullable:
+            schema += '.allow(null)'
+        return schema
+
+    @property
+    def sql_default(self) -> Optional[str]:
+        if self.default is not None:
+            return sql_literal(self.default)
+        if self.generated:
+            return GENERATED_DEFAULTS.get(self.type)
+        return None
+
+
+@dataclass
+class Relation:
+    """hasMany: target rows whose foreign_key points at this entity.
+    belongsTo: the target row this entity's foreign_key points at."""
+    name: str
+    kind: str
+    target: 'Entity'
+    foreign_key: Field
+    # hasMany: children loaded per parent; the rest are reached by cursor
+    limit: int = DEFAULT_RELATION_LIMIT
+
+
+@dataclass
+class Entity:
+    name: str
+    plural: str
+    table: str
+    fields: List[Field]
+    primary_key: Field
+    cursor: Field
+    # The entity's raw model entry, hashed to detect changes
+    spec: Dict[str, object]
+    relations: List[Relation] = field(default_factory=list)
+    # Rows are marked with deleted_at instead of removed, and hidden from reads
+    soft_delete: bool = False
+    # Writes record <name>.created/updated/deleted outbox events (OUTBOX_ENABLED)
+    events: bool = False
+
+    @property
+    def live(self) -> str:
+        """Condition appended to every statement that must skip deleted rows"""
+        return ' AND deleted_at IS NULL' if self.soft_delete else ''
+
+    @property
+    def type_name(self) -> str:
+        return pascal(self.name)
+
+    @property
+    def writable(self) -> List[Field]:
+        return [f for f in self.fields if not f.generated]
+
+    @property
+    def filters(self) -> List[Field]:
+        return [f for f in self.fields if f.filter]
+
+    def field(self, name: str) -> Field:
+        for f in self.fields:
+            if f.name == name:
+                return f
+        raise KeyError(f'{self.name} has no field {name}')
+
+
+def load_model(path: str) -> List[Entity]:
+    with open(path) as f:
+        model = json.load(f)
+
+    entities = []
+    for spec in model['entities']:
+        fields = []
+        for fs in spec['fields']:
+            known = {'name', 'type', 'column', 'required', 'nullable', 'generated', 'touch',
+                     'unique', 'default', 'filter', 'format', 'references', 'onDelete'}
+            fields.append(Field(
+                name=fs['name'],
+                type=fs['type'],
+                column=fs.get('column', snake(fs['name'])),
+                required=fs.get('required', False),
+                nullable=fs.get('nullable', False),
+                generated=fs.get('generated', False),
+                touch=fs.get('touch', False),
+                unique=fs.get('unique', False),
+                default=fs.get('default'),
+                filter=fs.get('filter'),
+                format=fs.get('format'),
+                references=fs.get('references'),
+                on_delete=fs.get('onDelete'),
+                options={k: v for k, v in fs.items() if k not in known},
+            ))
+
+        by_name = {f.name: f for f in fields}
+        # withOutboxEvent takes the event's aggregate_id from the id column
+        if spec.get('events') and spec['primaryKey'] != 'id':
+            raise ValueError(f"{spec['name']}: events need the primary key to be named id")
+        entities.append(Entity(
+            name=spec['name'],
+            plural=spec['plural'],
+            table=spec.get('table', snake(spec['plural'])),
+            fields=fields,
+            primary_key=by_name[spec['primaryKey']],
+            cursor=by_name[spec['cursor']],
+            spec=spec,
+            soft_delete=spec.get('softDelete', False),
+            events=spec.get('events', False),
+        ))
+
+    by_entity = {e.name: e for e in entities}
+    for entity in entities:
+        for rs in entity.spec.get('relations', []):
+            target = by_entity[rs['entity']]
+            owner = target if rs['kind'] == 'hasMany' else entity
+            entity.relations.append(Relation(
+                name=rs['name'],
+                kind=rs['kind'],
+                target=target,
+                foreign_key=owner.field(rs['foreignKey']),
+                limit=rs.get('limit', DEFAULT_RELATION_LIMIT),
+            ))
+    return entities
+
+
+def related(entity: Entity, entities: List[Entity]) -> List[Entity]:
+    """Entities whose model entries affect this entity's generated code"""
+    targets = {r.target.name for r in entity.relations}
+    sources = {e.name for e in entities for r in e.relations if r.target is entity}
+    return [e for e in entities if e is not entity and e.name in targets | sources]
+
+
+def array_cast(f: Field) -> str:
+    return re.sub(r'\(.*\)', '', f.sql_type).lower() + '[]'
+
+
+def read_template(template: str) -> str:
+    with open(os.path.join(TEMPLATE_DIR, template)) as f:
+        return f.read()
+
+
+def render(template: str, context: Dict[str, str]) -> str:
+    text = read_template(template)
+
+    def substitute(match):
+        key = match.group(1)
+        if key not in context:
+            raise KeyError(f'{template}: no value for {{{{{key}}}}}')
+        return context[key]
+
+    return re.sub(r'\{\{\s*(\w+)\s*\}\}', substitute, text)
+
+
+def indent(lines: List[str], spaces: int) -> str:
+    pad = ' ' * spaces
+    return '\n'.join(pad + line if line else line for line in lines)
+
+
+def entity_context(entity: Entity) -> Dict[str, str]:
+    t = entity.type_name
+    pk = entity.primary_key
+    const = snake(entity.name).upper()
+
+    select_columns = ', '.join(
+        f.column if f.column == f.name else f'{f.column} AS "{f.name}"' for f in entity.fields
+    )
+
+    insert_params = []
+    insert_values = []
+    for i, f in enumerate(entity.writable, start=1):
+        # Optional columns fall back to their default inside the statement,
+        # so the text (and the prepared statement) is the same for every row
+        if not f.required and f.sql_default is not None:
+            insert_params.append(f'COALESCE(${i}, {f.sql_default})')
+            insert_values.append(f'data.{f.name} ?? null')
+        else:
+            insert_params.append(f'${i}')
+            insert_values.append(f'data.{f.name}' if f.required else f'data.{f.name} ?? null')
+
+    filter_conditions = []
+    for f in entity.filters:
+        if f.filter == 'ilike':
+            filter_conditions += [
+                f'if (filters.{f.name}) {{',
+                f"  values.push(`%${{escapeLike(filters.{f.name})}}%`);",
+                f'  conditions.push(`{f.column} ILIKE $${{values.length}}`);',
+                f"  shape.push('{f.column}');",
+                '}',
+                '',
+            ]
+        elif f.filter == 'eq':
+            filter_conditions += [
+                f'if (filters.{f.name} !== undefined) {{',
+                f'  values.push(filters.{f.name});',
+                f'  conditions.push(`{f.column} = $${{values.length}}`);',
+                f"  shape.push('{f.column}');",
+                '}',
+                '',
+            ]
+        else:
+            raise ValueError(f'{entity.name}.{f.name}: unknown filter {f.filter}')
+
+    update_assignments = []
+    for f in entity.writable:
+        update_assignments += [
+            f'if (data.{f.name} !== undefined) {{',
+            f'  values.push(data.{f.name});',
+            f'  sets.push(`{f.column} = $${{values.length}}`);',
+            f"  shape.push('{f.column}');",
+            '}',
+            '',
+        ]
+    touch = [f"sets.push('{f.column} = NOW()');" for f in entity.fields if f.touch]
+
+    create_schema = [f'{f.name}: {f.joi()}.{"required" if f.required else "optional"}()' for f in entity.writable]
+    update_schema = [f'{f.name}: {f.joi()}.optional()' for f in entity.writable]
+    list_schema = []
+    for f in entity.filters:
+        schema = 'Joi.string().max(255)' if f.filter == 'ilike' else TYPES[f.type][2].format(**f.options)
+        list_schema.append(f'{f.name}: {schema}.optional(),')
+
+    relations = entity.relations
+    names = '|'.join(r.name for r in relations)
+    include_schema = f'Joi.string().pattern(/^(?:{names})(?:,(?:{names}))*$/)' if relations else 'Joi.forbidden()'
+
+    relation_fields = []
+    type_imports = []
+    service_imports = []
+    loaders = []
+    for r in relations:
+        target = r.target
+        fk = r.foreign_key
+        if target is not entity:
+            type_imports.append(f"import {{ {target.type_name} }} from './{target.name}.types';")
+        if r.kind == 'hasMany':
+            loader_query = f'{target.plural}By{pascal(fk.name)}s'
+            relation_fields += [
+                f'{r.name}?: {target.type_name}[];',
+                f'// Cursor for /{target.plural}?{fk.name}=...&cursor=... when more than {r.limit} {target.plural} exist',
+                f'{r.name}NextCursor?: string | null;',
+            ]
+            # One child past the limit tells whether the parent has more
+            loaders += [
+                f'{r.name}: async (items) => {{',
+                '  const result = await db.replica.query(',
+                f'    {loader_query}(items.map((item) => item.{pk.name}), {r.limit + 1})',
+                '  );',
+                f'  const byParent = groupBy(result.rows, (row) => row.{fk.name});',
+                '  for (const item of items) {',
+                f'    const children = byParent.get(item.{pk.name}) ?? [];',
+                f'    const shown = children.slice(0, {r.limit});',
+                '    const last = shown[shown.length - 1];',
+                f'    item.{r.name} = shown.map(({{ _cursor, ...child }}) => child as {target.type_name});',
+                f'    item.{r.name}NextCursor = children.length > {r.limit} '
+                f'? encodeCursor([last._cursor, last.{target.primary_key.name}]) : null;',
+                '  }',
+                '},',
+            ]
+        else:
+            loader_query = f'{target.plural}ByIds'
+            relation_fields.append(f'{r.name}?: {target.type_name} | null;')
+            ids = f'items.map((item) => item.{fk.name})'
+            if fk.nullable:
+                ids += '.filter((id): id is string => id !== null)'
+            loaders += [
+                f'{r.name}: async (items) => {{',
+                f'  const ids = [...new Set({ids})];',
+                f'  const result: QueryResult<{target.type_name}> = await db.replica.query({loader_query}(ids));',
+                f'  const byId = indexBy(result.rows, (row) => row.{target.primary_key.name});',
+                '  for (const item of items) {',
+                f'    item.{r.name} = {"item." + fk.name + " === null ? null : " if fk.nullable else ""}'
+                f'byId.get(item.{fk.name}) ?? null;',
+                '  }',
+                '},',
+            ]
+        if target is not entity:
+            service_imports.append(f"import {{ {target.type_name} }} from './{target.name}.types';")
+        source = entity.name if target is entity else target.name
+        service_imports.append(f"import {{ {loader_query} }} from './{source}.queries';")
+    if loaders:
+        loaders[-1] = loaders[-1].rstrip(',')
+        helpers = [h for h in ('groupBy', 'indexBy') if any(f'{h}(' in line for line in loaders)]
+        service_imports.insert(0, f"import {{ {', '.join(helpers)} }} from '../relations';")
+    if entity.events:
+        service_imports.insert(0, "import { withOutboxEvent } from '../outbox';")
+    if entity.soft_delete or entity.events:
+        service_imports.insert(0, "import { config } from '../config';")
+
+    # The same event types, and the same statement-level CTE, as v1
+    if entity.events:
+        def recorded(query: str, event: str) -> str:
+            return f"this.recorded({query}, '{entity.name}.{event}')"
+        recorded_method = [
+            '/**',
+            ' * The write, plus its outbox event in the same statement when the outbox is on',
+            ' */',
+            'private recorded(query: QueryConfig, eventType: string): QueryConfig {',
+            '  return config.outbox.enabled',
+            '    ? withOutboxEvent({ text: query.text, values: query.values ?? [] }, eventType)',
+            '    : query;',
+            '}',
+        ]
+    else:
+        def recorded(query: str, event: str) -> str:
+            return query
+        recorded_method = []
+
+    # Loader statements this entity's queries file provides for relations
+    # defined on any entity, including itself
+    batch_queries = []
+    for owner in ENTITIES:
+        for r in owner.relations:
+            if r.target is not entity:
+                continue
+            if r.kind == 'hasMany':
+                fk = r.foreign_key
+                batch_queries += [
+                    '',
+                    '/**',
+                    f' * Up to perParent {entity.plural} for each {fk.column} in one statement, newest',
+                    ' * first; the lateral subquery walks the keyset index once per parent.',
+                    ' * _cursor is the list cursor position, as in list' + pascal(entity.plural) + '.',
+                    ' */',
+                    f'export const {entity.plural}By{pascal(fk.name)}s = (parentIds: string[], perParent: number): QueryConfig => ({{',
+                    f"  name: '{entity.table}_by_{fk.column}s',",
+                    f'  text: `SELECT children.* FROM unnest($1::{array_cast(fk)}) AS parent(id) ` +',
+                    f'    `CROSS JOIN LATERAL (SELECT ${{{const}_COLUMNS}}, {entity.cursor.column}::text AS "_cursor" '
+                    f'FROM {entity.table} WHERE {fk.column} = parent.id{entity.live} ` +',
+                    f'    `ORDER BY {entity.cursor.column} DESC, {pk.column} DESC LIMIT $2) AS children`,',
+                    '  values: [parentIds, perParent]',
+                    '});',
+                ]
+            elif not any(q.startswith(f'export const {entity.plural}ByIds') for q in batch_queries):
+                batch_queries += [
+                    '',
+                    f'export const {entity.plural}ByIds = (ids: string[]): QueryConfig => ({{',
+                    f"  name: '{entity.table}_by_ids',",
+                    f'  text: `SELECT ${{{const}_COLUMNS}} FROM {entity.table} '
+                    f'WHERE {pk.column} = ANY($1::{array_cast(pk)}){entity.live}`,',
+                    '  values: [ids]',
+                    '});',
+                ]
+
+    returning = f' RETURNING {pk.column}' if entity.events else ''
+    if entity.soft_delete:
+        delete_query = [
+            '// Soft deletion only marks the row (SOFT_DELETE); it stays hidden from reads',
+            f'export const delete{t} = (id: string, soft: boolean): QueryConfig => ({{',
+            f"  name: soft ? '{entity.table}_soft_delete' : '{entity.table}_delete',",
+            '  text: soft',
+            f"    ? 'UPDATE {entity.table} SET deleted_at = NOW() WHERE {pk.column} = $1{entity.live}{returning}'",
+            f"    : 'DELETE FROM {entity.table} WHERE {pk.column} = $1{entity.live}{returning}',",
+            '  values: [id]',
+            '});',
+        ]
+        delete_args = 'id, config.softDelete.enabled'
+    else:
+        delete_query = [
+            f'export const delete{t} = (id: string): QueryConfig => ({{',
+            f"  name: '{entity.table}_delete',",
+            f"  text: 'DELETE FROM {entity.table} WHERE {pk.column} = $1{returning}',",
+            '  values: [id]',
+            '});',
+        ]
+        delete_args = 'id'
+
+    return {
+        'header': HEADER,
+        'name': entity.name,
+        'Entity': t,
+        'Entities': pascal(entity.plural),
+        'plural': entity.plural,
+        'CONST': const,
+        'table': entity.table,
+        'pkName': pk.name,
+        'pkColumn': pk.column,
+        'pkJoi': pk.joi(),
+        'cursorColumn': entity.cursor.column,
+        'live': entity.live,
+        'liveConditions': "'deleted_at IS NULL'" if entity.soft_delete else '',
+        'deleteQuery': '\n'.join(delete_query),
+        'pgImports': 'QueryConfig, QueryResult' if entity.events else 'QueryResult',
+        'createStatement': recorded(f'insert{t}(data)', 'created'),
+        'updateStatement': recorded('query', 'updated'),
+        'removeStatement': recorded(f'delete{t}({delete_args})', 'deleted'),
+        'recorded': ''.join(line + '\n' for line in indent(recorded_method, 2).split('\n')) + '\n' if recorded_method else '',
+        'selectColumns': select_columns,
+        'insertColumns': ', '.join(f.column for f in entity.writable),
+        'insertParams': ', '.join(insert_params),
+        'insertValues': ', '.join(insert_values),
+        'entityFields': indent([f'{f.name}: {f.ts_type};' for f in entity.fields] + relation_fields, 2),
+        'createFields': indent(
+            [f'{f.name}{"" if f.required else "?"}: {f.ts_type};' for f in entity.writable], 2),
+        'updateFields': indent([f'{f.name}?: {f.ts_type};' for f in entity.writable], 2),
+        'filterFields': indent([f'{f.name}?: {TYPES[f.type][0]};' for f in entity.filters], 2),
+        'filterConditions': indent(filter_conditions, 2),
+        'updateAssignments': indent(update_assignments, 2),
+        'touch': indent(touch, 2),
+        'createSchema': indent(create_schema, 2).replace('\n', ',\n'),
+        'updateSchema': indent(update_schema, 2).replace('\n', ',\n'),
+        'listSchema': indent(list_schema, 2),
+        'includeSchema': include_schema,
+        'typeImports': ''.join(line + '\n' for line in type_imports),
+        'serviceImports': ''.join(line + '\n' for line in dict.fromkeys(service_imports)),
+        'loaders': ''.join(line + '\n' for line in indent(loaders, 4).split('\n')) if loaders else '',
+        'batchQueries': ''.join('\n' + line for line in batch_queries),
+    }
+
+
+def migration_context(entity: Entity) -> Dict[str, str]:
+    columns = []
+    for f in entity.fields:
+        column = f'{f.column} {f.sql_type}'
+        if f is entity.primary_key:
+            column += ' PRIMARY KEY'
+        elif not f.nullable:
+            column += ' NOT NULL'
+        if f.unique:
+            column += ' UNIQUE'
+        if f.references:
+            target = next(e for e in ENTITIES if e.name == f.references)
+            column += f' REFERENCES {target.table}({target.primary_key.column})'
+            if f.on_delete:
+                column += f' ON DELETE {f.on_delete.upper()}'
+        if f.sql_default is not None:
+            column += f' DEFAULT {f.sql_default}'
+        columns.append(column)
+    if entity.soft_delete:
+        columns.append('deleted_at TIMESTAMP WITH TIME ZONE')
+
+    # Keyset pagination walks (cursor, pk) descending, optionally after
+    # equality filters; other filters are applied to that ordered scan.
+    # Foreign keys get the same index, which serves relation loaders and
+    # cascading deletes.
+    # Soft-deleted rows are never read, so indexes leave them out.
+    order = f'{entity.cursor.column} DESC, {entity.primary_key.column} DESC'
+    live = ' WHERE deleted_at IS NULL' if entity.soft_delete else ''
+    indexes = [f'CREATE INDEX IF NOT EXISTS idx_{entity.table}_keyset ON {entity.table}({order}){live};']
+    for f in entity.fields:
+        if f.filter == 'eq' or f.references:
+            indexes.append(
+                f'CREATE INDEX IF NOT EXISTS idx_{entity.table}_{f.column}_keyset '
+                f'ON {entity.table}({f.column}, {order}){live};'
+            )
+    if entity.soft_delete:
+        indexes.append(
+            f'CREATE INDEX IF NOT EXISTS idx_{entity.table}_deleted_at '
+            f'ON {entity.table}(deleted_at) WHERE deleted_at IS NOT NULL;'
+        )
+
+    return {
+        'table': entity.table,
+        'columns': ',\n'.join('    ' + c for c in columns),
+        'indexes': '\n'.join(indexes),
+    }
+
+
+def table_has_migration(table: str) -> bool:
+    pattern = re.compile(rf'CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?{table}\b', re.IGNORECASE)
+    for name in os.listdir(MIGRATIONS_DIR):
+        if name.endswith('.sql'):
+            with open(os.path.join(MIGRATIONS_DIR, name)) as f:
+                if pattern.search(f.read()):
+                    return True
+    return False
+
+
+def next_migration_version() -> int:
+    versions = [int(m.group(1)) for m in map(re.compile(r'^(\d+)_').match, os.listdir(MIGRATIONS_DIR)) if m]
+    return max(versions, default=0) + 1
+
+
+def sha256(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def file_hash(path: str) -> Optional[str]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return sha256(f.read())
+    except FileNotFoundError:
+        return None
+
+
+class Output:
+    """Writes generated files, skipping work whose inputs have not changed"""
+
+    def __init__(self):
+        try:
+            with open(CACHE_FILE) as f:
+                self.cache = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.cache = {}
+
+        with open(os.path.abspath(__file__)) as f:
+            self.generator = sha256(f.read())
+        self.seen = set()
+        self.written = 0
+        self.unchanged = 0
+
+    def emit(self, path: str, inputs: List[str], produce: Callable[[], str]) -> None:
+        rel = os.path.relpath(path, ROOT)
+        self.seen.add(rel)
+        key = sha256('\0'.join([self.generator, *inputs]))
+        entry = self.cache.get(rel)
+        current = file_hash(path)
+
+        # Same inputs and the file still holds what was last written
+        if entry and entry['inputs'] == key and current == entry['output']:
+            self.unchanged += 1
+            return
+
+        content = produce()
+        output = sha256(content)
+        if current != output:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            self.written += 1
+            print(f'- {rel}')
+        else:
+            self.unchanged += 1
+
+        self.cache[rel] = {'inputs': key, 'output': output}
+
+    def remove_stale(self) -> None:
+        """Delete generated sources no longer produced by the model;
+        migrations are never deleted, as they may have been applied"""
+        generated = os.path.relpath(OUTPUT_DIR, ROOT) + os.sep
+        for rel in [rel for rel in self.cache if rel not in self.seen]:
+            if rel.startswith(generated) and os.path.exists(os.path.join(ROOT, rel)):
+                os.remove(os.path.join(ROOT, rel))
+                print(f'- {rel} (removed)')
+            del self.cache[rel]
+
+    def save(self) -> None:
+        with open(CACHE_FILE, 'w') as f:
+            json.dump(self.cache, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+
+def split_top_level(text: str) -> List[str]:
+    """Split on commas outside parentheses, e.g. between column definitions"""
+    parts, depth, current = [], 0, ''
+    for char in text:
+        depth += {'(': 1, ')': -1}.get(char, 0)
+        if char == ',' and depth == 0:
+            parts.append(current)
+            current = ''
+        else:
+            current += char
+    return [part.strip() for part in parts + [current] if part.strip()]
+
+
+def normalize_sql_type(sql_type: str) -> str:
+    return re.sub(r'\s*,\s*', ',', ' '.join(sql_type.upper().split()))
+
+
+def migrated_columns(table: str) -> Dict[str, str]:
+    """Column name -> SQL type of a table, as its migrations leave it"""
+    create = re.compile(rf'CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?{table}\s*\((.*?)\n\);', re.I | re.S)
+    add = re.compile(rf'ALTER\s+TABLE\s+{table}\s+ADD\s+COLUMN\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)\s+([^;]+);', re.I)
+    drop = re.compile(rf'ALTER\s+TABLE\s+{table}\s+DROP\s+COLUMN\s+(?:IF\s+EXISTS\s+)?(\w+)', re.I)
+    constraint = re.compile(r'\s+(?:PRIMARY|NOT|NULL|UNIQUE|DEFAULT|REFERENCES|CHECK|CONSTRAINT|GENERATED)\b.*', re.I | re.S)
+
+    columns: Dict[str, str] = {}
+    for name in sorted(os.listdir(MIGRATIONS_DIR)):
+        if not name.endswith('.sql'):
+            continue
+        with open(os.path.join(MIGRATIONS_DIR, name)) as f:
+            # Only the up section describes the schema the migration leaves
+            text = re.sub(r'--.*', '', f.read().split('-- migrate:down')[0])
+        for match in create.finditer(text):
+            for definition in split_top_level(match.group(1)):
+                column, _, rest = definition.partition(' ')
+                if column.upper() not in ('PRIMARY', 'UNIQUE', 'CONSTRAINT', 'FOREIGN', 'CHECK', 'EXCLUDE'):
+                    columns[column] = normalize_sql_type(constraint.sub('', rest))
+        for match in add.finditer(text):
+            columns[match.group(1)] = normalize_sql_type(constraint.sub('', match.group(2)))
+        for match in drop.finditer(text):
+            columns.pop(match.group(1), None)
+    return columns
+
+
+def ts_block(source: str, pattern: str) -> Optional[Dict[str, str]]:
+    """`key: value` lines of the first brace block opened by pattern"""
+    match = re.search(pattern + r'\s*\{(.*?)\n\}', source, re.S)
+    if not match:
+        return None
+    entries = {}
+    for line in match.group(1).split('\n'):
+        entry = re.match(r'(\w+\??):\s*(.+?)[;,]?$', line.split('//')[0].strip())
+        if entry:
+            entries[entry.group(1)] = entry.group(2)
+    return entries
+
+
+def diff(what: str, expected: Dict[str, str], actual: Optional[Dict[str, str]]) -> List[str]:
+    if actual is None:
+        return [f'{what}: not found']
+    squash = lambda value: re.sub(r'\s+', '', value)
+    problems = [f'{what}: missing {key} ({value})' for key, value in expected.items() if key not in actual]
+    problems += [f'{what}: {key} not in the model' for key in actual if key not in expected]
+    problems += [
+        f'{what}: {key} is {actual[key]}, the model says {value}'
+        for key, value in expected.items() if key in actual and squash(actual[key]) != squash(value)
+    ]
+    return problems
+
+
+def check_migrations(entity: Entity) -> List[str]:
+    expected = {f.column: normalize_sql_type(f.sql_type) for f in entity.fields}
+    if entity.soft_delete:
+        expected['deleted_at'] = 'TIMESTAMP WITH TIME ZONE'
+    return diff(f'{entity.table} migrations', expected, migrated_columns(entity.table))
+
+
+def check_v1(entity: Entity) -> List[str]:
+    """The hand-written v1 layer against the model it is meant to agree with"""
+    def read(kind: str) -> str:
+        with open(os.path.join(V1_DIR, f'{entity.name}.{kind}.ts')) as f:
+            return f.read()
+
+    t = entity.type_name
+    types, queries, validation = read('types'), read('queries'), read('validation')
+    problems = diff(f'{entity.name}.types.ts {t}', {f.name: f.ts_type for f in entity.fields},
+                    ts_block(types, rf'export interface {t}'))
+    problems += diff(
+        f'{entity.name}.types.ts Create{t}Request',
+        {f.name + ('' if f.required else '?'): f.ts_type for f in entity.writable},
+        ts_block(types, rf'export interface Create{t}Request'),
+    )
+    problems += diff(f'{entity.name}.types.ts Update{t}Request', {f'{f.name}?': f.ts_type for f in entity.writable},
+                     ts_block(types, rf'export interface Update{t}Request'))
+
+    const = snake(entity.name).upper()
+    match = re.search(rf'export const {const}_COLUMNS = `([^`]*)`', queries)
+    selected = None
+    if match:
+        selected = {}
+        for item in match.group(1).split(','):
+            column = re.match(r'\s*(\w+)(?:\s+as\s+"(\w+)")?\s*$', item, re.I)
+            if column:
+                selected[column.group(2) or column.group(1)] = column.group(1)
+    problems += diff(f'{entity.name}.queries.ts {const}_COLUMNS', {f.name: f.column for f in entity.fields}, selected)
+
+    problems += diff(
+        f'{entity.name}.validation.ts create{t}Schema',
+        {f.name: f'{f.joi()}.{"required" if f.required else "optional"}()' for f in entity.writable},
+        ts_block(validation, rf'export const create{t}Schema = Joi\.object\('),
+    )
+    problems += diff(f'{entity.name}.validation.ts update{t}Schema',
+                     {f.name: f'{f.joi()}.optional()' for f in entity.writable},
+                     ts_block(validation, rf'export const update{t}Schema = Joi\.object\('))
+
+    # Both layers must record every write in the outbox, or neither
+    service = read('service')
+    for event in ('created', 'updated', 'deleted'):
+        recorded = f"'{entity.name}.{event}'" in service
+        if recorded != entity.events:
+            problems.append(f'{entity.name}.service.ts {"does not record" if entity.events else "records"} '
+                            f'{entity.name}.{event} events, but model.json says events: {str(entity.events).lower()}')
+    return problems
+
+
+def check(entities: List[Entity]) -> List[str]:
+    problems = []
+    for path, _, produce in sources(entities):
+        if file_hash(path) != sha256(produce()):
+            problems.append(f'{os.path.relpath(path, ROOT)} is stale; run npm run generate')
+    for entity in entities:
+        if not table_has_migration(entity.table):
+            problems.append(f'no migration creates {entity.table}; run npm run generate')
+        else:
+            problems += check_migrations(entity)
+        if entity.name in V1_LAYER:
+            problems += check_v1(entity)
+    return problems
+
+
+def sources(entities: List[Entity]) -> Iterator[Tuple[str, List[str], Callable[[], str]]]:
+    """(path, inputs, produce) for every file under src/generated/"""
+    for entity in entities:
+        model_input = json.dumps([e.spec for e in [entity, *related(entity, entities)]], sort_keys=True)
+        context: Dict[str, str] = {}
+
+        def entity_template(kind: str, entity: Entity = entity, context: Dict[str, str] = context) -> Callable[[], str]:
+            def produce() -> str:
+                if not context:
+                    context.update(entity_context(entity))
+                return render(f'{kind}.ts.tmpl', context)
+            return produce
+
+        for kind in ('types', 'queries', 'validation', 'service', 'controller'):
+            yield (
+                os.path.join(OUTPUT_DIR, f'{entity.name}.{kind}.ts'),
+                [read_template(f'{kind}.ts.tmpl'), model_input],
+                entity_template(kind),
+            )
+
+    imports = [f"import {{ {e.type_name}Controller }} from './{e.name}.controller';" for e in entities]
+    routes = []
+    for e in entities:
+        routes += [
+            f'const {e.plural} = new {e.type_name}Controller();',
+            f"router.post('/{e.plural}', ...write, {e.plural}.create);",
+            f"router.get('/{e.plural}', ...read, {e.plural}.list);",
+            f"router.get('/{e.plural}/:id', ...read, {e.plural}.getById);",
+            f"router.patch('/{e.plural}/:id', ...write, {e.plural}.update);",
+            f"router.delete('/{e.plural}/:id', ...write, {e.plural}.remove);",
+            '',
+        ]
+    index_context = {
+        'header': HEADER,
+        'imports': '\n'.join(imports),
+        'routes': indent(routes[:-1], 2),
+    }
+    yield (
+        os.path.join(OUTPUT_DIR, 'index.ts'),
+        [read_template('index.ts.tmpl'), json.dumps(index_context, sort_keys=True)],
+        lambda: render('index.ts.tmpl', index_context),
+    )
+
+
+def main() -> int:
+    entities = load_model(os.path.join(CODEGEN_DIR, 'model.json'))
+    ENTITIES[:] = entities
+
+    if '--check' in sys.argv[1:]:
+        problems = check(entities)
+        for problem in problems:
+            print(f'- {problem}')
+        print(f'{len(problems)} problems' if problems else 'Generated code and v1 layer match the model')
+        return 1 if problems else 0
+
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    started = time.monotonic()
+    output = Output()
+
+    for path, inputs, produce in sources(entities):
+        output.emit(path, inputs, produce)
+
+    # Applied migrations are immutable, so DDL is only emitted for new tables
+    for entity in entities:
+        if not table_has_migration(entity.table):
+            model_input = json.dumps([e.spec for e in [entity, *related(entity, entities)]], sort_keys=True)
+            version = next_migration_version()
+            output.emit(
+                os.path.join(MIGRATIONS_DIR, f'{version:04d}_create_{entity.table}.sql'),
+                [read_template('migration.sql.tmpl'), model_input],
+                lambda: render('migration.sql.tmpl', migration_context(entity)),
+            )
+
+    output.remove_stale()
+    output.save()
+    elapsed = (time.monotonic() - started) * 1000
+    print(f'{output.written} files written, {output.unchanged} unchanged ({elapsed:.0f}ms)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
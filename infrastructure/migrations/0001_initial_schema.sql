@@ -1,5 +1,6 @@
 -- AWS RDS PostgreSQL Database Schema
 -- Optimized for performance with proper indexing
+-- Migration 0001: baseline users schema
 
 -- Enable UUID extension for generating unique IDs
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
@@ -40,14 +41,6 @@ CREATE TRIGGER update_users_updated_at
     FOR EACH ROW
     EXECUTE FUNCTION update_updated_at_column();
 
--- Create sample data for testing (optional)
-INSERT INTO users (email, first_name, last_name, is_active) VALUES
-    ('john.doe@example.com', 'John', 'Doe', true),
-    ('jane.smith@example.com', 'Jane', 'Smith', true),
-    ('bob.johnson@example.com', 'Bob', 'Johnson', false),
-    ('alice.williams@example.com', 'Alice', 'Williams', true)
-ON CONFLICT (email) DO NOTHING;
-
 -- Performance optimization settings for AWS RDS
 -- These should be set in your RDS parameter group
 
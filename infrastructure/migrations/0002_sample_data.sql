@@ -0,0 +1,8 @@
+-- Migration 0002: sample data for testing (optional)
+
+INSERT INTO users (email, first_name, last_name, is_active) VALUES
+    ('john.doe@example.com', 'John', 'Doe', true),
+    ('jane.smith@example.com', 'Jane', 'Smith', true),
+    ('bob.johnson@example.com', 'Bob', 'Johnson', false),
+    ('alice.williams@example.com', 'Alice', 'Williams', true)
+ON CONFLICT (email) DO NOTHING;
@@ -0,0 +1,15 @@
+-- Generated by codegen/generate.py from codegen/model.json
+-- Migration: create orders
+
+CREATE TABLE IF NOT EXISTS orders (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    status VARCHAR(32) NOT NULL DEFAULT 'pending',
+    total_amount NUMERIC(12, 2) NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_orders_keyset ON orders(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_orders_user_id_keyset ON orders(user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_orders_status_keyset ON orders(status, created_at DESC, id DESC);
@@ -0,0 +1,19 @@
+-- Migration 0004: transactional outbox
+-- User writes insert their change event here in the same statement as the
+-- change; the outbox worker delivers events to handlers and deletes them.
+
+CREATE TABLE IF NOT EXISTS outbox (
+    id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    event_type VARCHAR(64) NOT NULL,
+    aggregate_id UUID NOT NULL,
+    payload JSONB NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    -- Retries are pushed into the future; events that exhausted their
+    -- attempts are parked at 'infinity' for inspection
+    available_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+-- The worker's scan: due events in order
+CREATE INDEX IF NOT EXISTS idx_outbox_available ON outbox(available_at, id);
@@ -0,0 +1,7 @@
+-- Migration 0005: soft delete for users
+-- With SOFT_DELETE=true, deleting a user sets deleted_at instead of removing
+-- the row; reads skip such rows and the purger deletes them later in
+-- throttled batches. A nullable column without a default is added by
+-- updating the catalog only, without rewriting the table.
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP WITH TIME ZONE;
@@ -0,0 +1,22 @@
+-- migrate:no-transaction
+-- Migration 0006: users indexes cover live rows only
+-- Every users read filters on deleted_at IS NULL, so partial indexes serve
+-- them without carrying soft-deleted rows. Only indexes a query shape uses
+-- are rebuilt: the list ordered by created_at, with and without is_active.
+-- The rest go: idx_users_email duplicates users_email_key (which stays full,
+-- so an email is reserved until its row is purged) and cannot serve the
+-- ILIKE '%x%' filter; idx_users_is_active is low-selectivity and
+-- idx_users_full_name is never scanned. The new indexes are built before
+-- the old ones are dropped, so reads never lose their index.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_live_created_at ON users(created_at DESC) WHERE deleted_at IS NULL;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_live_active_created ON users(is_active, created_at DESC) WHERE deleted_at IS NULL;
+
+-- The purger's scan: oldest deletions first
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_users_deleted_at ON users(deleted_at) WHERE deleted_at IS NOT NULL;
+
+DROP INDEX CONCURRENTLY IF EXISTS idx_users_email;
+DROP INDEX CONCURRENTLY IF EXISTS idx_users_is_active;
+DROP INDEX CONCURRENTLY IF EXISTS idx_users_created_at;
+DROP INDEX CONCURRENTLY IF EXISTS idx_users_full_name;
+DROP INDEX CONCURRENTLY IF EXISTS idx_users_active_created;
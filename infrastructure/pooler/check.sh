@@ -0,0 +1,71 @@
+#!/bin/bash
+
+# Transaction pooler check
+# Starts a local transaction-mode pooler in front of the database in
+# application/.env (or the environment) and runs `npm run check:pooler`
+# through it. Uses pgbouncer if it is installed, otherwise txpool.py.
+#
+#   infrastructure/pooler/check.sh
+
+set -e  # Exit on any error
+
+SCRIPT_DIR="$(cd "$(dirname "$0")" && pwd)"
+APP_DIR="$SCRIPT_DIR/../application"
+POOLER_PORT="${POOLER_PORT:-6432}"
+
+if [ -f "$APP_DIR/.env" ]; then
+    set -a
+    . "$APP_DIR/.env"
+    set +a
+fi
+
+DB_HOST="${DB_PRIMARY_HOST:-localhost}"
+DB_PORT="${DB_PORT:-5432}"
+DB_USERNAME="${DB_USERNAME:-postgres}"
+DB_PASSWORD="${DB_PASSWORD:-password}"
+DB_NAME="${DB_NAME:-postgres}"
+
+WORK_DIR="$(mktemp -d)"
+cleanup() {
+    [ -n "$POOLER_PID" ] && kill "$POOLER_PID" 2>/dev/null || true
+    rm -rf "$WORK_DIR"
+}
+trap cleanup EXIT
+
+if command -v pgbouncer >/dev/null 2>&1; then
+    echo "Using $(pgbouncer --version | head -1)"
+    cat > "$WORK_DIR/pgbouncer.ini" <<EOF
+[databases]
+$DB_NAME = host=$DB_HOST port=$DB_PORT dbname=$DB_NAME user=$DB_USERNAME password=$DB_PASSWORD
+
+[pgbouncer]
+listen_addr = 127.0.0.1
+listen_port = $POOLER_PORT
+unix_socket_dir =
+auth_type = any
+pool_mode = transaction
+default_pool_size = 3
+max_prepared_statements = $([ "$DB_POOLER_PREPARED_STATEMENTS" = "true" ] && echo 100 || echo 0)
+logfile = $WORK_DIR/pgbouncer.log
+EOF
+    pgbouncer "$WORK_DIR/pgbouncer.ini" &
+else
+    echo "pgbouncer not found, using txpool.py"
+    python3 "$SCRIPT_DIR/txpool.py" --port "$POOLER_PORT" \
+        --server-host "$DB_HOST" --server-port "$DB_PORT" \
+        --user "$DB_USERNAME" --password "$DB_PASSWORD" --database "$DB_NAME" &
+fi
+POOLER_PID=$!
+
+# Wait for the pooler to accept connections
+for _ in $(seq 50); do
+    (echo > "/dev/tcp/127.0.0.1/$POOLER_PORT") 2>/dev/null && break
+    sleep 0.1
+done
+
+cd "$APP_DIR"
+DB_POOLER_MODE=transaction \
+DB_POOLER_PRIMARY_HOST=127.0.0.1 \
+DB_POOLER_REPLICA_HOST=127.0.0.1 \
+DB_POOLER_PORT="$POOLER_PORT" \
+    npm run check:pooler
@@ -0,0 +1,299 @@
+# A minimal transaction-pooling proxy for Postgres, standing in for PgBouncer
+# (pool_mode = transaction, max_prepared_statements = 0) when testing locally
+# without Docker:
+#
+#   python3 infrastructure/pooler/txpool.py --port 6432 \
+#       --server-host localhost --server-port 5432 \
+#       --user postgres --password password --database postgres
+#
+# It behaves the way the application must tolerate behind PgBouncer or RDS
+# Proxy:
+#   - startup parameters that set session state (options, statement_timeout,
+#     ...) are rejected, as PgBouncer does
+#   - a client holds a server connection only from its first message until
+#     the server is idle again (ReadyForQuery 'I'); the next transaction
+#     usually runs on a different one, so session state and named prepared
+#     statements do not carry over
+#   - CancelRequests are routed, by the key this proxy handed out, to the
+#     server running that client's transaction
+#
+# Clients are not authenticated; every client is served with the --user and
+# --database given here. For local testing only.
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import itertools
+import logging
+import os
+import struct
+
+PROTOCOL_3 = 196608
+SSL_REQUEST = 80877103
+CANCEL_REQUEST = 80877102
+GSSENC_REQUEST = 80877104
+
+# Startup parameters PgBouncer accepts without ignore_startup_parameters
+ALLOWED_STARTUP = {
+    'user', 'database', 'application_name', 'client_encoding', 'DateStyle',
+    'TimeZone', 'standard_conforming_strings', 'IntervalStyle',
+}
+
+# Messages answered by exactly one ReadyForQuery
+SYNCING = {b'Q', b'S', b'F'}
+
+log = logging.getLogger('txpool')
+
+
+def message(kind, payload=b''):
+    return kind + struct.pack('!I', len(payload) + 4) + payload
+
+
+def cstring(value):
+    return value.encode() + b'\0'
+
+
+def error_response(code, text, severity='ERROR'):
+    fields = b''.join(key + cstring(value) for key, value in
+                      ((b'S', severity), (b'V', severity), (b'C', code), (b'M', text)))
+    return message(b'E', fields + b'\0')
+
+
+async def read_message(reader):
+    header = await reader.readexactly(5)
+    length = struct.unpack('!I', header[1:])[0]
+    return header[:1], await reader.readexactly(length - 4)
+
+
+class Server:
+    """One upstream connection, logged in and idle between transactions."""
+
+    def __init__(self, reader, writer, pid, key, parameters):
+        self.reader = reader
+        self.writer = writer
+        self.pid = pid
+        self.key = key
+        self.parameters = parameters
+
+    @classmethod
+    async def connect(cls, args):
+        reader, writer = await asyncio.open_connection(args.server_host, args.server_port)
+        params = b''.join(cstring(k) + cstring(v) for k, v in
+                          (('user', args.user), ('database', args.database), ('application_name', 'txpool')))
+        writer.write(struct.pack('!II', len(params) + 9, PROTOCOL_3) + params + b'\0')
+
+        scram = None
+        pid = key = 0
+        parameters = []
+        while True:
+            kind, payload = await read_message(reader)
+            if kind == b'R':
+                scram = await cls.authenticate(writer, args, payload, scram)
+            elif kind == b'S':
+                parameters.append(message(kind, payload))
+            elif kind == b'K':
+                pid, key = struct.unpack('!II', payload)
+            elif kind == b'E':
+                raise ConnectionError(f'server login failed: {payload!r}')
+            elif kind == b'Z':
+                return cls(reader, writer, pid, key, parameters)
+
+    @staticmethod
+    async def authenticate(writer, args, payload, scram):
+        code = struct.unpack('!I', payload[:4])[0]
+        password = args.password.encode()
+
+        if code == 3:  # cleartext
+            writer.write(message(b'p', password + b'\0'))
+        elif code == 5:  # md5
+            inner = hashlib.md5(password + args.user.encode()).hexdigest().encode()
+            writer.write(message(b'p', b'md5' + hashlib.md5(inner + payload[4:8]).hexdigest().encode() + b'\0'))
+        elif code == 10:  # SASL: SCRAM-SHA-256 without channel binding
+            nonce = base64.b64encode(os.urandom(18)).decode()
+            first_bare = f'n=,r={nonce}'
+            first = ('n,,' + first_bare).encode()
+            writer.write(message(b'p', cstring('SCRAM-SHA-256') + struct.pack('!I', len(first)) + first))
+            return first_bare
+        elif code == 11:  # SASL continue
+            server_first = payload[4:].decode()
+            attrs = dict(item.split('=', 1) for item in server_first.split(','))
+            salted = hashlib.pbkdf2_hmac('sha256', password, base64.b64decode(attrs['s']), int(attrs['i']))
+            client_key = hmac.digest(salted, b'Client Key', 'sha256')
+            without_proof = f"c=biws,r={attrs['r']}"
+            auth_message = f'{scram},{server_first},{without_proof}'.encode()
+            signature = hmac.digest(hashlib.sha256(client_key).digest(), auth_message, 'sha256')
+            proof = base64.b64encode(bytes(a ^ b for a, b in zip(client_key, signature))).decode()
+            writer.write(message(b'p', f'{without_proof},p={proof}'.encode()))
+        elif code not in (0, 12):
+            raise ConnectionError(f'unsupported authentication method {code}')
+        return scram
+
+    def close(self):
+        self.writer.close()
+
+
+class Pool:
+    """Idle servers in a FIFO, so consecutive transactions rotate through them."""
+
+    def __init__(self, args):
+        self.args = args
+        self.idle = asyncio.Queue()
+        self.size = 0
+        self.parameters = None
+
+    async def acquire(self):
+        if self.idle.empty() and self.size < self.args.pool_size:
+            self.size += 1
+            try:
+                server = await Server.connect(self.args)
+            except Exception:
+                self.size -= 1
+                raise
+            self.parameters = self.parameters or server.parameters
+            return server
+        return await self.idle.get()
+
+    def release(self, server):
+        self.idle.put_nowait(server)
+
+    def discard(self, server):
+        self.size -= 1
+        server.close()
+
+
+class Client:
+    keys = itertools.count(1)
+    by_key = {}
+
+    def __init__(self, pool, reader, writer):
+        self.pool = pool
+        self.reader = reader
+        self.writer = writer
+        self.server = None
+        self.pending = 0
+        self.key = (next(Client.keys), int.from_bytes(os.urandom(4), 'big'))
+
+    async def serve(self):
+        if not await self.startup():
+            return
+
+        Client.by_key[self.key] = self
+        try:
+            while True:
+                kind, payload = await read_message(self.reader)
+                if kind == b'X':
+                    return
+                if self.server is None:
+                    self.server = await self.pool.acquire()
+                    asyncio.create_task(self.pump(self.server))
+                if kind in SYNCING:
+                    self.pending += 1
+                self.server.writer.write(message(kind, payload))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            del Client.by_key[self.key]
+            # Mid-transaction state cannot be handed to anyone else
+            if self.server is not None:
+                self.pool.discard(self.server)
+                self.server = None
+            self.writer.close()
+
+    async def startup(self):
+        while True:
+            length, code = struct.unpack('!II', await self.reader.readexactly(8))
+            body = await self.reader.readexactly(length - 8)
+            if code in (SSL_REQUEST, GSSENC_REQUEST):
+                self.writer.write(b'N')
+                continue
+            if code == CANCEL_REQUEST:
+                self.forward_cancel(struct.unpack('!II', body))
+                self.writer.close()
+                return False
+            break
+
+        items = body.split(b'\0')
+        params = dict(zip(items[0::2], items[1::2]))
+        for name in params:
+            if name and name.decode() not in ALLOWED_STARTUP:
+                self.writer.write(error_response('08P01', f'unsupported startup parameter: {name.decode()}', 'FATAL'))
+                self.writer.close()
+                return False
+
+        # Log in to one server up front for the parameters clients expect
+        if self.pool.parameters is None:
+            self.pool.release(await self.pool.acquire())
+
+        self.writer.write(message(b'R', struct.pack('!I', 0)))
+        self.writer.write(b''.join(self.pool.parameters))
+        self.writer.write(message(b'K', struct.pack('!II', *self.key)))
+        self.writer.write(message(b'Z', b'I'))
+        return True
+
+    async def pump(self, server):
+        """Relay the server's replies until it is idle with nothing pending."""
+        try:
+            while True:
+                kind, payload = await read_message(server.reader)
+                self.writer.write(message(kind, payload))
+                if kind == b'Z':
+                    self.pending -= 1
+                    if payload == b'I' and self.pending == 0:
+                        self.server = None
+                        self.pool.release(server)
+                        return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            if self.server is server:
+                self.server = None
+                self.pool.discard(server)
+            self.writer.close()
+
+    def forward_cancel(self, key):
+        client = Client.by_key.get(key)
+        if client is None or client.server is None:
+            return
+        server = client.server
+        log.info('cancelling query on server pid %d', server.pid)
+        asyncio.create_task(send_cancel(self.pool.args, server.pid, server.key))
+
+
+async def send_cancel(args, pid, key):
+    _, writer = await asyncio.open_connection(args.server_host, args.server_port)
+    writer.write(struct.pack('!IIII', 16, CANCEL_REQUEST, pid, key))
+    await writer.drain()
+    writer.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Transaction-pooling Postgres proxy for local tests')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6432)
+    parser.add_argument('--server-host', default=os.environ.get('DB_PRIMARY_HOST', 'localhost'))
+    parser.add_argument('--server-port', type=int, default=int(os.environ.get('DB_PORT', '5432')))
+    parser.add_argument('--user', default=os.environ.get('DB_USERNAME', 'postgres'))
+    parser.add_argument('--password', default=os.environ.get('DB_PASSWORD', 'password'))
+    parser.add_argument('--database', default=os.environ.get('DB_NAME', 'postgres'))
+    parser.add_argument('--pool-size', type=int, default=3)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(message)s')
+    pool = Pool(args)
+
+    async def accept(reader, writer):
+        try:
+            await Client(pool, reader, writer).serve()
+        except Exception as error:
+            log.warning('client failed: %s', error)
+            writer.close()
+
+    server = await asyncio.start_server(accept, args.host, args.port)
+    log.info('listening on %s:%d, pooling %d connections to %s:%d',
+             args.host, args.port, args.pool_size, args.server_host, args.server_port)
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())